@@ -0,0 +1,52 @@
+'''
+    Splits one acquisition stream between the file writer and a live-view consumer
+    The writer receives every chunk in order; the live view receives chunks only while it keeps up
+    A slow or stalled viewer therefore costs dropped frames on screen, never samples on disk
+
+'''
+
+import queue
+
+# -- Default number of chunks the live view may fall behind before chunks are dropped for it
+monitor_depth = 2048
+
+# -- Forwards each acquired chunk to the writer and, without blocking, to the live-view queue
+class ChunkTee:
+    def __init__(self, writer, monitor = None):
+
+        # -- Called with every chunk, in the acquisition thread (blocking)
+        self.writer = writer
+
+        # -- queue.Queue or multiprocessing.Queue read by the live view (bounded so it can never block the writer)
+        self.monitor = monitor if monitor != None else queue.Queue(maxsize=monitor_depth)
+
+        # -- Chunks skipped by the live view because its queue was full
+        self.dropped_chunks = 0
+
+    # -- Called by the acquisition loop for every chunk
+    def put(self, chunk):
+
+        self.writer(chunk)
+        self.forward(chunk)
+
+    # -- Live-view half of put(), for chunks already written elsewhere (e.g. in blocks by a writer thread)
+    def forward(self, chunk):
+
+        try:
+            self.monitor.put_nowait(chunk)
+        except queue.Full:
+            self.dropped_chunks += 1
+
+    # -- Called by the live view: every chunk queued since the last call
+    def poll(self):
+        return poll_monitor(self.monitor)
+
+# -- Non-blocking drain of a monitor queue (also usable from another process holding only the queue)
+def poll_monitor(monitor):
+
+    chunks = []
+    while True:
+        try:
+            chunks.append(monitor.get_nowait())
+        except queue.Empty:
+            return chunks
@@ -1,11 +1,13 @@
 '''
     Windows program capable of simultaneous data acquisition and post-scan data visualization from two DAQ devices and the serial port (USB-1608fs-Plus)
     Optional sampling rates (excluding the serial port, 100Hz), recording durations, and file save options (single/multiple spreadsheets)
-    Real-time plotting feature from all data inputs at any desired time base (cannot run simultaneously with scan)  
+    Real-time plotting feature from all data inputs at any desired time base, in a separate plot process so the control window stays responsive
+    Optional live monitor of the piezosensor and electrode signals while a scan is recording (fed from the recording stream)
+    pandas, matplotlib and the acquisition/plot scripts are loaded on first use (or in the background once the window is shown), so the window opens at once
     Prompts GUI window for user-entries and selections (recording duration, sampling rate, open spreadsheet, plot data, real-time plot)
     Recommended to run program GUI window concurrently with command prompt, Git Bash, or Windows PowerShell terminal to display the log
     Program prompts GUI window for user-entries (recording duration, sampling rate, open spreadsheet, plot data, real-time plot).
-    Program log not implemented in GUI window.
+    Scans run on a background thread; the log on the right shows scans captured per device, buffer headroom and merge progress, and a scan can be cancelled
 
     Hardware Setup at the Time of Program Development:
      - 6 custom piezoelectric sensors connected to 6 analog input channels of a USB-1608fs-Plus device
@@ -35,23 +37,43 @@
         live_scan.py
         live_plot.py
         live_plot_flexode.py
+        plot_process.py
+        acquisition_tee.py
+        lazy_import.py
+        scan_progress.py
 
 '''
 
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
+import time
+start_time = time.perf_counter()
 from tkinter import *
 from datetime import datetime
-from matplotlib.widgets import CheckButtons
-from live_scan import read_and_save
-import live_plot as piezos
-import live_plot_flexode as flexode
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Qt5Agg')
-import pandas as pd
+from multiprocessing import Queue
+from plot_process import LivePlotProcess, monitor_collector
+from acquisition_tee import monitor_depth
+from lazy_import import LazyModule, warm_up, import_report
+from scan_progress import scan_channel, poll
+from threading import Thread
 import os
 
+# -- matplotlib backend, selected before pyplot (or anything importing it) is loaded
+def select_backend():
+    import matplotlib
+    matplotlib.use('Qt5Agg')
+
+# -- Heavy modules, loaded on first use
+plt = LazyModule('matplotlib.pyplot', before=select_backend)
+widgets = LazyModule('matplotlib.widgets', before=select_backend)
+pd = LazyModule('pandas')
+live_scan = LazyModule('live_scan')
+piezos = LazyModule('live_plot', before=select_backend)
+flexode = LazyModule('live_plot_flexode', before=select_backend)
+
+# -- Load them in the background once the window is shown (False: only on first use)
+warm_up_on_start = True
+
 if __name__ == "__main__":
 
     print('\n\n')
@@ -81,9 +103,9 @@ if __name__ == "__main__":
     frame_open = Frame(window)                      # 5 row / 0 col
     frame_plot = Frame(window)                      # 5 row / 1 col
 
-    # -- If program log is included
-    # frame_log_header = Frame(window)               # 0 row / 2 col
-    # frame_log = Frame(window)                      # 6 row / 3 col
+    # -- Program log (scan progress)
+    frame_log_header = Frame(window)                # 0 row / 2 col
+    frame_log = Frame(window)                       # 1 row / 2 col
 
     # -- User-entry fields for simultaneous data acquisition scan
     frame_scan_header.grid(row=0, column=0, pady=10)
@@ -123,6 +145,10 @@ if __name__ == "__main__":
     Radiobutton(frame_scan, text='Save Data to One File',variable=file_save_entry, value=1).grid(column=0, row=0, sticky='W')
     Radiobutton(frame_scan, text='Save Data to Separate Files',variable=file_save_entry, value=2).grid(column=0, row=1, sticky='W')
 
+    # -- Live monitor during the scan
+    monitor_entry = IntVar(value=0)
+    Checkbutton(frame_scan, text='Monitor Signals During Scan', variable=monitor_entry).grid(column=0, row=2, sticky='W')
+
     # -- User-entry fields for real-time plotting
     frame_live_header.grid(row=2, column=0, pady=(10,0))
     rt_plot_lbl = Label(frame_live_header, text="Real Time Plot:", font=16)      
@@ -158,21 +184,97 @@ if __name__ == "__main__":
         global fn
         fn = datetime.now().strftime('%Y-%m-%d %H;%M;%S') + ' -- ' + full_name_unparsed.get() + ' (' + sex_entry.get() + ') -- ' + rate_unparsed.get() + 'Hz for ' + duration.get() + 's'
         
-        # -- Update scan status (scan in progress)
+        # -- Block a second scan while one is running
         global done_scan
+        if done_scan == -1:
+            return
+
+        # -- Update scan status (scan in progress)
         done_scan = -1
 
-        # -- If entries are valid, begin scan
-        read_and_save(int(rate_unparsed.get()), int(duration.get()), int(file_save_entry.get()), fn)#, frame_log)
-        
-        # -- If program log is included
-        # read_and_save(int(rate_unparsed.get()), int(duration.get()), int(file_save_entry.get()), fn, frame_log)
+        # -- Optional live monitor fed from the recording stream (drops frames under load, never blocks the recording)
+        monitors = None
+        scan_view = None
+
+        if monitor_entry.get() == 1:
+            monitors = {'six': Queue(maxsize=monitor_depth), 'two': Queue(maxsize=monitor_depth)}
+            scan_view = LivePlotProcess(scan_monitor_labels, scan_monitor_y_ranges, 5 * int(rate_unparsed.get()), 100, 3, 3, 'Scan Monitor', rates=[int(rate_unparsed.get())] * 9)
+            scan_view.feed_from(monitor_collector([(monitors['two'], 0, 2), (monitors['six'], 2, 7)]))
+
+        # -- Progress/metrics channel and cancel event shared with the recording processes
+        progress, cancel = scan_channel()
+        scan_run.update(progress=progress, cancel=cancel, view=scan_view, rate=int(rate_unparsed.get()), duration=int(duration.get()))
+
+        # -- If entries are valid, begin scan on a background thread (the window keeps responding)
+        args = (int(rate_unparsed.get()), int(duration.get()), int(file_save_entry.get()), fn, monitors)
+        Thread(target=run_scan, args=(args, progress, cancel), daemon=True).start()
+
+        show_log('Scanning ' + fn, {source: '' for source in progress_sources}, '')
+        scan_btn.config(state=DISABLED)
+        cancel_btn.config(state=NORMAL)
+        window.after(200, watch_scan)
 
-        # -- Update scan status (scan complete)
-        done_scan = 1
-        
         return
 
+    # -- Scan thread: read_and_save, with any failure reported through the progress channel
+    def run_scan(args, progress, cancel):
+
+        try:
+            live_scan.read_and_save(*args, progress=progress, cancel=cancel)
+        except Exception as error:
+            print('  ERROR: ' + str(error) + '\n')
+            progress.put(('done', 'failed', str(error)))
+        except SystemExit:
+            progress.put(('done', 'failed', 'scan stopped'))
+
+    # -- Running scan: progress channel, cancel event and scan monitor window
+    scan_run = {}
+
+    # -- Progress lines per source in the log
+    progress_sources = {'six': 'Chest Strap/Electrode', 'two': 'Carotid/Femoral', 'flex': 'Flex Sensor'}
+
+    # -- Apply the progress messages posted since the last poll (polled by the tkinter event loop)
+    def watch_scan():
+
+        global done_scan
+
+        for message in poll(scan_run['progress']):
+
+            if message[0] == 'samples':
+                _, source, scans, headroom, backlog = message
+                expected = (scan_run['rate'] if source != 'flex' else 100) * scan_run['duration']
+                text = '{:,}'.format(scans) + ' of ' + '{:,}'.format(expected) + ' scans'
+                if headroom != None:
+                    text += ',  buffer ' + '{:.0%}'.format(headroom) + ' free'
+                if backlog != None:
+                    text += ',  writer backlog ' + str(backlog)
+                source_log[source].config(text=progress_sources[source] + ':  ' + text)
+
+            elif message[0] == 'merge':
+                _, step, steps = message
+                merge_log.config(text='Saving:  step ' + str(step) + ' of ' + str(steps))
+
+            elif message[0] == 'done':
+                _, state, detail = message
+                if scan_run['view'] != None:
+                    scan_run['view'].close()
+
+                status_log.config(text={'saved': 'Save completed.', 'cancelled': 'Scan cancelled.', 'failed': 'ERROR: ' + detail}[state])
+                scan_btn.config(state=NORMAL)
+                cancel_btn.config(state=DISABLED)
+
+                # -- Update scan status (complete, or no usable scan)
+                done_scan = 1 if state == 'saved' else 0
+                return
+
+        window.after(200, watch_scan)
+
+    # -- Cancel the running scan (the recording processes stop and release their devices)
+    def cancel_scan():
+        if done_scan == -1:
+            scan_run['cancel'].set()
+            status_log.config(text='Cancelling . . .')
+
     # -- Check validity of user-entries before plotting real-time data
     def pre_live_check():
 
@@ -185,11 +287,31 @@ if __name__ == "__main__":
         else:
             return True
 
+    # -- Channel layout of the scan monitor window (carotid/femoral board first, then the chest strap board)
+    scan_monitor_labels = ['Carotid Piezo', 'Femoral Piezo', 'Piezo CH0', 'Piezo CH1', 'Piezo CH2', 'Piezo CH3', 'Piezo CH4', 'Piezo CH5', 'Electrode']
+    scan_monitor_y_ranges = [[-3,3], [-3,3], [0,10], [0,10], [0,10], [0,10], [0,10], [0,10], [-2,6]]
+
+    # -- Running live plot sessions: name -> (stop function, session)
+    live_sessions = {}
+
+    # -- Disconnect live plots whose window was closed (polled by the tkinter event loop)
+    def watch_live_sessions():
+
+        for name in list(live_sessions):
+            stop, session = live_sessions[name]
+            if session[0].is_closed():
+                stop(session)
+                del live_sessions[name]
+
+        if live_sessions:
+            window.after(200, watch_live_sessions)
+
     # -- Real-time plot for carotid artery, femoral artery, acoustic, chest strap piezosensors
     def real_time_plot_piezos():
         
-        if pre_live_check():
-            piezos.plot_piezos(int(timebase_unparsed.get()))
+        if pre_live_check() and 'piezos' not in live_sessions:
+            live_sessions['piezos'] = (piezos.stop_piezos, piezos.launch_piezos(int(timebase_unparsed.get())))
+            window.after(200, watch_live_sessions)
             
             # -- If program log is included
             # piezos.plot_piezos(int(timebase_unparsed.get()), frame_log)
@@ -198,13 +320,22 @@ if __name__ == "__main__":
     # -- Real-time plot for ECG electrodes and flex sensor
     def real_time_plot_flexode():
 
-        if pre_live_check():
-            flexode.plot_flexode(int(timebase_unparsed.get()))
+        if pre_live_check() and 'flexode' not in live_sessions:
+            live_sessions['flexode'] = (flexode.stop_flexode, flexode.launch_flexode(int(timebase_unparsed.get())))
+            window.after(200, watch_live_sessions)
 
             # -- If program log is included
             # flexode.plot_flexode(int(timebase_unparsed.get()), frame_log)
         return
     
+    # -- Rolling spectrum/spectrogram of the acoustic and chest strap piezosensors (50/60Hz interference check before a scan)
+    def real_time_plot_spectra():
+
+        # -- Shares board 0 and 1 with the piezosensor live plot
+        if pre_live_check() and 'piezos' not in live_sessions:
+            piezos.plot_spectra(int(timebase_unparsed.get()))
+        return
+
     # -- Open spreadsheet containing all data
     def open_central():
 
@@ -320,7 +451,7 @@ if __name__ == "__main__":
 
             # -- Each channel button area    
             button_space = plt.axes([0.92, 0.4, 0.15, 0.15])
-            button = CheckButtons(button_space, label, label_on)
+            button = widgets.CheckButtons(button_space, label, label_on)
 
             # -- Show/hide graph of a channel upon button click
             def set_visible(labels):
@@ -373,7 +504,7 @@ if __name__ == "__main__":
             label_on = [True, True]
             label = ['Carotid','Femoral']     
             button_space = plt.axes([0.92, 0.4, 0.15, 0.15])
-            button = CheckButtons(button_space, label, label_on)
+            button = widgets.CheckButtons(button_space, label, label_on)
 
             def set_visible(labels):
                 i = label.index(labels)
@@ -484,10 +615,39 @@ if __name__ == "__main__":
     test_ef_btn = Button(frame_live, text="Test Electrode/Flex Sensor", command=real_time_plot_flexode, height=3, width=24 )
     test_ef_btn.grid(column=5, row=1, sticky='W')
 
+    # -- Spectrum check button for the acoustic and chest strap piezosensors
+    test_spectra_btn = Button(frame_live, text="Spectrum Check", command=real_time_plot_spectra, height=3, width=24)
+    test_spectra_btn.grid(column=5, row=2, sticky='W', pady=(15,0))
+
     # -- Simultaneous data acquisition scan button
     scan_btn = Button(frame_scan, text="Start Scan", command=pre_scan_check, height=4, width=12)
     scan_btn.grid(column=0, row=3, pady=20)
 
+    cancel_btn = Button(frame_scan, text="Cancel Scan", command=cancel_scan, height=2, width=12, state=DISABLED)
+    cancel_btn.grid(column=0, row=4)
+
+    # -- Program log on the right side of the window
+    frame_log_header.grid(row=0, column=2)
+    log_lbl = Label(frame_log_header, text="Log: ", font=16)
+    log_lbl.grid(column=0, row=0, padx=30, pady=10)
+
+    frame_log.grid(row=1, column=2, sticky='N', pady=(20,0))
+    status_log = Label(frame_log, text='', anchor='w', width=60)
+    status_log.grid(column=0, row=0, sticky='W')
+    source_log = {}
+    for row, source in enumerate(progress_sources):
+        source_log[source] = Label(frame_log, text='', anchor='w', width=60)
+        source_log[source].grid(column=0, row=row + 1, sticky='W')
+    merge_log = Label(frame_log, text='', anchor='w', width=60)
+    merge_log.grid(column=0, row=len(progress_sources) + 1, sticky='W')
+
+    # -- Reset the log for a new scan
+    def show_log(status, sources, merge):
+        status_log.config(text=status)
+        for source, text in sources.items():
+            source_log[source].config(text=progress_sources[source] + ':  ' + text)
+        merge_log.config(text=merge)
+
     # -- Post-scan open spreadsheet buttons
     frame_post_scan_header.grid(row=4, column=0, pady=20)
     header_lbl = Label(frame_post_scan_header, text="Post-Scan Options:", font=16)      
@@ -524,15 +684,6 @@ if __name__ == "__main__":
     plot_flex_btn.grid(column=0, row=3, pady=20)
 
     '''
-    If program log on the right side of the window is necessary:
-
-    frame_log_header.grid(row=0, column=2)
-    log_lbl = Label(frame_log_header, text="Log: ", font=16)          
-    log_lbl.grid(column=0, row=0, padx=30,pady=10)
-
-    frame_log.grid(row=0, column=3,pady=(20,0))
-
-
     If GUI plot on the right side of the window is necessary:
 
     fig = plt.Figure(figsize=(6,2), dpi=100)
@@ -544,4 +695,14 @@ if __name__ == "__main__":
 
     '''
 
+    # -- Start-up time, then the background warm-up of the heavy modules
+    def window_ready():
+        print('  Window ready in', '{:.2f}'.format(time.perf_counter() - start_time), 'seconds.\n')
+        if warm_up_on_start:
+            warm_up([pd, plt, widgets, live_scan, piezos, flexode])
+        else:
+            print(import_report())
+
+    window.after_idle(window_ready)
+
     window.mainloop()
\ No newline at end of file
@@ -0,0 +1,158 @@
+'''
+    Streaming beat detector for ECG and arterial pulse (piezo) channels
+    Simplified Pan-Tompkins: one-pole low-pass and DC-blocking high-pass (band-pass), derivative, squaring (ECG) or positive slope (pulse), moving-window integration,
+    then an adaptive threshold between running signal and noise peak levels with a refractory period
+    A beat is placed at the largest (baseline-removed) sample while the integrated feature is above the threshold, i.e. the R wave or systolic peak
+    Every stage keeps constant-size state, so each sample costs O(1) work and chunks can be any size; state carries across chunks
+
+'''
+
+import collections
+import numpy as np
+
+class BeatDetector:
+    def __init__(self, rate, kind = 'ecg', window_seconds = 0.15, refractory_seconds = 0.25, learning_seconds = 2):
+
+        self.rate = rate
+        self.kind = kind
+
+        # -- One-pole DC blocker with a ~0.5Hz corner, removing baseline wander
+        self.hp_pole = 1 - 2 * np.pi * 0.5 / rate
+
+        # -- One-pole low-pass keeping the QRS (20Hz) or the pulse upstroke (10Hz), so sample-to-sample noise does not dominate the slope at high rates
+        self.lp_alpha = 1 - np.exp(-2 * np.pi * (20 if kind == 'ecg' else 10) / rate)
+        self.smoothed = None
+        self.previous_input = 0.0
+        self.previous_output = 0.0
+
+        # -- Moving-window integration: ring of the last `window` feature values and their running sum
+        self.window = max(1, int(window_seconds * rate))
+        self.features = np.zeros(self.window)
+        self.feature_sum = 0.0
+
+        # -- Adaptive threshold state
+        self.refractory = int(refractory_seconds * rate)
+        self.learning = int(learning_seconds * rate)
+        self.learning_max = 0.0
+        self.signal_level = 0.0
+        self.noise_level = 0.0
+        self.noise_alpha = 1 / rate    # noise level follows the sub-threshold feature with a ~1s time constant
+        self.above = False
+        self.peak_value = 0.0
+
+        # -- Largest high-passed sample of the current above-threshold span: its index, time and raw value
+        self.peak_height = 0.0
+        self.peak_index = 0
+        self.peak_time = 0.0
+        self.peak_raw = 0.0
+
+        # -- Beat-to-beat intervals (samples) of the last 8 beats for the rate estimate
+        self.last_beat = None
+        self.intervals = collections.deque(maxlen=8)
+
+        # -- Sample at which the signal level was last lowered to search for a missed beat
+        self.lowered_at = -1
+
+        # -- Recent beats as (time, value) for overlays, and the total number of samples consumed
+        self.beats = collections.deque(maxlen=64)
+        self.count = 0
+
+    @property
+    def threshold(self):
+        return self.noise_level + 0.25 * (self.signal_level - self.noise_level)
+
+    # -- Beats per minute over the recent intervals (0 until two beats have been seen)
+    @property
+    def bpm(self):
+        if not self.intervals:
+            return 0.0
+        return 60 * self.rate * len(self.intervals) / sum(self.intervals)
+
+    # -- Consume new samples (times default to the absolute sample index), returns the beats found as (time, value) pairs
+    def extend(self, values, times = None):
+
+        found = []
+        hp_pole = self.hp_pole
+        window = self.window
+
+        for i in range(len(values)):
+            x = float(values[i])
+
+            # -- Low-pass (starting from the first sample to avoid a step)
+            if self.smoothed == None:
+                self.smoothed = x
+                self.previous_input = x
+            self.smoothed += self.lp_alpha * (x - self.smoothed)
+            s = self.smoothed
+            n = self.count
+            slot = n % window
+
+            # -- High-pass
+            y = s - self.previous_input + hp_pole * self.previous_output
+            derivative = y - self.previous_output
+            self.previous_input = s
+            self.previous_output = y
+
+            # -- Beat feature: squared slope for the ECG QRS, positive slope for the pulse upstroke
+            if self.kind == 'ecg':
+                feature = derivative * derivative
+            else:
+                feature = derivative if derivative > 0 else 0.0
+
+            # -- Moving-window integration
+            self.feature_sum += feature - self.features[slot]
+            self.features[slot] = feature
+            integrated = self.feature_sum / window
+
+            self.count = n + 1
+
+            # -- Learning period: initialise the signal and noise levels from the first seconds
+            if n < self.learning:
+                self.learning_max = max(self.learning_max, integrated)
+                self.noise_level += (integrated - self.noise_level) / (n + 1)
+                if n == self.learning - 1:
+                    self.signal_level = 0.5 * self.learning_max
+                continue
+
+            threshold = self.threshold
+
+            if integrated > threshold:
+                if not self.above:
+                    self.peak_value = integrated
+                    self.peak_height = y
+                    self.peak_index = n
+                    self.peak_time = n if times is None else times[i]
+                    self.peak_raw = x
+                else:
+                    self.peak_value = max(self.peak_value, integrated)
+                    if y > self.peak_height:
+                        self.peak_height = y
+                        self.peak_index = n
+                        self.peak_time = n if times is None else times[i]
+                        self.peak_raw = x
+                self.above = True
+                continue
+
+            self.noise_level += self.noise_alpha * (integrated - self.noise_level)
+
+            if self.above:
+                self.above = False
+
+                if self.last_beat == None or self.peak_index - self.last_beat >= self.refractory:
+                    self.signal_level += 0.125 * (self.peak_value - self.signal_level)
+                    # -- An interval found after lowering the level may span a missed beat or a pause, so it is left out of the rate
+                    if self.last_beat != None and self.lowered_at < self.last_beat and self.peak_index - self.last_beat <= 2 * self.rate:
+                        self.intervals.append(self.peak_index - self.last_beat)
+                    self.last_beat = self.peak_index
+
+                    beat = (self.peak_time, self.peak_raw)
+                    self.beats.append(beat)
+                    found.append(beat)
+
+            # -- No beat for 1.66 average intervals: lower the signal level (again every 1.66 intervals) so a missed (smaller) beat can be found
+            #    last_beat stays at the last detected beat, for the refractory check and the next interval
+            elif self.intervals and self.last_beat != None and n - max(self.last_beat, self.lowered_at) > 1.66 * sum(self.intervals) / len(self.intervals):
+                self.signal_level = max(self.noise_level, 0.5 * self.signal_level)
+                self.lowered_at = n
+
+        return found
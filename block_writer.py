@@ -0,0 +1,124 @@
+'''
+    Producer/consumer split between an acquisition loop and everything downstream of it
+    The polling loop only copies the scans it read into a preallocated block; full blocks (and the partial block whenever the loop
+    goes idle) are handed to a writer thread, which formats and writes them to the file in large buffered writes and runs
+    the other consumers (quality monitor, triggered capture, live monitor) on the same block
+    A slow disk or antivirus scan delays the writer thread, not the loop emptying the UL buffer; the number of blocks waiting
+    (queue depth) is exposed as a metric
+    A consumer error (full disk, closed file) stops the writer thread; the error is kept and raised in the acquisition loop by
+    the next add_block, flush or close, so the scan stops instead of queueing blocks nobody writes
+
+'''
+
+from threading import Thread
+import queue
+import numpy as np
+
+# -- Blocks preallocated per writer; more are allocated (never waited for) if the writer falls further behind
+pool_blocks = 8
+
+# -- Output file buffer size in bytes
+file_buffering = 1 << 20
+
+# -- CSV rows of a block as the recording loops wrote them: time, then every value, each followed by a comma
+def format_rows(times, values):
+    return ''.join(str(t) + ',' + ','.join(map(str, row)) + ',\n' for t, row in zip(times.tolist(), values.tolist()))
+
+class BlockWriter:
+    def __init__(self, num_values, block_scans, consumer):
+
+        self.num_values = num_values
+        self.block_scans = max(1, block_scans)
+
+        # -- consumer(times, values) runs on the writer thread for every block; the arrays are reused afterwards, so it copies what it keeps
+        self.consumer = consumer
+
+        # -- Free and filled blocks: (times, values) array pairs
+        self.free = queue.Queue()
+        for i in range(pool_blocks):
+            self.free.put(self.new_block())
+        self.filled = queue.Queue()
+
+        self.block = self.free.get()
+        self.count = 0
+
+        # -- Metrics: deepest writer backlog seen, and blocks allocated beyond the pool
+        self.max_depth = 0
+        self.extra_blocks = 0
+
+        # -- Exception raised by the consumer, None while the writer thread is running
+        self.error = None
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def new_block(self):
+        return (np.zeros(self.block_scans), np.zeros((self.block_scans, self.num_values)))
+
+    # -- Acquisition loop: copy scans (times and a (scans, values) array) into the current block, handing over every block filled
+    def add_block(self, times, values):
+
+        self.check()
+        done = 0
+        while done < len(times):
+            block_times, block = self.block
+            n = min(len(times) - done, self.block_scans - self.count)
+
+            block_times[self.count:self.count + n] = times[done:done + n]
+            block[self.count:self.count + n] = values[done:done + n]
+            self.count += n
+            done += n
+
+            if self.count == self.block_scans:
+                self.flush()
+
+    # -- Acquisition loop: hand the current (possibly partial) block to the writer thread
+    def flush(self):
+
+        self.check()
+        if self.count == 0:
+            return
+
+        self.filled.put((self.block, self.count))
+        self.max_depth = max(self.max_depth, self.filled.qsize())
+
+        try:
+            self.block = self.free.get_nowait()
+        except queue.Empty:
+            self.block = self.new_block()
+            self.extra_blocks += 1
+        self.count = 0
+
+    # -- Blocks waiting for the writer thread
+    @property
+    def depth(self):
+        return self.filled.qsize()
+
+    def run(self):
+
+        while True:
+            item = self.filled.get()
+            if item == None:
+                return
+
+            (times, block), count = item
+            try:
+                self.consumer(times[:count], block[:count])
+            except Exception as error:
+                print('  ERROR: WRITER FAILED (' + str(error) + ')\n')
+                self.error = error
+                return
+            self.free.put((times, block))
+
+    # -- Raise the consumer's error, if it failed
+    def check(self):
+        if self.error != None:
+            raise self.error
+
+    # -- Write everything still queued and stop the writer thread
+    def close(self):
+
+        self.flush()
+        self.filled.put(None)
+        self.thread.join()
+        self.check()
@@ -0,0 +1,101 @@
+'''
+    Declarative board/channel map of a recording
+    One entry per DAQ board: its source name, board number, first channel and channel names; each board is recorded by its own
+    process running the same acquisition loop (live_scan.daq_read), so adding a board means adding an entry, not another loop
+    The flex sensor is read from the serial port and is not part of the map
+
+    Entry keys:
+        source       name of the board's process, progress reports, monitors and start report ('six', 'two', ...)
+        board_num    InstaCal board number
+        low_chan     first analog input channel; the board scans one channel per name, from low_chan up
+        channels     channel names; columns are '<name> (V)'
+        file         device file of a recording: '<name> -- <file> .csv'
+        label        name used in console messages (default: the source)
+        clock        true for the board that times the merged file and the event markers (default: the first board)
+        split        optional {channel name: file}: channels saved to their own file in the multiple-file output
+        executor     'process' (default), 'thread' or 'inline': where the board's loop runs (see source_runner)
+        simulated    true to record a simulated board instead of the hardware (see simulated_daq)
+
+    The merged file has the time column, then every board's columns in map order, then the flex sensor
+    A map can be loaded from a JSON file holding a list of entries
+
+'''
+
+import json
+
+default_map = [
+    {'source': 'two', 'board_num': 0, 'low_chan': 0, 'file': 'Carotid and Femoral', 'label': 'Carotid/femoral',
+     'channels': ['Carotid Piezo', 'Femoral Piezo']},
+    {'source': 'six', 'board_num': 1, 'low_chan': 0, 'file': 'Chest Strap Piezos', 'label': 'Chest strap',
+     'channels': ['Piezo Channel ' + str(chan_num) for chan_num in range(6)] + ['Electrode'],
+     'clock': True, 'split': {'Electrode': 'Electrodes'}},
+]
+
+# -- Board map from a JSON file (default_map if no file is given); raises ValueError if the map is not usable
+def load_map(file_name = None):
+
+    if file_name == None:
+        return default_map
+
+    with open(file_name) as f:
+        boards = json.load(f)
+
+    check_map(boards)
+    return boards
+
+def check_map(boards):
+
+    if not boards:
+        raise ValueError('The channel map has no boards.')
+
+    for board in boards:
+        missing = [key for key in ('source', 'board_num', 'low_chan', 'channels', 'file') if key not in board]
+        if missing:
+            raise ValueError('Channel map entry ' + str(board.get('source')) + ' is missing: ' + ', '.join(missing))
+        if not board['channels']:
+            raise ValueError('Channel map entry ' + board['source'] + ' has no channels.')
+
+    for key in ('source', 'board_num', 'file'):
+        values = [board[key] for board in boards]
+        if len(set(values)) != len(values):
+            raise ValueError('Channel map entries must have different ' + key + ' values.')
+
+    if 'flex' in [board['source'] for board in boards]:
+        raise ValueError('"flex" is the serial flex sensor and cannot name a board.')
+
+    columns = [column for board in boards for column in column_names(board)]
+    if len(set(columns)) != len(columns):
+        raise ValueError('Channel names must be different across the boards.')
+
+# -- Board with the given source name
+def find_board(boards, source):
+    return [board for board in boards if board['source'] == source][0]
+
+# -- Board timing the merged file and the event markers
+def clock_board(boards):
+
+    for board in boards:
+        if board.get('clock'):
+            return board
+    return boards[0]
+
+def last_channel(board):
+    return board['low_chan'] + len(board['channels']) - 1
+
+def board_label(board):
+    return board.get('label', board['source'])
+
+# -- Voltage columns of a board's device file
+def column_names(board):
+    return [name + ' (V)' for name in board['channels']]
+
+# -- Header row of a board's device file (time, every channel), ending with a comma as the data rows do
+def file_header(board):
+    return 'Time (s)' + ',' + ''.join(column + ',' for column in column_names(board)) + u'\n'
+
+def device_file_name(file_name, board):
+    return file_name + ' -- ' + board['file'] + ' .csv'
+
+# -- Source names of a recording: every board, then the flex sensor
+def sources(boards):
+    return [board['source'] for board in boards] + ['flex']
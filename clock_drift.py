@@ -0,0 +1,167 @@
+'''
+    Clock drift between the sources of a recording (the DAQ boards and the flex sensor's Arduino each run on their own oscillator)
+    Every source logs (sample index, host perf_counter time) pairs while it records, through the same AnchorClock the event
+    markers use, and saves them as a sidecar next to its device file
+    The merge fits one line per source by robust regression (iteratively reweighted least squares with Tukey bisquare weights,
+    so USB and serial latency spikes do not pull the fit) and resamples every source onto the clock board's scans: a board's
+    channels by linear interpolation, the flex sensor by placing each sample on its nearest row
+    perf_counter is system-wide, so the pairs of different processes compare directly; the fitted offsets also remove the
+    start skew left by the start gate
+    A source's drift (its rate against its nominal rate, in host time) is only applied when it is measured: fitted from at
+    least min_drift_anchors pairs and either significant (drift_significance standard errors from zero) or precise (standard
+    error within max_drift_uncertainty ppm). A few seconds of anchors with millisecond latency jitter give drifts of hundreds
+    of ppm either way; a source whose drift is small as well as uncertain runs at its nominal rate, and only its offset is fitted
+
+'''
+
+import csv, os
+import numpy as np
+
+# -- Fewest pairs a source needs for its line to be fitted (about one per second of recording)
+min_anchors = 3
+
+# -- A fitted drift is applied if it has min_drift_anchors pairs and is at least drift_significance standard errors from zero,
+#    or its standard error is at most max_drift_uncertainty ppm
+min_drift_anchors = 10
+drift_significance = 3
+max_drift_uncertainty = 5
+
+# -- Tukey bisquare tuning constant and number of reweighting passes
+bisquare_c = 4.685
+fit_iterations = 10
+
+# -- Recording loop side: collects the pairs published by an event_markers.AnchorClock (which corrects the count for its lag)
+class ClockLog:
+    def __init__(self):
+        self.anchors = []
+
+    # -- count samples acquired at host time t: sample count - 1 was taken at t (nothing to log before the first one)
+    def anchor(self, count, t):
+        if count >= 1:
+            self.anchors.append((count - 1, t))
+
+    def save(self, file_name):
+
+        with open(clock_file_name(file_name), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Sample Index', 'Host Time (s)'])
+            for index, t in self.anchors:
+                writer.writerow(['{:.3f}'.format(index), '{:.6f}'.format(t)])
+
+# -- Sidecar file name of a device file: '<device file> -- Clock .csv'
+def clock_file_name(file_name):
+    return file_name.replace(' .csv', '') + ' -- Clock .csv'
+
+# -- (sample indices, host times) of a device file, or None if it has no clock log
+def load_clock(file_name):
+
+    if not os.path.exists(clock_file_name(file_name)):
+        return None
+
+    pairs = np.loadtxt(clock_file_name(file_name), delimiter=',', skiprows=1, ndmin=2)
+    return pairs[:, 0], pairs[:, 1]
+
+# -- Robust line t = offset + period * index; returns (offset, period, RMS residual of the points kept, standard error of the period)
+def robust_fit(index, t):
+
+    # -- Centred index keeps the fit well conditioned over hour-long recordings
+    center = index.mean()
+    A = np.column_stack([np.ones(len(index)), index - center])
+    weights = np.ones(len(index))
+
+    for i in range(fit_iterations):
+        root = np.sqrt(weights)
+        beta = np.linalg.lstsq(A * root[:, None], t * root, rcond=None)[0]
+        residuals = t - A @ beta
+
+        scale = 1.4826 * np.median(np.abs(residuals - np.median(residuals)))
+        if scale == 0:
+            break
+        u = residuals / (bisquare_c * scale)
+        reweighted = np.where(np.abs(u) < 1, (1 - u ** 2) ** 2, 0.0)
+
+        # -- Keep enough points for a line (a few anchors with one clean pair would fit exactly)
+        if np.count_nonzero(reweighted) < min_anchors:
+            break
+        weights = reweighted
+
+    kept = weights > 0
+    rms = np.sqrt(np.mean(residuals[kept] ** 2)) if kept.any() else float('nan')
+
+    # -- Weighted least squares standard error of the slope
+    dof = weights.sum() - 2
+    spread = np.sum(weights * (A[:, 1] - np.average(A[:, 1], weights=weights)) ** 2) if kept.any() else 0
+    period_error = np.sqrt(np.sum(weights * residuals ** 2) / dof / spread) if dof > 0 and spread > 0 else float('inf')
+
+    return beta[0] - beta[1] * center, beta[1], rms, period_error
+
+# -- (offset, period, rms, drift measured) of the line t = offset + period * index through a source's pairs
+#    rate: nominal sampling rate, used when the drift is not measured
+def fit_clock(index, t, rate):
+
+    offset, period, rms, period_error = robust_fit(index, t)
+
+    # -- Drift against the nominal rate and its standard error, in ppm
+    drift = (1 / (period * rate) - 1) * 1e6
+    uncertainty = period_error / period * 1e6
+
+    if len(index) >= min_drift_anchors and (abs(drift) >= drift_significance * uncertainty or uncertainty <= max_drift_uncertainty):
+        return offset, period, rms, True
+
+    # -- Drift not measured: nominal rate, offset fitted alone
+    period = 1 / rate
+    offset = np.median(t - period * index)
+    return offset, period, np.sqrt(np.mean((t - offset - period * index) ** 2)), False
+
+# -- {source: (offset, period, rms, drift measured)} of the sources with enough pairs
+#    device_files: {source: device file}; rates: {source: nominal sampling rate}
+def fit_sources(device_files, rates):
+
+    fits = {}
+    for source, file_name in device_files.items():
+        clock = load_clock(file_name)
+        if clock == None or len(clock[0]) < min_anchors:
+            continue
+
+        fits[source] = fit_clock(*clock, rates[source])
+
+    return fits
+
+# -- Fractional sample positions in source `to` of the samples `index` of source `from` (same host instant)
+def source_index(fit_from, fit_to, index):
+    return (fit_from[0] + fit_from[1] * index - fit_to[0]) / fit_to[1]
+
+# -- Columns of df linearly interpolated at fractional row positions
+#    Positions within half a sample of either end take the end value; NaN further out or next to lost scans
+def resample(df, columns, positions):
+
+    import pandas as pd
+
+    rows = np.arange(len(df))
+    outside = (positions < -0.5) | (positions > len(df) - 0.5)
+
+    resampled = {}
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        resampled[column] = np.where(outside, np.nan, np.interp(positions, rows, values))
+    return pd.DataFrame(resampled)
+
+# -- Drift report of a recording: '<name> -- Clock Drift .csv'; rates: {source: nominal sampling rate}
+def save_drift_report(file_name, fits, reference, rates):
+
+    print('  Clock drift against ' + reference + ': '
+          + ', '.join(source + ' ' + ('{:+.1f}'.format(drift_ppm(fits[source], fits[reference], rates[source], rates[reference])) + ' ppm'
+                                      if fits[source][3] else 'not measured')
+                      for source in fits if source != reference) + '\n')
+
+    with open(file_name + ' -- Clock Drift .csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Source', 'Measured Rate (Hz)', 'Drift vs ' + reference + ' (ppm)', 'Start vs ' + reference + ' (ms)', 'Fit Residual (ms)',
+                         'Drift Measured'])
+        for source, fit in fits.items():
+            writer.writerow([source, '{:.6f}'.format(1 / fit[1]), '{:.3f}'.format(drift_ppm(fit, fits[reference], rates[source], rates[reference])),
+                             '{:.3f}'.format((fit[0] - fits[reference][0]) * 1000), '{:.3f}'.format(fit[2] * 1000), 'yes' if fit[3] else 'no'])
+
+# -- Rate error of a source relative to the reference, each against its nominal rate, in parts per million
+def drift_ppm(fit, reference_fit, rate, reference_rate):
+    return ((reference_fit[1] * reference_rate) / (fit[1] * rate) - 1) * 1e6
@@ -1,27 +1,101 @@
 '''
     Initial configuration for USB-1608fs-Plus DAQ devices
     Detects connected devices by the passed board number and adds the available device to the Universal Library.
+    The device inventory is enumerated once per process and cached by unique ID; the board registry configures each
+    physical board once and hands the same DaqDeviceInfo to every channel reading from it
+    The UL is loaded on first use, so modules importing the board registry also load without the driver (e.g. for simulated boards)
 
 '''
 
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
-from mcculw import ul
-from mcculw.enums import InterfaceType
+from threading import Lock, Thread
 import sys
 
+try:
+    from lazy_import import LazyModule
+except ImportError:
+    from .lazy_import import LazyModule
+
+ul = LazyModule('mcculw.ul')
+enums = LazyModule('mcculw.enums')
+device_info = LazyModule('mcculw.device_info')
+
+# -- Cached inventory {unique_id: device descriptor} in detection order, and the boards configured so far {board_num: DaqDeviceInfo}
+inventory = None
+boards = {}
+
+inventory_lock = Lock()
+board_locks = {}
+
+# -- Connected devices, enumerated on first use (refresh after plugging devices in or out)
+def device_inventory(refresh = False):
+
+    global inventory
+
+    with inventory_lock:
+        if inventory == None or refresh:
+
+            # -- Detect InstaCal configuration error
+            try:
+                ul.ignore_instacal()
+            except OSError:
+                print('  ERROR: INSTACAL OS ERROR\n')
+                sys.exit()
+
+            devices = ul.get_daq_device_inventory(enums.InterfaceType.ANY)
+            if not devices:
+                raise Exception('Error: No DAQ devices found')
+
+            inventory = {device.unique_id: device for device in devices}
+
+    return inventory
+
+# -- DaqDeviceInfo of a board, configured in the Universal Library on first use
+#    unique_id selects a specific device; otherwise the board number indexes the inventory, as config_first_detected_device does
+def get_board(board_num, unique_id = None):
+
+    with inventory_lock:
+        lock = board_locks.setdefault(board_num, Lock())
+
+    # -- Boards are configured independently, so different boards come up in parallel
+    with lock:
+        if board_num not in boards:
+            devices = device_inventory()
+            device = devices[unique_id] if unique_id != None else list(devices.values())[board_num]
+            ul.create_daq_device(board_num, device)
+
+            daq_dev_info = device_info.DaqDeviceInfo(board_num)
+            if not daq_dev_info.supports_analog_input:
+                ul.release_daq_device(board_num)
+                raise Exception('Error: The DAQ device does not support analog input')
+
+            print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+            boards[board_num] = daq_dev_info
+
+    return boards[board_num]
+
+# -- Configure several boards at once, one thread per board; returns {board_num: DaqDeviceInfo}
+def get_boards(board_nums):
+
+    device_inventory()
+    threads = [Thread(target=get_board, args=(board_num,)) for board_num in board_nums]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {board_num: get_board(board_num) for board_num in board_nums}
+
+# -- Release a board configured by get_board (once, however many channels used it)
+def release_board(board_num):
+
+    if boards.pop(board_num, None) != None:
+        ul.release_daq_device(board_num)
+
 def config_first_detected_device(board_num, dev_id_list=None):
 
-    # -- Detect InstaCal configuration error
-    try:
-        ul.ignore_instacal()
-    except OSError:
-        print('  ERROR: INSTACAL OS ERROR\n')
-        sys.exit()
-    
-    devices = ul.get_daq_device_inventory(InterfaceType.ANY)
-    if not devices:
-        raise Exception('Error: No DAQ devices found')
+    devices = list(device_inventory().values())
 
     '''
     Connection Log:
@@ -0,0 +1,137 @@
+'''
+    Event markers stamped on the scan's sample-index clock
+    mark() only records perf_counter() and a label, so a keypress, GUI button or API call is stamped within microseconds of the event
+    The recording process publishes (scan index, perf_counter) anchor pairs while it reads the UL buffer; at the end of the recording
+    each marker is converted to the scan index through a robust line fitted over all the anchors (clock_drift.fit_clock), so the
+    USB status latency of any single anchor averages out
+    Markers are saved as a sidecar CSV sorted by sample index, so analysis can bisect to an event and read only the rows around it
+
+'''
+
+from multiprocessing import Queue
+import bisect, csv, queue, time
+import numpy as np
+
+try:
+    from clock_drift import fit_clock
+except ImportError:
+    from .clock_drift import fit_clock
+
+# -- Seconds between anchor pairs published by a recording loop
+anchor_period = 1.0
+
+# -- Control-process handle shared with the recording processes
+class MarkerStream:
+    def __init__(self):
+
+        # -- (perf_counter, label, source) of every marker
+        self.marks = Queue()
+
+        # -- (scan index, perf_counter) anchor pairs from the recording loop
+        self.anchors = Queue()
+
+    # -- Stamp an event now (callable from any thread or process holding the stream)
+    def mark(self, label, source = 'api'):
+        self.marks.put((time.perf_counter(), label, source))
+
+    # -- Recording loop: scans acquired so far at perf_counter time t
+    def anchor(self, scan_index, t):
+        self.anchors.put((scan_index, t))
+
+    # -- Convert every queued marker to scan indices and write the sidecar file, returns the number of markers
+    def save(self, file_name, rate):
+
+        marks = sorted(drain(self.marks))
+        anchors = np.array(drain(self.anchors), dtype=float).reshape(-1, 2)
+        if not len(anchors):
+            return 0
+
+        # -- Scan clock in host time: t = offset + period * scan index
+        offset, period, rms, measured = fit_clock(anchors[:, 0], anchors[:, 1], rate)
+        rows = []
+
+        for t, label, source in marks:
+            index = (t - offset) / period
+            rows.append((index, index / rate, label, source))
+
+        save_markers(file_name, sorted(rows))
+        return len(rows)
+
+# -- Recording loop helper: publishes an anchor at most once per anchor_period
+#    lag: scans by which the reported count trails the acquisition on average; a UL count moves in whole packets, so it is
+#    half a packet behind (packet_size / num_chans / 2 scans), which differs between boards scanning different channel counts
+class AnchorClock:
+    def __init__(self, stream, num_chans, lag = 0):
+
+        self.stream = stream
+        self.num_chans = num_chans
+        self.lag = lag
+        self.next_t = 0.0
+
+    # -- curr_count: UL sample count just returned by get_status
+    def update(self, curr_count):
+
+        t = time.perf_counter()
+        if self.stream != None and t >= self.next_t:
+            self.stream.anchor(curr_count / self.num_chans + self.lag, t)
+            self.next_t = t + anchor_period
+
+# -- Everything queued so far (the short timeout lets items just put by this process reach the queue)
+def drain(q):
+
+    items = []
+    while True:
+        try:
+            items.append(q.get(timeout=0.05))
+        except queue.Empty:
+            return items
+
+# -- Sidecar file name of a recording: '<name> -- Markers .csv'
+def marker_file_name(file_name):
+    return file_name.replace(' .csv', '') + ' -- Markers .csv'
+
+# -- rows: (sample index, time (s), label, source), sorted by sample index
+def save_markers(file_name, rows):
+
+    with open(marker_file_name(file_name), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Sample Index', 'Time (s)', 'Label', 'Source'])
+        for index, t, label, source in rows:
+            writer.writerow(['{:.3f}'.format(index), '{:.6f}'.format(t), label, source])
+
+# -- Markers of a recording as a list of (sample index, time (s), label, source), sorted by sample index
+def load_markers(file_name):
+
+    with open(marker_file_name(file_name), newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [(float(index), float(t), label, source) for index, t, label, source in reader]
+
+# -- Markers with start <= sample index < end (binary search on the sorted list)
+def find_markers(markers, start, end):
+
+    indices = [marker[0] for marker in markers]
+    return markers[bisect.bisect_left(indices, start):bisect.bisect_left(indices, end)]
+
+# -- Rows of a recording CSV from `before` samples before to `after` samples after a marker, read without parsing the rest
+#    (row n of the recording, after its header, is scan index n)
+def read_around(file_name, index, before, after):
+
+    import pandas as pd
+
+    first = max(0, int(index) - before)
+    return pd.read_csv(file_name, skiprows=range(1, first + 1), nrows=int(index) - first + after)
+
+# -- Optional hotkeys marking events while a scan runs (uses the keyboard package, as scan.py does)
+#    keys: {'m': 'Marker', ...}; returns a function removing the hooks
+def listen_keys(stream, keys):
+
+    import keyboard
+
+    hooks = [keyboard.on_press_key(key, lambda event, label=label: stream.mark(label, 'key')) for key, label in keys.items()]
+
+    def remove():
+        for hook in hooks:
+            keyboard.unhook(hook)
+
+    return remove
@@ -0,0 +1,132 @@
+'''
+    Start-up and copy latency of the run modes of an acquisition source (process, thread, in-loop)
+    Records simulated boards (simulated_daq) through the real acquisition loop (live_scan.daq_read) and start gate, for:
+     - a 2-channel board (carotid/femoral) alone
+     - a 7-channel board (chest strap and electrode) alone
+     - both boards together (in-loop takes the 7-channel board, the 2-channel board then runs in a thread)
+    Every case runs idle and again with the controlling process busy (a pure-Python thread standing in for live plots and the
+    window), which is where the modes differ: threads and in-loop sources share that process's GIL, processes do not
+    Measured per case:
+     - start-up: from launching the sources to every source being ready (process start, imports, buffer allocation)
+     - written: share of the expected scans written (less than 100% means scans were lost)
+     - copy latency: age of the oldest scan still waiting in the UL buffer each time the loop polls (the 99th percentile and
+       worst case), i.e. how much of the buffer the loop needs as headroom; about the loop's 0.1s sleep when it keeps up
+       (a pass polls the status before and after its copy, so polls closer than same_pass are one pass)
+
+    Usage:
+        python executor_benchmark.py [seconds per case] [rate]
+
+'''
+
+from multiprocessing import Queue
+from threading import Event, Thread
+import os, sys, tempfile, time
+import numpy as np
+
+try:
+    from live_scan import daq_read, run_source
+    from channel_map import default_map, find_board, device_file_name
+    from source_runner import make_runner, run_modes, arm_and_join
+    from start_gate import StartGate, ScanStart, lead_seconds
+    from event_markers import drain
+except ImportError:
+    from .live_scan import daq_read, run_source
+    from .channel_map import default_map, find_board, device_file_name
+    from .source_runner import make_runner, run_modes, arm_and_join
+    from .start_gate import StartGate, ScanStart, lead_seconds
+    from .event_markers import drain
+
+# -- Status polls closer than this (seconds) belong to the same pass of the loop
+same_pass = 0.005
+
+# -- Simulated copies of the default boards
+def simulated_board(source, stats):
+
+    board = dict(find_board(default_map, source))
+    board.update({'simulated': True, 'stats': stats})
+    return board
+
+# -- Pure-Python work in the controlling process until stop is set
+def busy(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+# -- Age (seconds) of the oldest uncopied scan at the first poll of every pass after the first
+#    polls: (time, whole scans reported); a pass copies every scan reported by its first poll
+def copy_latency(start, rate, polls):
+
+    polls = np.array([poll for poll in polls if poll[0] >= start]).reshape(-1, 2)
+    if len(polls) < 2:
+        return np.array([])
+
+    passes = polls[np.r_[True, np.diff(polls[:, 0]) > same_pass]]
+    return passes[1:, 0] - (start + passes[:-1, 1] / rate)
+
+# -- Record the boards of one case; returns (start-up seconds, {source: (share written, 99th percentile latency, worst latency)})
+def run_case(modes, seconds, rate, folder, loaded = False):
+
+    stats = Queue()
+    boards = [simulated_board(source, stats) for source in modes]
+    gate = StartGate(list(modes))
+    tag = 'benchmark ' + ' '.join(source + '=' + mode for source, mode in modes.items()) + (' loaded' if loaded else '')
+    file_name = os.path.join(folder, tag)
+
+    # -- Busy controlling process
+    stop = Event()
+    if loaded:
+        Thread(target=busy, args=(stop,), daemon=True).start()
+
+    launched = time.perf_counter()
+    runners = [make_runner(modes[board['source']], run_source,
+                           (daq_read, ScanStart(gate, tag, board['source']), board, rate, seconds, device_file_name(file_name, board)))
+               for board in boards]
+    for runner in runners:
+        runner.start()
+
+    start_at = arm_and_join(gate, tag, runners)
+    stop.set()
+    if start_at == None:
+        raise Exception('Error: a simulated board was not ready')
+
+    polls = {source: (start, board_rate, board_polls) for source, start, board_rate, board_polls in drain(stats)}
+    results = {}
+
+    for board in boards:
+        with open(device_file_name(file_name, board)) as f:
+            scans = sum(1 for line in f) - 1
+        os.remove(device_file_name(file_name, board))
+
+        latency = copy_latency(*polls[board['source']]) if board['source'] in polls else np.array([])
+        results[board['source']] = (scans / (rate * seconds + 1),
+                                    np.percentile(latency, 99) if len(latency) else float('nan'), latency.max() if len(latency) else float('nan'))
+
+    return (start_at - lead_seconds) - launched, results
+
+def print_case(title, startup, results):
+
+    print('  ' + title)
+    print('    start-up ' + '{:7.1f}'.format(startup * 1000) + ' ms')
+    for source, (share, typical, worst) in results.items():
+        print('    ' + '{:5}'.format(source) + ' ' + '{:6.1%}'.format(share) + ' written  '
+              + 'copy latency p99 ' + '{:6.1f}'.format(typical * 1000) + ' ms  worst ' + '{:6.1f}'.format(worst * 1000) + ' ms')
+    print()
+
+if __name__ == '__main__':
+
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    rate = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print('\n  Simulated boards at ' + str(rate) + 'Hz, ' + str(seconds) + 's per case\n')
+
+    with tempfile.TemporaryDirectory() as folder:
+        for loaded in (False, True):
+            for mode in run_modes:
+                load = ', busy controlling process' if loaded else ''
+                for source in ('two', 'six'):
+                    startup, results = run_case({source: mode}, seconds, rate, folder, loaded)
+                    print_case(str(len(find_board(default_map, source)['channels'])) + ' channels, ' + mode + load, startup, results)
+
+                # -- Only one source runs in-loop
+                both = {'two': 'thread', 'six': 'inline'} if mode == 'inline' else {'two': mode, 'six': mode}
+                startup, results = run_case(both, seconds, rate, folder, loaded)
+                print_case('2 + 7 channels, ' + ', '.join(source + ' ' + both[source] for source in both) + load, startup, results)
@@ -31,6 +31,11 @@ import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import pandas as pd
 
+try:
+    from sample_ring import SampleRing
+except ImportError:
+    from .sample_ring import SampleRing
+
 # -- Handles real-time plotting and data acquisition
 class RealTimePlot:
     def __init__(self, port_name='COM3', baud_rate=115200, plot_limit=100, bytes_per_data_point = 8):
@@ -45,6 +50,10 @@ class RealTimePlot:
         # -- Stores all acquired values to export to a spreadsheet
         self.spreadsheet_data = []
 
+        # -- Parsed samples handed from the background thread to the plot (about 10 seconds at 100Hz)
+        self.ring = SampleRing(1024)
+        self.parse_errors = 0
+
         # -- Program status indicators
         self.is_running = True
         self.is_receiving = False
@@ -96,17 +105,24 @@ class RealTimePlot:
         current_t = time.perf_counter()
         self.graph_t = int((current_t - self.previous_t) * 1000) 
         self.previous_t = current_t
-        time_base_label.set_text('Plot Interval = ' + str(self.graph_t) + 'ms')
+        time_base_label.set_text('Plot Interval = ' + str(self.graph_t) + 'ms   Dropped = ' + str(self.dropped_samples))
 
-        # -- Decode value read from background thread and save to queue 
-        value = float((self.raw_data).decode()[:-2]) 
-        self.data.append(value)   
+        # -- Save every value parsed by the background thread since the previous frame to queue
+        times, values = self.ring.drain()
+        if len(values) == 0:
+            return
+        self.data.extend(values)   
 
         # -- Update sensor value on matplotlib window
         graph.set_data(range(self.max_limit), self.data)
-        graph_data_label.set_text('[' + graph_label + '] = ' + str(value))
+        graph_data_label.set_text('[' + graph_label + '] = ' + str(values[-1]))
        
-        self.spreadsheet_data.append(self.data[-1])
+        self.spreadsheet_data.extend(values)
+
+    # -- Samples lost because the plot did not drain the ring in time
+    @property
+    def dropped_samples(self):
+        return self.ring.dropped
 
     # -- Read data from the serial port
     def background_daq(self):  
@@ -115,9 +131,17 @@ class RealTimePlot:
         time.sleep(1.0)  
         self.serial_connection.reset_input_buffer()
 
-        # -- Read data until program is terminated
+        # -- Read and parse data until program is terminated
         while self.is_running:
-            self.raw_data = self.serial_connection.readline()
+            raw_data = self.serial_connection.readline()
+
+            try:
+                value = float(raw_data.decode()[:-2])
+            except (UnicodeDecodeError, ValueError):
+                self.parse_errors += 1
+                continue
+
+            self.ring.push(value)
             self.is_receiving = True
     
     # -- Closes serial port connection upon closing the matplotlib window
@@ -129,6 +153,10 @@ class RealTimePlot:
         # -- Complete the background thread
         self.background_thread.join()
 
+        # -- Keep samples parsed after the last frame
+        times, values = self.ring.drain()
+        self.spreadsheet_data.extend(values)
+
         # -- Close serial port connection
         self.serial_connection.close()
         print('Successfully disconnected.')
@@ -0,0 +1,114 @@
+'''
+    Bounded sample history with decimated min/max summaries for scrolling back through a live plot
+    Raw samples are kept in a fixed-size ring (e.g. the last 10 minutes); each summary level keeps one min/max pair per block of samples
+    Views of any span are served from the coarsest level that still gives at least one point per pixel, so zoomed-out redraws stay cheap
+    Memory is fixed at construction; samples are addressed by their absolute index since the first sample
+
+'''
+
+import numpy as np
+
+# -- Fixed-size ring of (min, max) pairs, one per block of block_size raw samples
+class SummaryLevel:
+    def __init__(self, block_size, capacity):
+
+        self.block_size = block_size
+        self.capacity = capacity
+        self.mins = np.zeros(capacity)
+        self.maxs = np.zeros(capacity)
+
+        # -- Completed blocks so far, and the samples of the block still being filled
+        self.count = 0
+        self.partial = np.zeros(0)
+
+    def extend(self, values):
+
+        values = np.concatenate((self.partial, values))
+        full = len(values) // self.block_size
+
+        if full:
+            blocks = values[:full * self.block_size].reshape(full, self.block_size)
+            index = (self.count + np.arange(full)) % self.capacity
+            self.mins[index] = blocks.min(axis=1)
+            self.maxs[index] = blocks.max(axis=1)
+            self.count += full
+
+        self.partial = values[full * self.block_size:]
+
+class HistoryBuffer:
+    def __init__(self, capacity, block_sizes = (8, 64, 512)):
+
+        # -- Raw sample ring
+        self.capacity = capacity
+        self.samples = np.zeros(capacity)
+
+        # -- Total samples ever added (absolute index of the next sample)
+        self.total = 0
+
+        # -- Summary levels, finest first
+        self.levels = [SummaryLevel(size, capacity // size + 1) for size in block_sizes]
+
+    # -- Append newly acquired samples
+    def extend(self, values):
+
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        if len(values) > self.capacity:
+            self.total += len(values) - self.capacity
+            values = values[-self.capacity:]
+
+        index = (self.total + np.arange(len(values))) % self.capacity
+        self.samples[index] = values
+        self.total += len(values)
+
+        for level in self.levels:
+            level.extend(values)
+
+    # -- Oldest absolute index still held
+    @property
+    def first(self):
+        return max(0, self.total - self.capacity)
+
+    # -- Clamp a view [start, end) to the samples still held
+    def clamp(self, start, end):
+
+        end = min(max(end, self.first + 1), self.total)
+        start = min(max(start, self.first), end)
+        return start, end
+
+    # -- Points to draw for [start, end) with at most about max_points vertices: (absolute indices, values)
+    #    Raw samples when they fit, otherwise alternating block min/max pairs from the coarsest sufficient level
+    def view(self, start, end, max_points):
+
+        start, end = self.clamp(start, end)
+        span = end - start
+
+        if span <= max_points:
+            x = np.arange(start, end)
+            return x, self.samples[x % self.capacity]
+
+        level = self.levels[-1]
+        for candidate in self.levels:
+            if span // candidate.block_size <= max_points // 2:
+                level = candidate
+                break
+
+        # -- Completed blocks overlapping the view (still held by the level's ring)
+        first_block = max(start // level.block_size, level.count - level.capacity)
+        last_block = min(-(-end // level.block_size), level.count)
+        blocks = np.arange(first_block, last_block)
+        index = blocks % level.capacity
+
+        x = np.repeat(blocks * level.block_size, 2)
+        y = np.empty(2 * len(blocks))
+        y[0::2] = level.mins[index]
+        y[1::2] = level.maxs[index]
+
+        # -- Raw samples of the block still being filled at the right edge
+        tail = np.arange(max(last_block * level.block_size, start), end)
+        if len(tail):
+            x = np.concatenate((x, tail))
+            y = np.concatenate((y, self.samples[tail % self.capacity]))
+
+        return x, y
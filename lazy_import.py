@@ -0,0 +1,65 @@
+'''
+    Modules loaded on first use instead of at start-up, with the time each import took
+    A LazyModule stands in for a module until an attribute is first used; warm_up() loads modules on a background thread
+    after the window is shown, so the first scan or plot does not pay for them either
+    import_report() lists what was loaded and how long it took
+
+'''
+
+from threading import RLock, Thread
+import importlib, time
+
+# -- Seconds each module took to import: {module name: seconds}, in load order
+import_times = {}
+
+# -- One import at a time, so warm-up and a button callback never load the same module twice
+import_lock = RLock()
+
+class LazyModule:
+    def __init__(self, name, before = None):
+
+        self.__dict__['name'] = name
+        self.__dict__['module'] = None
+
+        # -- Optional function run just before the import (e.g. selecting the matplotlib backend)
+        self.__dict__['before'] = before
+
+    def load(self):
+
+        with import_lock:
+            if self.module == None:
+                start = time.perf_counter()
+                if self.before != None:
+                    self.before()
+                self.__dict__['module'] = importlib.import_module(self.name)
+                import_times[self.name] = time.perf_counter() - start
+
+        return self.module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+# -- Load modules one after another on a background thread; prints the report when done
+def warm_up(modules):
+
+    def load_all():
+        for module in modules:
+            try:
+                module.load()
+            except Exception as error:
+                # -- Loaded again (and the error raised) on first use
+                print('  Warm-up of ' + module.name + ' failed: ' + str(error) + '\n')
+        print(import_report())
+
+    thread = Thread(target=load_all, daemon=True)
+    thread.start()
+    return thread
+
+# -- Import times so far, slowest first
+def import_report():
+
+    lines = ['  Import times:']
+    for name, seconds in sorted(import_times.items(), key=lambda item: -item[1]):
+        lines.append('    ' + '{:6.2f}'.format(seconds) + 's  ' + name)
+    lines.append('    ' + '{:6.2f}'.format(sum(import_times.values())) + 's  total\n')
+    return '\n'.join(lines)
@@ -0,0 +1,238 @@
+'''
+    Background acquisition for the real-time plots
+    Reads every attached channel at a fixed sampling rate on a background thread, independently of the plot animation interval
+    Plot callbacks drain whatever has accumulated since the previous frame, so a slow redraw never drops samples
+    With timestamped=True each channel's pending queue is a SampleRing holding (perf_counter time, value) pairs, for plots with a time axis
+    SampleProducer times each read in software (ul.a_in per channel), so sample spacing carries the thread's jitter and skipped ticks;
+    ScanProducer runs a hardware-clocked background scan (ul.a_in_scan) and queues every scan, for views that need even spacing
+    (spectra, beat intervals). Both record where the stream is discontinuous, as a position in each channel's queued samples
+
+'''
+
+from threading import Thread
+import collections, time
+import numpy as np
+
+try:
+    from sample_ring import SampleRing
+    from ul_transfer import ScanTransfer
+except ImportError:
+    from .sample_ring import SampleRing
+    from .ul_transfer import ScanTransfer
+
+# -- Reads a group of channels at a fixed rate and queues the values for the plot callbacks
+class SampleProducer:
+    def __init__(self, channels, rate, history_seconds = 10, timestamped = False):
+
+        # -- Objects exposing read_value() and a pending queue (one per plotted channel)
+        self.channels = channels
+        self.rate = rate
+        self.timestamped = timestamped
+
+        # -- Bound the pending queues so a stalled window cannot grow memory without limit
+        for channel in self.channels:
+            if timestamped:
+                channel.pending = SampleRing(int(rate * history_seconds))
+            else:
+                channel.pending = collections.deque(maxlen=int(rate * history_seconds))
+
+        # -- Acquisition status indicators
+        self.is_running = False
+        self.background_thread = None
+
+        # -- Number of sampling instants skipped because a read took longer than the period
+        self.missed_ticks = 0
+
+        # -- Samples queued per channel, and that count at every skip (the stream is not evenly spaced across it)
+        self.ticks = 0
+        self.discontinuities = []
+
+    # -- Start the background thread
+    def start(self):
+
+        if self.background_thread == None:
+            self.is_running = True
+            self.background_thread = Thread(target=self.background_read, daemon=True)
+            self.background_thread.start()
+
+    # -- Read every channel once per period until the plot is closed
+    def background_read(self):
+
+        period = 1 / self.rate
+        next_t = time.perf_counter()
+
+        while self.is_running:
+            if self.timestamped:
+                # -- Every channel of one tick shares the tick's time
+                t = time.perf_counter()
+                for channel in self.channels:
+                    channel.pending.push(channel.read_value(), t)
+            else:
+                for channel in self.channels:
+                    channel.pending.append(channel.read_value())
+            self.ticks += 1
+
+            # -- Schedule against absolute deadlines so the sampling rate does not drift with read time
+            next_t += period
+            remaining = next_t - time.perf_counter()
+
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                # -- Fell behind: skip the missed instants instead of bursting to catch up
+                skipped = int(-remaining / period)
+                if skipped > 0:
+                    self.missed_ticks += skipped
+                    self.discontinuities.append(self.ticks)
+                next_t += skipped * period
+
+    # -- Stop the background thread
+    def close(self):
+
+        self.is_running = False
+
+        if self.background_thread != None:
+            self.background_thread.join()
+            self.background_thread = None
+
+# -- Hardware-clocked acquisition of a group of channels on one board: a continuous background scan over the channels' range
+#    A poll thread copies the new scans out of the UL buffer and queues the plotted channels; timestamped samples are placed
+#    at scan index / rate after the scan start, so their spacing is the board's clock, not the thread's
+class ScanProducer:
+    def __init__(self, channels, rate, history_seconds = 10, timestamped = False, buffer_seconds = 2, poll_seconds = 0.01):
+
+        # -- DAQ objects of one board exposing board_num, channel, ai_info and ai_range, and a pending queue (one per plotted channel)
+        self.channels = channels
+        self.rate = rate
+        self.timestamped = timestamped
+        self.poll_seconds = poll_seconds
+
+        self.board_num = channels[0].board_num
+        self.low_chan = min(channel.channel for channel in channels)
+        self.high_chan = max(channel.channel for channel in channels)
+        self.num_chans = self.high_chan - self.low_chan + 1
+        self.columns = [channel.channel - self.low_chan for channel in channels]
+
+        # -- UL buffer of buffer_seconds, a whole number of packets per channel
+        packet_size = channels[0].ai_info.packet_size
+        self.points_per_channel = -(-int(rate * buffer_seconds) // packet_size) * packet_size
+        self.ul_buffer_count = self.points_per_channel * self.num_chans
+
+        for channel in self.channels:
+            if timestamped:
+                channel.pending = SampleRing(int(rate * history_seconds))
+            else:
+                channel.pending = collections.deque(maxlen=int(rate * history_seconds))
+
+        # -- Acquisition status indicators
+        self.is_running = False
+        self.background_thread = None
+        self.memhandle = None
+        self.transfer = None
+        self.started = None
+
+        # -- Scans overwritten before they were copied (poll thread more than a buffer behind)
+        self.missed_ticks = 0
+
+        # -- Samples queued per channel, and that count at every gap
+        self.ticks = 0
+        self.discontinuities = []
+
+    # -- Start the background scan and the poll thread
+    def start(self):
+
+        from mcculw import ul
+        from mcculw.enums import ScanOptions
+
+        if self.background_thread == None:
+            self.memhandle = ul.scaled_win_buf_alloc(self.ul_buffer_count)
+            if not self.memhandle:
+                raise Exception('Failed to allocate memory')
+            self.transfer = ScanTransfer(self.memhandle, self.points_per_channel, self.num_chans, self.points_per_channel)
+
+            scan_options = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS | ScanOptions.SCALEDATA)
+            ul.a_in_scan(self.board_num, self.low_chan, self.high_chan, self.ul_buffer_count, self.rate, self.channels[0].ai_range,
+                         self.memhandle, scan_options)
+            self.started = time.perf_counter()
+
+            self.is_running = True
+            self.background_thread = Thread(target=self.background_read, daemon=True)
+            self.background_thread.start()
+
+    # -- Copy and queue every whole scan acquired since the last poll until the plot is closed
+    def background_read(self):
+
+        from mcculw import ul
+        from mcculw.enums import FunctionType
+
+        first_scan = 0
+
+        while self.is_running:
+            _, curr_count, _ = ul.get_status(self.board_num, FunctionType.AIFUNCTION)
+
+            # -- More than a buffer behind: skip to scans still in the buffer, keeping half of it as headroom
+            if curr_count - first_scan * self.num_chans > self.ul_buffer_count:
+                resume = curr_count // self.num_chans - self.points_per_channel // 2
+                self.skip(resume - first_scan)
+                first_scan = resume
+
+            new_scans = curr_count // self.num_chans - first_scan
+            if new_scans > 0:
+                scans = self.transfer.read(first_scan, new_scans)
+
+                # -- Drop the scans overwritten while they were copied
+                _, curr_count, _ = ul.get_status(self.board_num, FunctionType.AIFUNCTION)
+                intact = max(first_scan, -(-(curr_count - self.ul_buffer_count) // self.num_chans))
+                if intact > first_scan:
+                    self.skip(intact - first_scan)
+                    scans = scans[intact - first_scan:]
+
+                self.queue(intact, scans)
+
+                # -- A copy slower than the whole buffer leaves intact past the scans read; resume there, they are already skipped
+                first_scan = max(intact, first_scan + new_scans)
+
+            time.sleep(self.poll_seconds)
+
+    def skip(self, count):
+
+        self.missed_ticks += count
+        self.discontinuities.append(self.ticks)
+
+    # -- Queue the plotted channels of scans starting at scan number first_scan
+    def queue(self, first_scan, scans):
+
+        if self.timestamped:
+            times = self.started + (first_scan + np.arange(len(scans))) / self.rate
+            for channel, column in zip(self.channels, self.columns):
+                for t, value in zip(times, scans[:, column]):
+                    channel.pending.push(value, t)
+        else:
+            for channel, column in zip(self.channels, self.columns):
+                channel.pending.extend(scans[:, column].tolist())
+
+        self.ticks += len(scans)
+
+    # -- Stop the poll thread and the background scan, and free the UL buffer
+    def close(self):
+
+        from mcculw import ul
+        from mcculw.enums import FunctionType
+
+        self.is_running = False
+
+        if self.background_thread != None:
+            self.background_thread.join()
+            self.background_thread = None
+
+            ul.stop_background(self.board_num, FunctionType.AIFUNCTION)
+            ul.win_buf_free(self.memhandle)
+            self.memhandle = None
+
+# -- Remove and return every value queued since the last call
+def drain(pending):
+
+    values = []
+    while pending:
+        values.append(pending.popleft())
+    return values
@@ -1,27 +1,40 @@
 '''
     Real-time plotting data acquired from 2 DAQ devices (USB-1608fs-Plus) at user-specified time base
     Plots signals from the carotid artery, femoral artery, acoustic and chest strap piezosensors together
+    Sampling runs on background threads at a fixed rate; the time base only sets how often the plots are redrawn
+    plot_spectra adds a rolling spectrum and spectrogram next to the waveform of selected channels (line interference and acoustic content check),
+    fed by a hardware-clocked scan so the samples are evenly spaced
+    Carotid and femoral pulses are run through streaming beat detectors; beats are marked on the traces with the current rate
 
 '''
 
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
 from mcculw import ul
-from mcculw.device_info import DaqDeviceInfo
-from threading import Thread
 from tkinter import *
 import matplotlib.animation as animation
 import matplotlib.pyplot as plt
 import collections, time, sys
+import numpy as np
 
 try:
-    from console_examples_util import config_first_detected_device
+    from console_examples_util import get_boards, release_board
+    from live_acquisition import SampleProducer, ScanProducer, drain
+    from plot_process import LivePlotProcess
+    from rolling_spectrum import RollingSpectrum
+    from beat_detector import BeatDetector
+    from signal_quality import QualityMonitor, input_limits
 except ImportError:
-    from .console_examples_util import config_first_detected_device
+    from .console_examples_util import get_boards, release_board
+    from .live_acquisition import SampleProducer, ScanProducer, drain
+    from .plot_process import LivePlotProcess
+    from .rolling_spectrum import RollingSpectrum
+    from .beat_detector import BeatDetector
+    from .signal_quality import QualityMonitor, input_limits
 
 # -- For carotid artery, femoral artery, acoustic, and chest strap piezosensor real-time plot
 class DAQ:
-    def __init__(self, ch, bn, ddi):
+    def __init__(self, ch, bn, ddi, plot_limit = 500):
 
         # -- DAQ device properties
         self.use_device_detection = True
@@ -34,14 +47,19 @@ class DAQ:
         self.channel = ch
 
         # -- Double-ended queue for storing values that are plotted real-time
-        self.data = collections.deque([0] * 100, maxlen=100)
+        self.plot_limit = plot_limit
+        self.data = collections.deque([0] * plot_limit, maxlen=plot_limit)
 
-        # -- Time base times
-        self.plot_t = 0
-        self.previous_t = 0
+        # -- Values acquired by the background producer, waiting for the next frame
+        self.pending = collections.deque()
+
+        # -- Optional RollingSpectrum, BeatDetector and QualityMonitor fed with the same values as the plot
+        self.spectrum = None
+        self.detector = None
+        self.quality = None
     
-    # -- Read data from analog input channel
-    def get_value(self, frame, graph):
+    # -- Read one value from the analog input channel (called by the background producer)
+    def read_value(self):
 
         # -- For DAQ devices with a resolution less than or equal to 16
         if self.ai_info.resolution <= 16:
@@ -50,87 +68,84 @@ class DAQ:
             raw_value = ul.a_in(self.board_num, self.channel, self.ai_range)
 
             # -- Convert the raw value to engineering units
-            value = ul.to_eng_units(self.board_num, self.ai_range, raw_value)
+            return ul.to_eng_units(self.board_num, self.ai_range, raw_value)
         
         # -- For DAQ devices with a resolution greater than 16
         else:
 
             raw_value = ul.a_in_32(self.board_num, self.channel, self.ai_range)
-            value= ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
+            return ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
 
-        # -- Save value to queue 
-        self.data.append(value) 
+    # -- Update the plot with every value acquired since the previous frame
+    def get_value(self, frame, graph):
 
-        # -- Update sensor value on matplotlib window
-        graph.set_data(range( 100 ), self.data)
+        # -- Save values to queue 
+        values = drain(self.pending)
+        self.data.extend(values)
 
-    # -- Disconnect DAQ device upon closing the matplotlib window
-    def close(self):
-        if self.use_device_detection:
-            ul.release_daq_device(self.board_num)
+        # -- Only the new samples are transformed
+        if self.spectrum != None:
+            self.spectrum.extend(values)
+        if self.detector != None:
+            self.detector.extend(values)
+        if self.quality != None and values:
+            self.quality.add_block(values)
 
-# -- List holding 8 instances of DAQ object of 8 analog input channels to read from
-daq_instance = [None] * 8
+        # -- Update sensor values on matplotlib window
+        graph.set_data(range(self.plot_limit), self.data)
+
+    # -- Mark detected beats inside the plotted window and show the current rate
+    def draw_beats(self, frame, markers, rate_label):
+
+        # -- Beat times are absolute sample indices; the window shows the last plot_limit of them
+        first = self.detector.count - self.plot_limit
+        beats = [(t - first, value) for t, value in self.detector.beats if t >= first]
 
-# -- Initial configuration of first USB-1608fs-Plus DAQ device
-def inst0():
+        markers.set_data([x for x, value in beats], [value for x, value in beats])
+        rate_label.set_text('Rate = ' + '{:.0f}'.format(self.detector.bpm) + ' bpm')
 
-    # -- Passed board number 0
-    config_first_detected_device(0, [])
-    daq_dev_info = DaqDeviceInfo(0)
+    # -- Disconnect DAQ device upon closing the matplotlib window (the first channel closed releases the board)
+    def close(self):
+        if self.use_device_detection:
+            release_board(self.board_num)
 
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
+# -- Auto-scale each row of plots (sharey='row') to cover the y-limits of every channel drawn on it
+#    rows: (axis, DAQ objects with a QualityMonitor); the initial limits stay until a channel completes its first window
+def scale_rows(rows):
 
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+    for ax, daqs in rows:
+        limits = [daq.quality.y_limits(0) for daq in daqs if daq.quality.y_limits(0) != None]
+        if limits:
+            ax.set_ylim([min(low for low, high in limits), max(high for low, high in limits)])
 
-    # -- Instnaitate DAQ objects for each sensor
-    daq_instance[0] = DAQ(0,0, daq_dev_info)
+# -- Fixed sampling rate of the live plots in samples/s (independent of the time base)
+sample_rate = 100
 
-    # -- Wait some time to avoid UL configuration error
-    time.sleep(0.1)
-    daq_instance[1] = DAQ(1,0, daq_dev_info)
+# -- Number of samples shown on each live plot (5 seconds at the sampling rate)
+plot_limit = 5 * sample_rate
 
-# -- Initial configuration of second USB-1608fs-Plus DAQ device
-def inst1():
+# -- List holding 8 instances of DAQ object of 8 analog input channels to read from
+daq_instance = [None] * 8
 
-    # -- Passed board number 1
-    config_first_detected_device(1, [])
-    daq_dev_info = DaqDeviceInfo(1)
+# -- Configure both USB-1608fs-Plus DAQ devices in parallel (once each, in the board registry) and instantiate a DAQ object per sensor
+def connect_boards():
 
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
+    devices = get_boards([0, 1])
 
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
-    
-    # -- Instnaitate DAQ objects for each sensor
-    daq_instance[2] = DAQ(0,1, daq_dev_info)
-
-    # -- Wait some time to avoid UL configuration error
-    time.sleep(0.1)
-    daq_instance[3] = DAQ(1,1, daq_dev_info)
-    time.sleep(0.1)
-    daq_instance[4] = DAQ(2,1, daq_dev_info)
-    time.sleep(0.1)
-    daq_instance[5] = DAQ(3,1, daq_dev_info)
-    time.sleep(0.1)
-    daq_instance[6] = DAQ(4,1, daq_dev_info)
-    time.sleep(0.1)
-    daq_instance[7] = DAQ(5,1, daq_dev_info)
+    # -- Carotid and femoral artery piezosensors on board 0
+    daq_instance[0] = DAQ(0,0, devices[0], plot_limit)
+    daq_instance[1] = DAQ(1,0, devices[0], plot_limit)
+
+    # -- Acoustic and chest strap piezosensors on board 1
+    for ch in range(6):
+        daq_instance[2 + ch] = DAQ(ch,1, devices[1], plot_limit)
 
 def plot_piezos(tb):
 # -- If program log is included    
 # def plot_piezos(tb, log):
     
     # -- Concurrent configuration of the two DAQ devices
-    for_board0 = Thread(target=inst0)
-    for_board1 = Thread(target=inst1)
-
-    for_board0.start()
-    for_board1.start()
-
-    for_board0.join()
-    for_board1.join()
+    connect_boards()
 
     # -- Assignment of each DAQ object to corresponding channel/sensor
 
@@ -143,31 +158,31 @@ def plot_piezos(tb):
     board_one_ch_four = daq_instance[6]     
     board_one_ch_five = daq_instance[7]     
 
-    # -- Period at which plot animations update in milliseconds
+    # -- Period at which plot animations update in milliseconds (render rate)
     time_base = tb
 
     # -- matplotlib graph properties
     fig, ((ax0, ax1),(ax2, ax3),(ax4, ax5), (ax6, ax7)) = plt.subplots(nrows=4, ncols=2, sharex=True, sharey='row', figsize=(20,8))
 
-    ax0.set_xlim([0, 100])
+    ax0.set_xlim([0, plot_limit])
     ax0.set_ylim([-3,3])
 
-    ax1.set_xlim([0, 100])
+    ax1.set_xlim([0, plot_limit])
 
-    ax2.set_xlim([0, 100])
+    ax2.set_xlim([0, plot_limit])
     ax2.set_ylim([0,10]) 
 
-    ax3.set_xlim([0, 100])
+    ax3.set_xlim([0, plot_limit])
 
-    ax4.set_xlim([0, 100])
+    ax4.set_xlim([0, plot_limit])
     ax4.set_ylim([0,10]) 
 
-    ax5.set_xlim([0, 100])
+    ax5.set_xlim([0, plot_limit])
 
-    ax6.set_xlim([0, 100])
+    ax6.set_xlim([0, plot_limit])
     ax6.set_ylim([0,10])  
     
-    ax7.set_xlim([0, 100])
+    ax7.set_xlim([0, plot_limit])
 
     carotid_label = 'Carotid Piezo'
     carotid_graph = ax0.plot([], [], label=carotid_label, linewidth=0.5)[0]
@@ -193,15 +208,44 @@ def plot_piezos(tb):
     ch5_label = 'Piezo CH5'
     ch5_graph = ax7.plot([], [], label=ch5_label, linewidth=0.5)[0]
 
-    # -- Callback functions to read data from analog inputs and update the frame of the live plots   
-    carotid_anim = animation.FuncAnimation(fig, board_zero_ch_zero.get_value, fargs=(carotid_graph,), interval=time_base)  
-    femoral_anim = animation.FuncAnimation(fig, board_zero_ch_one.get_value, fargs=(femoral_graph,), interval=time_base)  
-    acoustic_anim = animation.FuncAnimation(fig, board_one_ch_zero.get_value, fargs=(acoustic_graph,), interval=time_base)    
-    ch1_anim = animation.FuncAnimation(fig, board_one_ch_one.get_value, fargs=(ch1_graph,), interval=time_base)  
-    ch2_anim = animation.FuncAnimation(fig, board_one_ch_two.get_value, fargs=(ch2_graph,), interval=time_base)  
-    ch3_anim = animation.FuncAnimation(fig, board_one_ch_three.get_value, fargs=(ch3_graph,), interval=time_base)
-    ch4_anim = animation.FuncAnimation(fig, board_one_ch_four.get_value, fargs=(ch4_graph,), interval=time_base) 
-    ch5_anim = animation.FuncAnimation(fig, board_one_ch_five.get_value, fargs=(ch5_graph,), interval=time_base) 
+    # -- Beat detection on the carotid and femoral pulses: markers and rate on their plots
+    board_zero_ch_zero.detector = BeatDetector(sample_rate, 'pulse')
+    board_zero_ch_one.detector = BeatDetector(sample_rate, 'pulse')
+
+    carotid_beats = ax0.plot([], [], 'v', color='r', markersize=5)[0]
+    carotid_rate = ax0.text(0.50, 0.90, '', transform=ax0.transAxes)
+    femoral_beats = ax1.plot([], [], 'v', color='r', markersize=5)[0]
+    femoral_rate = ax1.text(0.50, 0.90, '', transform=ax1.transAxes)
+
+    beat_overlays = [(board_zero_ch_zero, carotid_beats, carotid_rate), (board_zero_ch_one, femoral_beats, femoral_rate)]
+
+    # -- Streaming signal quality per channel, driving the y-limits of each row from the signal instead of fixed ranges
+    for daq, label in zip(daq_instance, piezo_labels):
+        daq.quality = QualityMonitor([label], sample_rate)
+
+    quality_rows = [(ax0, daq_instance[0:2]), (ax2, daq_instance[2:4]), (ax4, daq_instance[4:6]), (ax6, daq_instance[6:8])]
+
+    # -- Acquisition runs at the fixed sampling rate on one background thread per DAQ device
+    board_zero_producer = SampleProducer([board_zero_ch_zero, board_zero_ch_one], sample_rate)
+    board_one_producer = SampleProducer([board_one_ch_zero, board_one_ch_one, board_one_ch_two, board_one_ch_three, board_one_ch_four, board_one_ch_five], sample_rate)
+
+    board_zero_producer.start()
+    board_one_producer.start()
+
+    # -- Pairs of DAQ object and graph redrawn on every frame
+    live_graphs = [(board_zero_ch_zero, carotid_graph), (board_zero_ch_one, femoral_graph), (board_one_ch_zero, acoustic_graph), (board_one_ch_one, ch1_graph),
+                   (board_one_ch_two, ch2_graph), (board_one_ch_three, ch3_graph), (board_one_ch_four, ch4_graph), (board_one_ch_five, ch5_graph)]
+
+    # -- Draw every value acquired since the previous frame
+    def update_frame(frame):
+        for daq, graph in live_graphs:
+            daq.get_value(frame, graph)
+        for daq, markers, rate_label in beat_overlays:
+            daq.draw_beats(frame, markers, rate_label)
+        scale_rows(quality_rows)
+
+    # -- Single callback updating every live plot at the time base (render rate only, sampling is unaffected)
+    anim = animation.FuncAnimation(fig, update_frame, interval=time_base)
 
     # -- matplotlib graph properties
     fig.tight_layout()
@@ -214,6 +258,10 @@ def plot_piezos(tb):
     mng.window.showMaximized()
     plt.show()
 
+    # -- Stop acquisition before disconnecting
+    board_zero_producer.close()
+    board_one_producer.close()
+
     # -- Disconnect
     try:
         board_zero_ch_zero.close()
@@ -239,3 +287,149 @@ def plot_piezos(tb):
 
         print('  ERROR: DISCONNECTION FAILURE\n')
         sys.exit()
+
+# -- Labels and y-limits of the 8 piezosensor plots (same layout as plot_piezos)
+piezo_labels = ['Carotid Piezo', 'Femoral Piezo', 'Piezo CH0', 'Piezo CH1', 'Piezo CH2', 'Piezo CH3', 'Piezo CH4', 'Piezo CH5']
+piezo_y_ranges = [[-3,3], [-3,3], [0,10], [0,10], [0,10], [0,10], [0,10], [0,10]]
+
+# -- Non-blocking variant of plot_piezos: acquisition stays in this process, the plot window runs in its own process
+def launch_piezos(tb):
+
+    # -- Concurrent configuration of the two DAQ devices
+    connect_boards()
+
+    daqs = list(daq_instance)
+
+    # -- Plot process reading samples from shared memory, redrawn at the time base
+    view = LivePlotProcess(piezo_labels, piezo_y_ranges, plot_limit, tb, 4, 2, 'Piezosensors', rates=[sample_rate] * 8, limits=[input_limits] * 8)
+
+    # -- Acquisition at the fixed sampling rate, forwarded to the plot process
+    producers = [SampleProducer(daqs[0:2], sample_rate), SampleProducer(daqs[2:8], sample_rate)]
+    for producer in producers:
+        producer.start()
+
+    view.feed_from(lambda: [(ch, drain(daq.pending)) for ch, daq in enumerate(daqs)])
+
+    return (view, producers, daqs)
+
+# -- Close the plot process started by launch_piezos and disconnect
+def stop_piezos(session):
+
+    view, producers, daqs = session
+
+    view.close()
+    for producer in producers:
+        producer.close()
+
+    try:
+        for daq in daqs:
+            daq.close()
+
+        print('  Successfully disconnected.\n\n')
+
+    except:
+        print('  ERROR: DISCONNECTION FAILURE\n')
+
+# -- Channels shown by plot_spectra (indices into daq_instance): acoustic piezo and the first chest strap piezo
+spectrum_channels = [2, 3]
+
+# -- Sampling rate of the spectral view in samples/s (must exceed 120 for 50/60Hz interference to be below Nyquist)
+spectrum_rate = 1000
+
+# -- Power density range of the spectrum and spectrogram in dB (V**2/Hz)
+spectrum_db_range = [-120, 0]
+
+# -- Waveform, rolling Welch spectrum and spectrogram of each selected channel, one row per channel
+def plot_spectra(tb, channels = spectrum_channels, rate = spectrum_rate):
+
+    # -- Concurrent configuration of the two DAQ devices
+    connect_boards()
+
+    daqs = list(daq_instance)
+    selected = [daqs[ch] for ch in channels]
+
+    # -- Spectral estimators fed by each DAQ object's plot callback
+    for daq in selected:
+        daq.spectrum = RollingSpectrum(rate)
+
+    # -- matplotlib graph properties
+    fig, axes = plt.subplots(nrows=len(channels), ncols=3, squeeze=False, figsize=(20, 3 * len(channels) + 1))
+    fig.canvas.manager.set_window_title('Spectrum Check')
+
+    graphs = []
+    for row, ch in enumerate(channels):
+        spectrum = selected[row].spectrum
+        wave_ax, psd_ax, image_ax = axes[row]
+
+        wave_ax.set_xlim([0, plot_limit])
+        wave_ax.set_ylim(piezo_y_ranges[ch])
+        wave_graph = wave_ax.plot([], [], label=piezo_labels[ch], linewidth=0.5)[0]
+        wave_ax.legend(loc="upper left")
+
+        psd_ax.set_xlim([0, rate / 2])
+        psd_ax.set_ylim(spectrum_db_range)
+        psd_ax.set_ylabel('PSD (dB)')
+        psd_graph = psd_ax.plot([], [], linewidth=0.5)[0]
+        line_label = psd_ax.text(0.50, 0.90, '', transform=psd_ax.transAxes)
+
+        image = image_ax.imshow(spectrum.image, origin='lower', aspect='auto', extent=[-spectrum.image_seconds, 0, 0, rate / 2],
+                                vmin=spectrum_db_range[0], vmax=spectrum_db_range[1])
+        image_ax.set_ylabel('Frequency (Hz)')
+
+        graphs.append((selected[row], wave_graph, psd_graph, line_label, image))
+
+    axes[-1][1].set_xlabel('Frequency (Hz)')
+    axes[-1][2].set_xlabel('Time (s)')
+
+    # -- Hardware-clocked acquisition of the selected channels at the spectral sampling rate, one background scan per DAQ device
+    #    (software-timed reads are not evenly spaced, which smears the spectrum)
+    producers = {}
+    for board_num in [0, 1]:
+        board_daqs = [daq for daq in selected if daq.board_num == board_num]
+        if board_daqs:
+            producers[board_num] = ScanProducer(board_daqs, rate)
+    for producer in producers.values():
+        producer.start()
+
+    # -- Gaps of each producer already passed on to its channels' spectra
+    applied = {board_num: 0 for board_num in producers}
+
+    # -- Draw the new samples, then the spectra updated from them
+    def update_frame(frame):
+        for board_num, producer in producers.items():
+            gaps = producer.discontinuities[applied[board_num]:]
+            applied[board_num] += len(gaps)
+            for daq in selected:
+                if daq.board_num == board_num:
+                    for position in gaps:
+                        daq.spectrum.discontinuity(position)
+
+        for daq, wave_graph, psd_graph, line_label, image in graphs:
+            daq.get_value(frame, wave_graph)
+
+            frequencies, density = daq.spectrum.psd()
+            psd_graph.set_data(frequencies, 10 * np.log10(np.maximum(density, 1e-20)))
+            lost = producers[daq.board_num].missed_ticks
+            line_label.set_text('50Hz = ' + '{:.1f}'.format(daq.spectrum.level_at(50)) + 'dB   60Hz = ' + '{:.1f}'.format(daq.spectrum.level_at(60)) + 'dB'
+                                + ('' if lost == 0 else '   ' + str(lost) + ' samples lost') + ('' if daq.spectrum.valid else ' (INVALID)'))
+            image.set_data(daq.spectrum.image)
+
+    anim = animation.FuncAnimation(fig, update_frame, interval=tb)
+
+    fig.tight_layout()
+    mng = plt.get_current_fig_manager()
+    mng.window.showMaximized()
+    plt.show()
+
+    # -- Stop acquisition before disconnecting
+    for producer in producers.values():
+        producer.close()
+
+    try:
+        for daq in daqs:
+            daq.close()
+
+        print('  Successfully disconnected.\n\n')
+
+    except:
+        print('  ERROR: DISCONNECTION FAILURE\n')
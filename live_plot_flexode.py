@@ -1,23 +1,57 @@
 '''
     Real-time plotting data acquired from a USB-1608fs-Plus DAQ device and the serial port at user-specified time base
     Plots signals from the ECG and flex sensor together
+    The ECG is a hardware-clocked background scan polled by a thread; the time base only sets how often the plots are redrawn
+    Both sources keep timestamped traces and are drawn on a shared seconds axis over a configurable window, so the 1kHz ECG and ~100Hz flex sensor line up
+    The ECG is run through a streaming beat detector; R waves are marked on the trace with the current heart rate
 
 '''
 
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
-from mcculw import ul
-from mcculw.device_info import DaqDeviceInfo
 from tkinter import *
 from threading import Thread
 import matplotlib.animation as animation
-import collections, time, serial, sys
+import time, serial, sys
 import matplotlib.pyplot as plt
 
 try:
-    from console_examples_util import config_first_detected_device
+    from console_examples_util import get_board, release_board
+    from live_acquisition import ScanProducer
+    from sample_ring import SampleRing
+    from plot_process import LivePlotProcess
+    from timed_trace import TimedTrace
+    from beat_detector import BeatDetector
+    from signal_quality import QualityMonitor, input_limits
 except ImportError:
-    from .console_examples_util import config_first_detected_device
+    from .console_examples_util import get_board, release_board
+    from .live_acquisition import ScanProducer
+    from .sample_ring import SampleRing
+    from .plot_process import LivePlotProcess
+    from .timed_trace import TimedTrace
+    from .beat_detector import BeatDetector
+    from .signal_quality import QualityMonitor, input_limits
+
+# -- Fixed sampling rate of the ECG live plot in samples/s (independent of the time base)
+sample_rate = 1000
+
+# -- Nominal flex sensor rate in samples/s (set by the Arduino sketch, only used to size buffers)
+flex_rate = 100
+
+# -- Seconds of signal shown on the shared time axis
+window_seconds = 2
+
+# -- Set a plot's y-limits from its QualityMonitor once it has a complete window (the initial limits stay until then)
+def auto_scale(ax, quality):
+
+    if quality != None:
+        limits = quality.y_limits(0)
+        if limits != None:
+            ax.set_ylim(limits)
+
+# -- Trace capacity for a source, with headroom for rate jitter
+def trace_capacity(rate, window):
+    return int(rate * window * 1.5) + 1
 
 # -- For ECG electrode real-time plot
 class DAQ:
@@ -30,64 +64,66 @@ class DAQ:
         self.rate = 1000
         self.memhandle = None
 
-        # -- Double-ended queue for storing values that are plotted real-time
-        self.data = collections.deque([0] * 100, maxlen=100)
+        # -- Timestamped values acquired by the background producer, waiting for the next frame
+        self.pending = SampleRing(1)    # replaced by the ScanProducer
+
+        # -- Timestamped trace that is plotted real-time (set up by the plot with its shared time origin)
+        self.trace = None
+
+        # -- Optional BeatDetector and QualityMonitor fed with the same samples as the trace
+        self.detector = None
+        self.quality = None
 
         # -- Time base times
         self.ecg_graph_t = 0
         self.ecg_previous_t = 0
 
-        # -- Configure DAQ device with ECG connected to it
-        if self.use_device_detection:
-            config_first_detected_device(self.board_num, self.dev_id_list)
-
-        daq_dev_info = DaqDeviceInfo(self.board_num)
-
-        if not daq_dev_info.supports_analog_input:
-            raise Exception('Error: The DAQ device does not support analog input')
-
-        print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+        # -- Configure DAQ device with ECG connected to it (once, in the board registry)
+        daq_dev_info = get_board(self.board_num)
 
         # -- DAQ device properties
         self.ai_info = daq_dev_info.get_ai_info()
         self.ai_range = self.ai_info.supported_ranges[0]
         self.channel = ch
 
-    # -- Read data from analog input channel
+    # -- Update the plot with every value acquired since the previous frame
     def get_value(self, frame, ecg_graph, ecg_graph_data_label, ecg_graph_label, ecg_tb_label):
 
-        # -- For DAQ devices with a resolution less than or equal to 16
-        if self.ai_info.resolution <= 16:
-
-            # -- Read raw value
-            raw_value = ul.a_in(board_num=self.board_num, channel=self.channel, ul_range=self.ai_range)
-            
-            # -- Convert the raw value to engineering units
-            value = ul.to_eng_units(self.board_num, self.ai_range, raw_value)
-
-        # -- For DAQ devices with a resolution greater than 16
-        else:
-
-            raw_value = ul.a_in_32(self.board_num, self.channel, self.ai_range)
-            value= ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
-
         # -- Update plot interval (time base) on matplotlib window
         ecg_current_t = time.perf_counter()
         self.ecg_graph_t = int((ecg_current_t - self.ecg_previous_t) * 1000)     # the first reading will be erroneous
         self.ecg_previous_t = ecg_current_t
         ecg_tb_label.set_text('Plot Interval = ' + str(self.ecg_graph_t) + 'ms')  
 
-        # -- Save value to queue 
-        self.data.append(value)    
+        # -- Copy new samples straight from the acquisition ring into the trace (no per-frame allocation)
+        if self.pending.drain_to(self.consume) == 0:
+            return
 
         # -- Update sensor value on matplotlib window
-        ecg_graph.set_data(range( 100 ), self.data)
-        ecg_graph_data_label.set_text('[' + ecg_graph_label + '] = ' + str(value))
+        ecg_graph.set_data(*self.trace.window())
+        ecg_graph_data_label.set_text('[' + ecg_graph_label + '] = ' + str(self.trace.latest_value))
+        auto_scale(ecg_graph.axes, self.quality)
+
+    # -- Sink for the acquisition ring: new (times, values) go to the trace and the beat detector
+    def consume(self, times, values):
+
+        self.trace.extend(times, values)
+        if self.detector != None:
+            self.detector.extend(values, times)
+        if self.quality != None and len(values):
+            self.quality.add_block(values)
+
+    # -- Mark detected R waves on the time axis and show the current heart rate
+    def draw_beats(self, frame, markers, rate_label):
+
+        beats = list(self.detector.beats)
+        markers.set_data([t - self.trace.origin for t, value in beats], [value for t, value in beats])
+        rate_label.set_text('Heart Rate = ' + '{:.0f}'.format(self.detector.bpm) + ' bpm')
 
     # -- Disconnect DAQ device upon closing the matplotlib window
     def close(self):
         if self.use_device_detection:
-            ul.release_daq_device(self.board_num)
+            release_board(self.board_num)
 
 # -- For flex sensor real-time plot
 class SerialPort:
@@ -97,8 +133,15 @@ class SerialPort:
         self.max_limit = plot_limit
         self.bytes_per_data_point = bytes_per_data_point
 
-        # -- Double-ended queue for storing values that are plotted real-time
-        self.data = collections.deque([0] * plot_limit, maxlen=plot_limit)
+        # -- Parsed samples handed from the background thread to the plot (about 10 seconds at 100Hz)
+        self.ring = SampleRing(1024)
+        self.parse_errors = 0
+
+        # -- Timestamped trace that is plotted real-time (set up by the plot with its shared time origin)
+        self.trace = None
+
+        # -- Optional QualityMonitor fed with the same samples as the trace
+        self.quality = None
 
         # -- Real-time plot status indicators
         self.is_running = True
@@ -148,15 +191,28 @@ class SerialPort:
         flex_current_t = time.perf_counter()
         self.flex_graph_t = int((flex_current_t - self.flex_previous_t) * 1000)     # the first reading will be erroneous
         self.flex_previous_t = flex_current_t
-        flex_tb_label.set_text('Plot Interval = ' + str(self.flex_graph_t) + 'ms')
+        flex_tb_label.set_text('Plot Interval = ' + str(self.flex_graph_t) + 'ms   Dropped = ' + str(self.dropped_samples))
 
-        # -- Decode value read from background thread and save to queue
-        value = float((self.rawData).decode()[:-2]) 
-        self.data.append(value)    
+        # -- Copy every value parsed by the background thread since the previous frame into the trace
+        if self.ring.drain_to(self.consume) == 0:
+            return
 
         # -- Update sensor value on matplotlib window
-        flex_graph.set_data(range(self.max_limit), self.data)
-        flex_graph_data_label.set_text('[' + flex_graph_label + '] = ' + str(value))
+        flex_graph.set_data(*self.trace.window())
+        flex_graph_data_label.set_text('[' + flex_graph_label + '] = ' + str(self.trace.latest_value))
+        auto_scale(flex_graph.axes, self.quality)
+
+    # -- Sink for the ring: new (times, values) go to the trace and the quality monitor
+    def consume(self, times, values):
+
+        self.trace.extend(times, values)
+        if self.quality != None and len(values):
+            self.quality.add_block(values)
+
+    # -- Samples lost because the plot did not drain the ring in time
+    @property
+    def dropped_samples(self):
+        return self.ring.dropped
 
     # -- Read flex sensor data from the serial port
     def background_read(self):    
@@ -165,9 +221,17 @@ class SerialPort:
         time.sleep(1.0)
         self.serial_connection.reset_input_buffer()
 
-        # -- Read data until real-time plotting is terminated
+        # -- Read and parse data until real-time plotting is terminated
         while self.is_running:
-            self.rawData = self.serial_connection.readline()
+            raw_data = self.serial_connection.readline()
+
+            try:
+                value = float(raw_data.decode()[:-2])
+            except (UnicodeDecodeError, ValueError):
+                self.parse_errors += 1
+                continue
+
+            self.ring.push(value)
             self.is_receiving = True
 
     # -- Closes serial port connection upon closing the matplotlib window
@@ -179,7 +243,14 @@ class SerialPort:
         self.background_thread.join()
         self.serial_connection.close()
 
-def plot_flexode(tb):
+# -- Keep the shared time axis on the newest sample of either source
+def follow_latest(frame, ax, traces, window):
+
+    newest = max(trace.latest_time for trace in traces)
+    if newest == newest:    # not NaN (no samples yet)
+        ax.set_xlim([newest - window, newest])
+
+def plot_flexode(tb, window = window_seconds):
 # -- If program log is included
 # def plot_flexode( tb, log ):
 
@@ -192,16 +263,25 @@ def plot_flexode(tb):
     # -- Period at which plot animations update in milliseconds
     time_base = tb   
 
+    # -- Timestamped traces sharing one time origin, sized for the window at each source's rate
+    origin = time.perf_counter()
+    d.trace = TimedTrace(trace_capacity(sample_rate, window), origin)
+    s.trace = TimedTrace(trace_capacity(flex_rate, window), origin)
+
+    # -- Streaming signal quality driving the y-limits from the signal (no clipping check on the flex sensor angle)
+    d.quality = QualityMonitor(['ECG Electrode'], sample_rate)
+    s.quality = QualityMonitor(['Flex Sensor'], flex_rate, [None])
+
     # -- matplotlib graph properties
     fig, (ax0, ax1) = plt.subplots(nrows=2, ncols=1, sharex=True, figsize=(20,6))
 
-    ax0.set_xlim([0, 100])
+    ax0.set_xlim([0, window])
     ax0.set_ylim([-2,6])
     ax0.set_ylabel("Amplitude (V)") 
 
-    ax1.set_xlim([0, 100])
     ax1.set_ylim([-100,100]) 
     ax1.set_ylabel("Angular Displacement (deg)")
+    ax1.set_xlabel("Time (s)")
 
     # -- ECG electrode graph text animation properties
     ecg_graph_label = 'ECG Electrode'
@@ -209,6 +289,11 @@ def plot_flexode(tb):
     ecg_graph = ax0.plot([], [], label=ecg_graph_label, linewidth=0.5)[0]
     ecg_graph_data_label = ax0.text(0.50, 0.90, '', transform=ax0.transAxes)
 
+    # -- ECG beat detection: R wave markers and heart rate
+    d.detector = BeatDetector(sample_rate, 'ecg')
+    ecg_beats = ax0.plot([], [], 'v', color='r', markersize=5)[0]
+    ecg_rate_label = ax0.text(0.50, 0.85, '', transform=ax0.transAxes)
+
     # -- Flex sensor graph text animation properties
     flex_graph_label = 'Flex Sensor'
     flex_tb_label = ax1.text(0.50, 0.95, '', transform=ax1.transAxes)
@@ -218,9 +303,15 @@ def plot_flexode(tb):
     # -- Starts background thread for receiving flex sensor data
     s.readline_data()
 
+    # -- Starts the background scan of the ECG electrode at the fixed sampling rate (evenly spaced samples for the R-R intervals)
+    ecg_producer = ScanProducer([d], sample_rate, timestamped=True)
+    ecg_producer.start()
+
     # -- Callback functions to read data from inputs and update the frame of the live plots   
     ecg_anim = animation.FuncAnimation( fig, d.get_value, fargs=( ecg_graph, ecg_graph_data_label, ecg_graph_label, ecg_tb_label ), interval=time_base )    
     flex_anim = animation.FuncAnimation( fig, s.update_value, fargs=( flex_graph, flex_graph_data_label, flex_graph_label, flex_tb_label ), interval=time_base )
+    axis_anim = animation.FuncAnimation( fig, follow_latest, fargs=( ax0, [d.trace, s.trace], window ), interval=time_base )
+    beat_anim = animation.FuncAnimation( fig, d.draw_beats, fargs=( ecg_beats, ecg_rate_label ), interval=time_base )
     
     # -- matplotlib graph properties
     fig.tight_layout()
@@ -231,6 +322,9 @@ def plot_flexode(tb):
     mng.window.showMaximized()
     plt.show()
 
+    # -- Stop ECG acquisition before disconnecting
+    ecg_producer.close()
+
     # -- Close connection to DAQ device and serial port
     try:
         s.close()
@@ -248,4 +342,45 @@ def plot_flexode(tb):
         # Label(log, text='ERROR: DISCONNECTION FAILURE', anchor='w').grid()
 
         print('  ERROR: DISCONNECTION FAILURE\n')
-        sys.exit()
\ No newline at end of file
+        sys.exit()
+
+# -- Non-blocking variant of plot_flexode: acquisition stays in this process, the plot window runs in its own process
+def launch_flexode(tb, window = window_seconds):
+
+    d = DAQ(6,1)
+    s = SerialPort('COM3', 115200, 100, 8)
+
+    # -- Plot process reading timestamped samples from shared memory, redrawn at the time base on a shared seconds axis
+    view = LivePlotProcess(['ECG Electrode', 'Flex Sensor'], [[-2,6], [-100,100]], trace_capacity(sample_rate, window), tb, 2, 1, 'Electrode and Flex Sensor', window,
+                           rates=[sample_rate, flex_rate], limits=[input_limits, None])
+
+    # -- Background acquisition of both inputs, forwarded to the plot process with their acquisition times
+    s.readline_data()
+    ecg_producer = ScanProducer([d], sample_rate, timestamped=True)
+    ecg_producer.start()
+
+    def collect():
+        ecg_times, ecg_values = d.pending.drain()
+        flex_times, flex_values = s.ring.drain()
+        return [(0, ecg_values, ecg_times), (1, flex_values, flex_times)]
+
+    view.feed_from(collect)
+
+    return (view, ecg_producer, d, s)
+
+# -- Close the plot process started by launch_flexode and disconnect
+def stop_flexode(session):
+
+    view, ecg_producer, d, s = session
+
+    view.close()
+    ecg_producer.close()
+
+    try:
+        s.close()
+        d.close()
+
+        print('  Successfully disconnected.\n\n')
+
+    except:
+        print('  ERROR: DISCONNECTION FAILURE\n')
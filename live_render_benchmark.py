@@ -0,0 +1,127 @@
+'''
+    Frames-per-second benchmark of the two live renderers of the PyQt5 window
+    Feeds 8 synthetic channels at 1kHz (5 second window) to both paths for the same duration:
+     - matplotlib: FuncAnimation updating 8 Line2D objects on a FigureCanvasQTAgg (the current live plot path)
+     - qt: TraceView drawing min/max decimated QPolygonF traces with QPainter
+    Rendering runs as fast as the event loop allows; frames are counted when a draw actually completes
+
+    Usage:
+        python live_render_benchmark.py [seconds per renderer]
+        (set QT_QPA_PLATFORM=offscreen to run without a display)
+
+'''
+
+import sys, time
+import numpy as np
+
+import matplotlib
+matplotlib.use('Qt5Agg')
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import QTimer
+
+try:
+    from qt_trace_view import TraceView
+except ImportError:
+    from .qt_trace_view import TraceView
+
+# -- Benchmark properties
+num_channels = 8
+rate = 1000
+window_seconds = 5
+capacity = rate * window_seconds
+
+# -- Synthetic source: samples due since the previous call at the nominal rate
+class SyntheticSource:
+    def __init__(self):
+        self.start_t = time.perf_counter()
+        self.produced = 0
+        self.phase = np.arange(num_channels) * 0.7
+
+    def read(self):
+        due = int((time.perf_counter() - self.start_t) * rate)
+        count = due - self.produced
+        t = (self.produced + np.arange(count)) / rate
+        self.produced = due
+        return np.sin(2 * np.pi * 1.2 * t[:, None] + self.phase) + 0.05 * np.random.randn(count, num_channels)
+
+# -- matplotlib path: FuncAnimation with 8 subplots, as in the live plot windows
+def run_matplotlib(app, seconds):
+
+    fig, axes = plt.subplots(nrows=4, ncols=2, sharex=True, figsize=(16, 8))
+    lines = []
+    for ch, ax in enumerate(axes.flatten()):
+        ax.set_xlim([0, capacity])
+        ax.set_ylim([-1.5, 1.5])
+        lines.append(ax.plot([], [], label='CH' + str(ch), linewidth=0.5)[0])
+
+    canvas = FigureCanvas(fig)
+    canvas.resize(1600, 800)
+    canvas.show()
+
+    source = SyntheticSource()
+    history = np.zeros((capacity, num_channels))
+    x = np.arange(capacity)
+    frames = [0]
+
+    def update(frame):
+        block = source.read()
+        count = min(len(block), capacity)
+        if count == 0:
+            return
+        history[:-count] = history[count:]
+        history[-count:] = block[-count:]
+        for ch, line in enumerate(lines):
+            line.set_data(x, history[:, ch])
+
+    def count_draw(event):
+        frames[0] += 1
+
+    canvas.mpl_connect('draw_event', count_draw)
+    anim = animation.FuncAnimation(fig, update, interval=0, cache_frame_data=False)
+
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+    anim.event_source.stop()
+    canvas.close()
+    plt.close(fig)
+
+    return frames[0] / seconds
+
+# -- Qt path: TraceView fed by a zero-interval timer
+def run_qt(app, seconds):
+
+    view = TraceView(['CH' + str(ch) for ch in range(num_channels)], [(-1.5, 1.5)] * num_channels, capacity)
+    view.resize(1600, 800)
+    view.show()
+
+    source = SyntheticSource()
+
+    timer = QTimer()
+    timer.timeout.connect(lambda: view.append(source.read()))
+    timer.start(0)
+
+    QTimer.singleShot(int(seconds * 1000), app.quit)
+    app.exec_()
+    timer.stop()
+    view.close()
+
+    return view.frames / seconds
+
+if __name__ == '__main__':
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    print('\n  ' + str(num_channels) + ' channels at ' + str(rate) + 'Hz, ' + str(window_seconds) + 's window, ' + str(seconds) + 's per renderer\n')
+
+    mpl_fps = run_matplotlib(app, seconds)
+    print('  matplotlib FuncAnimation:  ' + '{:.1f}'.format(mpl_fps) + ' fps')
+
+    qt_fps = run_qt(app, seconds)
+    print('  Qt TraceView:              ' + '{:.1f}'.format(qt_fps) + ' fps')
+
+    print('\n  Speed-up: ' + '{:.1f}'.format(qt_fps / mpl_fps if mpl_fps else float('inf')) + 'x\n')
@@ -1,43 +1,94 @@
 '''
-    Simultaneous data acquisition from 2 DAQ devices (USB-1608fs-Plus) and the serial port for user-specified duration at user-specified sampling rate
+    Simultaneous data acquisition from the DAQ devices (USB-1608fs-Plus) of a channel map and the serial port for user-specified duration at user-specified sampling rate
+    Every board runs the same acquisition loop (daq_read) in its own process, a thread or in-loop (source_runner); the default map is
+    the carotid/femoral and chest strap boards
     Saves all data into one or multiple spreadsheets depeding on user-entry
+    Every DAQ scan also passes through a streaming quality monitor; clipping, flat or hum-dominated channels are reported while recording
+    With a trigger description, scans are kept in pre-trigger rings and only the windows around each trigger are saved (event files)
+    The DAQ loops view each UL buffer as a NumPy array and copy every new scan per poll into preallocated blocks;
+    a writer thread per device formats and writes them in large buffered writes
+    Event markers (keys, GUI buttons, API calls) are stamped on the scan's sample clock and saved to a sorted sidecar file
+    Devices report readiness and start acquiring at a common scheduled instant; each scan's start skew is saved next to it
+    Optional progress channel (scans captured, buffer headroom, merge steps) and cancel event for a window running the scan in the background
+    A buffer overrun costs only the scans the board overwrote: they are recorded as a gap, the loop resynchronizes and the merge fills them with NaN
+    Every source logs (sample index, host time) pairs; the merge corrects the clock drift between the sources instead of joining by row alone
 
 '''
 
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
-from ctypes import c_double, cast, POINTER, addressof, sizeof
 from time import sleep
-from mcculw import ul
-from mcculw.enums import ScanOptions, FunctionType, Status
-from mcculw.device_info import DaqDeviceInfo
-from multiprocessing import Barrier, Process
-from tkinter import *
+from contextlib import nullcontext
 import pandas as pd
 import numpy as np
-import time, serial, os, sys
+import time, os, sys
 
 # -- If program log is included
 # from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 try:
-    from console_examples_util import config_first_detected_device
+    from console_examples_util import get_board, release_board
+    from acquisition_tee import ChunkTee
+    from signal_quality import QualityMonitor, report_changes
+    from triggered_capture import from_trigger
+    from event_markers import AnchorClock, listen_keys
+    from start_gate import StartGate, ScanStart, StartAborted, save_start_report
+    from scan_progress import ProgressReporter, post, cancelled
+    from block_writer import BlockWriter, format_rows, file_buffering
+    from ul_transfer import ScanTransfer
+    from scan_gaps import GapLog, gap_file_name, load_gaps, save_gaps, fill_gaps
+    from channel_map import default_map, clock_board, last_channel, board_label, column_names, file_header, device_file_name, sources
+    from source_runner import make_runner, source_modes, arm_and_join
+    from lazy_import import LazyModule
+    import simulated_daq
+    from clock_drift import ClockLog, clock_file_name, fit_sources, source_index, resample, save_drift_report
 except ImportError:
-    from .console_examples_util import config_first_detected_device
+    from .console_examples_util import get_board, release_board
+    from .acquisition_tee import ChunkTee
+    from .signal_quality import QualityMonitor, report_changes
+    from .triggered_capture import from_trigger
+    from .event_markers import AnchorClock, listen_keys
+    from .start_gate import StartGate, ScanStart, StartAborted, save_start_report
+    from .scan_progress import ProgressReporter, post, cancelled
+    from .block_writer import BlockWriter, format_rows, file_buffering
+    from .ul_transfer import ScanTransfer
+    from .scan_gaps import GapLog, gap_file_name, load_gaps, save_gaps, fill_gaps
+    from .channel_map import default_map, clock_board, last_channel, board_label, column_names, file_header, device_file_name, sources
+    from .source_runner import make_runner, source_modes, arm_and_join
+    from .lazy_import import LazyModule
+    from . import simulated_daq
+    from .clock_drift import ClockLog, clock_file_name, fit_sources, source_index, resample, save_drift_report
+
+# -- UL driver and serial port, loaded on first use so simulated boards record without them
+ul = LazyModule('mcculw.ul')
+ul_enums = LazyModule('mcculw.enums')
+serial = LazyModule('serial')
 
 # -- Begin processes for simultaneous data acquisition and save to file
-def read_and_save(rate, buffer_size_seconds, save_option, file_name):
+# -- monitors: optional {source: queue} ({'six': queue, 'two': queue} for the default map) receiving a copy of every scan for live monitoring
+# -- trigger: optional trigger description (see triggered_capture.from_trigger); the session then runs for buffer_size_seconds
+#    and saves one event file per source and trigger instead of the full recording
+# -- markers: optional event_markers.MarkerStream; marker_keys: optional {key: label} hotkeys marking events during the scan
+# -- output_dir: folder for all files (default: the working directory, where the recording processes write)
+# -- columns: optional list of the columns kept in the single-file output (the time column is always kept)
+# -- progress, cancel: optional scan_progress channel (queue and event from scan_channel()) for a window running the scan in the background
+# -- channel_map: boards to record (see channel_map; default_map if None)
+# -- executors: optional {source: 'process' | 'thread' | 'inline'} overriding the map entries' 'executor' (default: a process per source)
+def read_and_save(rate, buffer_size_seconds, save_option, file_name, monitors = None, trigger = None, markers = None, marker_keys = None,
+                  output_dir = None, columns = None, progress = None, cancel = None, channel_map = None, executors = None):
 
 # -- If program log is included
 # def read_and_save(rate, buffer_size_seconds, save_option, file_name, log):
 
-    path = 'C:/Users/Kevin/Desktop/projects/daq/mcculw-master/examples/console/'
+    # -- File names are complete paths, so the recording processes and the merge use the same files
+    if output_dir != None:
+        os.makedirs(output_dir, exist_ok=True)
+        file_name = os.path.join(output_dir, file_name)
+
+    boards = channel_map if channel_map != None else default_map
 
     # -- File name strings
     central_file_name = file_name + ' .csv'
-    six_file_name = file_name + ' -- Chest Strap Piezos .csv'
-    electrode_file_name = file_name + ' -- Electrodes .csv'
-    two_file_name = file_name + ' -- Carotid and Femoral .csv'
     flex_file_name = file_name + ' -- Flex Sensor .csv'
 
     # -- If program log is included
@@ -45,24 +96,76 @@ def read_and_save(rate, buffer_size_seconds, save_option, file_name):
 
     print( '=================================================================\n')
 
-    # -- Start processes for each device
-    synchronizer = Barrier(3)
-    simultaneous_for_6_piezos = Process(target=six_read, args=(synchronizer, rate, buffer_size_seconds,six_file_name))
-    simultaneous_for_2_piezos = Process(target=two_read, args=(synchronizer, rate, buffer_size_seconds, two_file_name))
-    simultaneous_for_flex = Process(target=flex_read, args=(synchronizer, buffer_size_seconds, flex_file_name))
-
-    # -- Record data from ECG electrodes, acoustic and chest strap piezosensors
-    simultaneous_for_6_piezos.start()
+    if monitors == None:
+        monitors = {}
 
-    # -- Record data from carotid and femoral artery piezosensors
-    simultaneous_for_2_piezos.start()
+    # -- One process (or thread, or the current thread) per device; they start acquiring together once all of them are ready
+    gate = StartGate(sources(boards))
+    modes = source_modes(sources(boards), {board['source']: board.get('executor') for board in boards}, executors)
+    # -- The clock board (chest strap piezos and electrode by default) provides the sample clock for event markers
+    clock = clock_board(boards)
+    channel = {'progress': progress, 'cancel': cancel}
+    recorders = [make_runner(modes[board['source']], run_source, (daq_read, ScanStart(gate, file_name, board['source']), board, rate, buffer_size_seconds,
+                                                                 device_file_name(file_name, board), monitors.get(board['source']), trigger,
+                                                                 markers if board is clock else None), channel)
+                 for board in boards]
 
     # -- Record data from the flex sensor
-    simultaneous_for_flex.start()
+    recorders.append(make_runner(modes['flex'], run_source, (flex_read, ScanStart(gate, file_name, 'flex'), buffer_size_seconds, flex_file_name, trigger), channel))
+
+    for recorder in recorders:
+        recorder.start()
+
+    remove_keys = listen_keys(markers, marker_keys) if markers != None and marker_keys else None
+
+    # -- Schedule the common start once every device is ready, then wait for the end of the scan
+    start_at = arm_and_join(gate, file_name, recorders)
+
+    if remove_keys != None:
+        remove_keys()
+
+    if start_at == None:
+        print('  Scan aborted: a device was not ready.\n\n')
+        post(progress, 'done', 'failed', 'a device was not ready')
+        return
+
+    # -- Cancelled: nothing is merged, partial per-device files are removed
+    if cancelled(cancel):
+        device_file_names = [device_file_name(file_name, board) for board in boards]
+        sidecars = [gap_file_name(name) for name in device_file_names] + [clock_file_name(name) for name in device_file_names + [flex_file_name]]
+        for partial_file_name in device_file_names + [flex_file_name] + sidecars:
+            if os.path.exists(partial_file_name):
+                os.remove(partial_file_name)
+        print('  Scan cancelled.\n\n')
+        post(progress, 'done', 'cancelled', '')
+        return
+
+    # -- Start offset of every source from the scheduled instant
+    save_start_report(file_name, gate.offsets(file_name, start_at))
 
-    simultaneous_for_6_piezos.join()
-    simultaneous_for_2_piezos.join()
-    simultaneous_for_flex.join()
+    # -- Event markers next to the main recording (sample index = row of the time column)
+    if markers != None:
+        marked = markers.save(central_file_name if save_option == 1 and trigger == None else device_file_name(file_name, clock), rate)
+        print('  ' + str(marked) + ' event marker(s) saved.\n')
+
+    # -- Triggered session: the event files are the output, there is no continuous recording to merge
+    if trigger != None:
+        print('  Triggered session completed.\n\n')
+        post(progress, 'done', 'saved', 'triggered session')
+        return
+
+    save_recording(rate, buffer_size_seconds, save_option, file_name, columns, progress, boards)
+    post(progress, 'done', 'saved', file_name)
+
+# -- Merge (save_option 1) or split (save_option 2) the per-device files of a finished recording
+# -- progress: optional scan_progress queue receiving ('merge', step, steps)
+# -- channel_map: boards of the recording (default_map if None)
+def save_recording(rate, buffer_size_seconds, save_option, file_name, columns = None, progress = None, channel_map = None):
+
+    boards = channel_map if channel_map != None else default_map
+
+    central_file_name = file_name + ' .csv'
+    flex_file_name = file_name + ' -- Flex Sensor .csv'
 
     # -- Save to CSV
     print('  Saving to file(s) . . .\n')
@@ -70,22 +173,61 @@ def read_and_save(rate, buffer_size_seconds, save_option, file_name):
     # -- If program log is included
     # Label(log, text="Saving to file(s) . . .", anchor='w').grid()
 
-    six_df = pd.read_csv(path + six_file_name)
+    steps = 5 if save_option == 1 else 2
+
+    # -- Device files of every board
+    #    Scans lost to buffer overruns become NaN rows, so row n of every saved file is scan index n
+    board_dfs = {}
+    board_gaps = {}
+    for board in boards:
+        board_file_name = device_file_name(file_name, board)
+        board_dfs[board['source']] = pd.read_csv(board_file_name)
+        board_gaps[board['source']] = load_gaps(board_file_name)
+        if board_gaps[board['source']]:
+            board_dfs[board['source']] = fill_gaps(board_dfs[board['source']], rate, board_gaps[board['source']])
+
+    # -- Clock drift of every source, fitted from the (sample index, host time) pairs it logged; the clock board is the reference
+    device_files = {board['source']: device_file_name(file_name, board) for board in boards}
+    device_files['flex'] = flex_file_name
+    reference = clock_board(boards)['source']
+    rates = dict({source: rate for source in device_files}, flex=100)
+    fits = fit_sources(device_files, rates)
+    if reference in fits and len(fits) > 1:
+        save_drift_report(file_name, fits, reference, rates)
+    post(progress, 'merge', 1, steps)
 
     # -- Save to one file
     if save_option == 1:
 
-        os.remove(path + six_file_name)
+        flex_df = pd.read_csv(flex_file_name)
+        post(progress, 'merge', 2, steps)
 
-        two_df = pd.read_csv(path + two_file_name)
-        flex_df = pd.read_csv(path + flex_file_name)
-        
-        os.remove(path + two_file_name)
-        os.remove(path + flex_file_name)
+        for board in boards:
+            os.remove(device_file_name(file_name, board))
+        os.remove(flex_file_name)
+
+        # -- One gap list for the merged recording
+        gaps = [gap for board in boards for gap in board_gaps[board['source']]]
+        if gaps:
+            save_gaps(central_file_name, gaps, rate)
+            for board in boards:
+                if os.path.exists(gap_file_name(device_file_name(file_name, board))):
+                    os.remove(gap_file_name(device_file_name(file_name, board)))
 
-        isolated_time_col = six_df['Time (s)'].to_frame()
-        isolated_piezode_col = six_df[['Piezo Channel 0 (V)', 'Piezo Channel 1 (V)', 'Piezo Channel 2 (V)', 'Piezo Channel 3 (V)',	'Piezo Channel 4 (V)', 'Piezo Channel 5 (V)','Electrode (V)']]
-        isolated_two_col = two_df[['Carotid Piezo (V)', 'Femoral Piezo (V)']]
+        # -- The drift report replaces the clock logs
+        for device_file in device_files.values():
+            if os.path.exists(clock_file_name(device_file)):
+                os.remove(clock_file_name(device_file))
+
+        isolated_time_col = board_dfs[reference]['Time (s)'].to_frame()
+
+        # -- Every other board resampled onto the clock board's scans (rows taken at the same host instants)
+        if reference in fits:
+            reference_rows = np.arange(len(isolated_time_col))
+            for board in boards:
+                if board['source'] != reference and board['source'] in fits:
+                    board_dfs[board['source']] = resample(board_dfs[board['source']], column_names(board),
+                                                          source_index(fits[reference], fits[board['source']], reference_rows))
 
         isolated_flex_col = flex_df['Angular Displacement (deg)']
         disc_flex_data = []
@@ -96,257 +238,159 @@ def read_and_save(rate, buffer_size_seconds, save_option, file_name):
         while increment <= buffer_size_seconds:
             reference_timestamp.append( increment )
             increment = float('{:.5f}'.format(increment + 1 / rate)) 
-
-        # -- Split continuous flex sensor data
-        index = 0
-        for i in range(len(reference_timestamp)):
-            if (float('{:.5f}'.format(reference_timestamp[i]*100))).is_integer():
-                disc_flex_data.append(isolated_flex_col[index])
-                index += 1
-            else:
-                disc_flex_data.append(' ')
+        post(progress, 'merge', 3, steps)
+
+        # -- Split continuous flex sensor data: each sample on the clock board's row taken at the same host instant (drift corrected)
+        if reference in fits and 'flex' in fits:
+            disc_flex_data = [' '] * len(reference_timestamp)
+            flex_rows = np.round(source_index(fits['flex'], fits[reference], np.arange(len(isolated_flex_col)))).astype(int)
+            for value, row in zip(isolated_flex_col, flex_rows):
+                if 0 <= row < len(disc_flex_data):
+                    disc_flex_data[row] = value
+
+        # -- Without clock logs: every rate/100 rows, for as many samples as the flex sensor returned
+        else:
+            index = 0
+            for i in range(len(reference_timestamp)):
+                if (float('{:.5f}'.format(reference_timestamp[i]*100))).is_integer() and index < len(isolated_flex_col):
+                    disc_flex_data.append(isolated_flex_col[index])
+                    index += 1
+                else:
+                    disc_flex_data.append(' ')
 
         isolated_flex_col = pd.DataFrame(disc_flex_data, columns=['Angular Displacement (deg)'])
-
-        # -- Join all data to one DataFrame
-        central_df = isolated_time_col.join(isolated_two_col).join(isolated_piezode_col).join(isolated_flex_col)
+        post(progress, 'merge', 4, steps)
+
+        # -- Join all data to one DataFrame: time, every board's channels in map order, flex sensor
+        central_df = isolated_time_col
+        for board in boards:
+            central_df = central_df.join(board_dfs[board['source']][column_names(board)])
+        central_df = central_df.join(isolated_flex_col)
+        if columns != None:
+            central_df = central_df[['Time (s)'] + [name for name in columns if name != 'Time (s)']]
         central_df.to_csv(central_file_name, index=False)
+        post(progress, 'merge', 5, steps)
 
     # -- Save to multiple files
     else:
 
-        # -- Separate ECG electrode data from acoustic and chest strap data
-        isolated_columns = six_df[['Time (s)', 'Electrode (V)']]
+        for board in boards:
+            board_df = board_dfs[board['source']]
 
-        # -- Updating acoustic and chest strap DataFrame
-        six_df.drop('Electrode (V)', axis=1, inplace=True)
-        six_df.drop('Unnamed: 8', axis=1, inplace=True)
-        six_df.to_csv(six_file_name, index=False)
+            # -- Separate split channels (ECG electrode by default) into their own files; the gap files stay next to the device files
+            split = board.get('split', {})
+            for channel_name, split_file in split.items():
+                board_df[['Time (s)', channel_name + ' (V)']].to_csv(file_name + ' -- ' + split_file + ' .csv', index=False)
 
-        isolated_columns.to_csv(electrode_file_name, index=False)
+            # -- Updating the device file
+            if split or board_gaps[board['source']]:
+                board_df = board_df[['Time (s)'] + [name + ' (V)' for name in board['channels'] if name not in split]]
+                board_df.to_csv(device_file_name(file_name, board), index=False)
+        post(progress, 'merge', 2, steps)
 
     # -- If program log is included
     # Label(log, text="Save completed.", anchor='w').grid(pady=(0,5))
 
     print('  Save completed.\n\n')
 
-# -- Data acquisition for ECG electrodes, acoustic and chest strap piezosensors
-def six_read(synch, rate, buffer_size_seconds, six_file):
-
-    # -- Wait for serial port connection to occur in the third process
-    sleep(2.2)
-
-    use_device_detection = True
-    dev_id_list = []
-    board_num = 1
-    memhandle = None
-    num_buffers_to_write = 1
-    delay = 1 / rate
-    
-    # -- Configure DAQ device
-    if use_device_detection:
-        config_first_detected_device(board_num, dev_id_list)
-
-    daq_dev_info = DaqDeviceInfo(board_num)
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
-
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
-
-    ai_info = daq_dev_info.get_ai_info()
-    low_chan = 0
-    high_chan = 6
-    num_chans = high_chan - low_chan + 1
-
-    points_per_channel = max(rate * buffer_size_seconds + 1, 10)
-
-    if ai_info.packet_size != 1:
-        packet_size = ai_info.packet_size
-        remainder = points_per_channel % packet_size
-
-        if remainder != 0:
-            points_per_channel += packet_size - remainder
-
-    ul_buffer_count = points_per_channel * num_chans
-
-    # -- Write the UL buffer to the file, num_buffers_to_write times
-    points_to_write = ul_buffer_count * num_buffers_to_write
-
-    # -- When handling the buffer, we will read 7 data points from the buffer at a time
-    write_chunk_size = int(ul_buffer_count / points_per_channel)
-    
-    try:
-        ai_range = ai_info.supported_ranges[0]
-    except IndexError:
-        print('  ERROR: RECONNECT USB\n')
-        sys.exit()
-
-    scan_options = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS | ScanOptions.SCALEDATA)
-    memhandle = ul.scaled_win_buf_alloc(ul_buffer_count)
-
-    # -- Allocate an array of doubles for temporary storage of data
-    write_chunk_array = (c_double * write_chunk_size)()
-
-    # -- Check if the buffer was successfully allocated
-    if not memhandle:
-        raise Exception('Failed to allocate memory')
-    
-    # -- Initiate scan
-    ul.a_in_scan( board_num, low_chan, high_chan, ul_buffer_count, rate, ai_range, memhandle, scan_options)
-    status = Status.IDLE
-
-    # -- Wait for the scan to start fully
-    while status == Status.IDLE:
-        status, _, _ = ul.get_status(board_num, FunctionType.AIFUNCTION)
-
-    # -- Create a file for storing the data
-    with open(six_file, 'w') as f:
-
-        # -- Write a header to the file
-        f.write('Time (s)' + ',')
-
-        for chan_num in range(low_chan, high_chan):
-            f.write('Piezo Channel ' + str(chan_num) + ' (V)'+ ',')
-
-        f.write('Electrode (V)' + ',')    
-        f.write(u'\n')
-
-        # -- Start the write loop
-        prev_count = 0
-        prev_index = 0
-        write_ch_num = low_chan
-
-        # -- Wait for all device configurations/preparations to align in every process
-        synch.wait()
-
-        # print('---------- SIX START:     ', time.time())
-        t=0
+# -- Points per channel of the cycling UL buffer used by triggered sessions (10 seconds, whole packets)
+def ring_points(rate, packet_size):
 
-        # -- Main scan loop
-        while status != Status.IDLE:
+    points = max(10 * rate, 10)
+    if packet_size != 1 and points % packet_size != 0:
+        points += packet_size - points % packet_size
+    return points
 
-            # -- Get the latest counts
-            status, curr_count, _ = ul.get_status(board_num, FunctionType.AIFUNCTION)
-            new_data_count = curr_count - prev_count
+# -- Open the flex sensor's serial port and read past its start-up banner
+def open_flex_port():
 
-            # -- Check for a buffer overrun before copying the data, so that no attempts are made to copy more than a full buffer of data
-            if new_data_count > ul_buffer_count:
-                ul.stop_background(board_num, FunctionType.AIFUNCTION)
-                print('  ERROR: A BUFFER OVERRUN OCCURRED\n')
-                break
-
-            # -- Check if a chunk is available
-            if new_data_count > write_chunk_size:
-
-                wrote_chunk = True
-
-                # -- Copy the current data to a new array
-
-                # -- Check if the data wraps around the end of the UL buffer (multiple copy operations will be required)
-                if prev_index + write_chunk_size > ul_buffer_count - 1:
-
-                    first_chunk_size = ul_buffer_count - prev_index
-                    second_chunk_size = ( write_chunk_size - first_chunk_size )
-                    
-                    # -- Copy the first chunk of data to the write_chunk_array
-                    ul.scaled_win_buf_to_array( memhandle, write_chunk_array, prev_index, first_chunk_size)
-
-                    # -- Create a pointer to the location in write_chunk_array where we want to copy the remaining data
-                    second_chunk_pointer = cast(addressof(write_chunk_array)
-                                                + first_chunk_size
-                                                * sizeof(c_double),
-                                                POINTER(c_double))
-
-                    # -- Copy the second chunk of data to the write_chunk_array
-                    ul.scaled_win_buf_to_array(
-                        memhandle, second_chunk_pointer,
-                        0, second_chunk_size)
-
-                else:
-
-                    # -- Copy the data to the write_chunk_array
-                    ul.scaled_win_buf_to_array(
-                        memhandle, write_chunk_array, prev_index,
-                        write_chunk_size)
-                
-                # -- Check for a buffer overrun just after copying the data from the UL buffer
-                #    This ensures that data was not overwritten in the UL buffer before the copy was completed. 
-                #    This should be done before writing to the file, so that corrupt data does not end up in the file
-                status, curr_count, _ = ul.get_status( board_num, FunctionType.AIFUNCTION )
-                
-                if curr_count - prev_count > ul_buffer_count:
-
-                    # -- Print an error and stop writing
-                    ul.stop_background(board_num, FunctionType.AIFUNCTION)
-                    print('  ERROR: A BUFFER OVERRUN OCCURRED\n')
-                    break
+    # -- Establish serial port connection
+    ser = serial.Serial('COM3', 115200, timeout=1)
+    ser.flushInput()
 
-                f.write(str(t) + ',')
-                t+=delay
+    # -- Readline until successful connection indicator is removed
+    temp_scan = ""
+    while temp_scan != "One Axis ADS initialization succeeded...":
+        temp_scan = ser.readline()
+        try:
+            temp_scan = temp_scan.decode("utf-8")
+            temp_scan = temp_scan[:-2]
+        except UnicodeDecodeError:
+            pass
 
-                # -- Write to file
-                for i in range(write_chunk_size):
-                    f.write(str(write_chunk_array[i]) + ',')
-                    write_ch_num += 1
-                    if write_ch_num == high_chan + 1:
-                        write_ch_num = low_chan
-                        f.write(u'\n')
-            else:
-                wrote_chunk = False
+    print('  Flex Sensor: Connected to COM3 at 115200 baud\n')
+    return ser
 
-            if wrote_chunk:
-                # -- Increment prev_count by the chunk size
-                prev_count += write_chunk_size
+# -- Writer thread behind a DAQ recording loop: rows to the file (or the triggered capture), copies to the live view and the quality monitor
+def start_writer(f, capture, monitor, quality, num_chans, rate):
 
-                # -- Increment prev_index by the chunk size
-                prev_index += write_chunk_size
+    # -- The live view gets a copy of every scan without ever blocking the write
+    tee = ChunkTee(None, monitor) if monitor != None else None
 
-                # -- Wrap prev_index to the size of the UL buffer
-                prev_index %= ul_buffer_count
+    # -- Last reported quality status per channel
+    reported = ['OK'] * num_chans
 
-                if prev_count >= points_to_write:
-                    break
+    def write_block(times, values):
 
-            else:
-                # -- Wait a short amount of time for more data to be acquired.
-                sleep(0.1)
+        if capture != None or tee != None:
+            chunks = list(zip(times.tolist(), values.tolist()))
 
-    # print('---------- SIX DONE:     ', time.time())
+        if capture != None:
+            for chunk in chunks:
+                capture.put(chunk)
+        else:
+            f.write(format_rows(times, values))
 
-    ul.stop_background(board_num, FunctionType.AIFUNCTION)
+        if tee != None:
+            for chunk in chunks:
+                tee.forward(chunk)
 
-    if memhandle:
-        # -- Free the buffer in a finally block to prevent  a memory leak.
-        ul.win_buf_free(memhandle)
+        # -- Streaming signal quality, reported when a channel's status changes
+        windows = quality.windows
+        quality.add_block(values)
+        if quality.windows != windows:
+            report_changes(quality, reported)
 
-    if use_device_detection:
-        # -- Disconnect the DAQ device
-        ul.release_daq_device(board_num)
+    # -- Blocks of a tenth of a second of scans
+    return BlockWriter(num_chans, rate // 10, write_block)
 
-# -- Data acquisition for carotid and femoral artery piezosensors 
-def two_read(synch, rate, buffer_size_seconds, two_file):
+# -- Process target: runs a read function, reporting a failure to the start gate so the other sources do not wait for it
+def run_source(read, start, *args, **kwargs):
 
-    sleep(2.2)
-    use_device_detection = True
-    dev_id_list = []
-    board_num = 0
+    try:
+        read(start, *args, **kwargs)
+    except (Exception, SystemExit):
+        start.fail()
+        raise
+
+# -- Data acquisition for one DAQ board of the channel map (every board runs this loop in its own process)
+# -- board: channel map entry; daq_file: its device file
+# -- start: start_gate.ScanStart shared with the other sources of the scan
+# -- markers: event_markers.MarkerStream, given to the clock board only
+# -- daq_dev_info: board already connected by a scan session (kept connected), None to connect and release it here
+# -- progress, cancel: optional scan_progress channel of the window running the scan
+def daq_read(start, board, rate, buffer_size_seconds, daq_file, monitor = None, trigger = None, markers = None, daq_dev_info = None, progress = None, cancel = None):
+
+    board_num = board['board_num']
     memhandle = None
     num_buffers_to_write = 1
     delay = 1 / rate
-    
-    if use_device_detection:
-        config_first_detected_device(board_num, dev_id_list)
-
-    daq_dev_info = DaqDeviceInfo(board_num)
 
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
+    # -- Simulated board (map entry with 'simulated': true) instead of the UL: the same loop without hardware
+    simulated = board.get('simulated')
+    daq, enums = (simulated_daq.SimulatedDaq(board), simulated_daq) if simulated else (ul, ul_enums)
+    ScanOptions, FunctionType, Status = enums.ScanOptions, enums.FunctionType, enums.Status
 
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+    # -- Configure DAQ device
+    connected_here = daq_dev_info == None and not simulated
+    if connected_here:
+        daq_dev_info = get_board(board_num)
+    elif daq_dev_info == None:
+        daq_dev_info = daq
 
     ai_info = daq_dev_info.get_ai_info()
-    low_chan = 0
-    high_chan = 1
+    low_chan = board['low_chan']
+    high_chan = last_channel(board)
     num_chans = high_chan - low_chan + 1
 
     points_per_channel = max(rate * buffer_size_seconds + 1, 10)
@@ -358,9 +402,14 @@ def two_read(synch, rate, buffer_size_seconds, two_file):
         if remainder != 0:
             points_per_channel += packet_size - remainder
 
+    # -- Write the UL buffer to the file, num_buffers_to_write times
+    points_to_write = points_per_channel * num_chans * num_buffers_to_write
+
+    # -- Triggered sessions can run for hours: cycle through a 10 second UL buffer instead of holding the whole duration
+    if trigger != None:
+        points_per_channel = min(points_per_channel, ring_points(rate, ai_info.packet_size))
+
     ul_buffer_count = points_per_channel * num_chans
-    points_to_write = ul_buffer_count * num_buffers_to_write
-    write_chunk_size = int(ul_buffer_count / points_per_channel)
 
     try:
         ai_range = ai_info.supported_ranges[0]
@@ -369,167 +418,244 @@ def two_read(synch, rate, buffer_size_seconds, two_file):
         sys.exit()
 
     scan_options = (ScanOptions.BACKGROUND | ScanOptions.CONTINUOUS | ScanOptions.SCALEDATA)
-    memhandle = ul.scaled_win_buf_alloc(ul_buffer_count)
-
-    write_chunk_array = (c_double * write_chunk_size)()
+    memhandle = daq.scaled_win_buf_alloc(ul_buffer_count)
 
+    # -- Check if the buffer was successfully allocated
     if not memhandle:
         raise Exception('Failed to allocate memory')
 
-    ul.a_in_scan( board_num, low_chan, high_chan, ul_buffer_count, rate, ai_range, memhandle, scan_options)
-    status = Status.IDLE
+    # -- NumPy view of the UL buffer; each poll copies up to a second of new scans into one preallocated array
+    transfer = ScanTransfer(memhandle, points_per_channel, num_chans, rate)
 
-    while status == Status.IDLE:
-        status, _, _ = ul.get_status(board_num, FunctionType.AIFUNCTION)
+    # -- Header row (time and every channel of the board)
+    header = file_header(board)
 
-    with open(two_file, 'w') as f:
+    # -- Triggered session: scans go to the pre-trigger ring and event files instead of the recording file
+    capture = from_trigger(trigger, board['source'], daq_file, header, num_chans, rate) if trigger != None else None
 
-        f.write('Time (s)' + ',')
-        f.write('Carotid Piezo (V)' + ',')  
-        f.write('Femoral Piezo (V)' + ',')    
-        f.write(u'\n')
-
-        prev_count = 0
-        prev_index = 0
-        write_ch_num = low_chan   
-
-        synch.wait()
+    # -- Create a file for storing the data
+    with open(daq_file, 'w', buffering=file_buffering) if capture == None else nullcontext() as f:
 
-        # ('---------- TWO START:     ', time.time())
-        t=0
+        # -- Write a header to the file
+        if capture == None:
+            f.write(header)
 
-        while status != Status.IDLE:
+        # -- Streaming signal quality of every channel, reported when a channel's status changes
+        quality = QualityMonitor(board['channels'], rate)
 
-            status, curr_count, _ = ul.get_status( board_num, FunctionType.AIFUNCTION )
-            new_data_count = curr_count - prev_count
+        # -- Scans are copied into blocks here and written (and forwarded to the live view) by the writer thread
+        writer = start_writer(f, capture, monitor, quality, num_chans, rate)
 
-            if new_data_count > ul_buffer_count:
-                ul.stop_background(board_num, FunctionType.AIFUNCTION)
-                print('  ERROR: A BUFFER OVERRUN OCCURRED\n')
-                break
+        # -- get_status counts whole packets, so every anchor is corrected by half a packet of scans
+        lag = ai_info.packet_size / num_chans / 2
 
-            if new_data_count > write_chunk_size:
-                wrote_chunk = True
+        # -- Publishes (scan index, time) pairs for event markers (clock board only)
+        clock = AnchorClock(markers, num_chans, lag)
 
-                if prev_index + write_chunk_size > ul_buffer_count - 1:
+        # -- (scan index, host time) pairs of the board's own oscillator, for drift correction in the merge
+        clock_log = ClockLog()
+        drift_clock = AnchorClock(clock_log, num_chans, lag)
 
-                    first_chunk_size = ul_buffer_count - prev_index
-                    second_chunk_size = ( write_chunk_size - first_chunk_size )
+        # -- Scans captured, buffer headroom and writer backlog for the window running the scan
+        reporter = ProgressReporter(progress, board['source'])
 
-                    ul.scaled_win_buf_to_array(
-                        memhandle, write_chunk_array, prev_index,
-                        first_chunk_size)
+        # -- Scans lost to buffer overruns
+        gaps = GapLog(board['source'], num_chans, ul_buffer_count, points_to_write // num_chans)
 
-                    second_chunk_pointer = cast(addressof(write_chunk_array)
-                                                + first_chunk_size
-                                                * sizeof(c_double),
-                                                POINTER(c_double))
+        # -- Start the write loop
+        prev_count = 0
 
-                    ul.scaled_win_buf_to_array(
-                        memhandle, second_chunk_pointer,
-                        0, second_chunk_size)
-                else:
-                    ul.scaled_win_buf_to_array(
-                        memhandle, write_chunk_array, prev_index,
-                        write_chunk_size)
+        # -- Board configured and buffer allocated: wait for the start instant shared by every process
+        start.ready()
+        try:
+            start.wait()
+        except StartAborted:
+            writer.close()
+            daq.win_buf_free(memhandle)
+            if connected_here:
+                release_board(board_num)
+            raise
+
+        # -- Initiate scan
+        daq.a_in_scan( board_num, low_chan, high_chan, ul_buffer_count, rate, ai_range, memhandle, scan_options)
+        start.started(time.perf_counter())
+
+        # -- The device is stopped, its buffer freed and the board released however the loop ends (cancel, writer failure, error)
+        try:
+            status = Status.IDLE
 
-                status, curr_count, _ = ul.get_status( board_num, FunctionType.AIFUNCTION )
+            # -- Wait for the scan to start fully
+            while status == Status.IDLE:
+                status, _, _ = daq.get_status(board_num, FunctionType.AIFUNCTION)
 
-                if curr_count - prev_count > ul_buffer_count:
+            # -- Main scan loop
+            while status != Status.IDLE:
 
-                    ul.stop_background(board_num, FunctionType.AIFUNCTION)
-                    print('  ERROR: A BUFFER OVERRUN OCCURRED\n')
+                # -- Stop cleanly when the scan is cancelled or the writer thread failed (its error is raised by writer.close())
+                if cancelled(cancel) or writer.error != None:
                     break
 
-                f.write(str(t) + ',')
-                t+=delay
+                # -- Get the latest counts
+                status, curr_count, _ = daq.get_status(board_num, FunctionType.AIFUNCTION)
+                clock.update(curr_count)
+                drift_clock.update(curr_count)
+                new_data_count = curr_count - prev_count
+
+                # -- Check for a buffer overrun before copying the data, so that no attempts are made to copy more than a full buffer of data
+                #    The overwritten scans are recorded as a gap and the copy resumes from scans still in the buffer
+                if new_data_count > ul_buffer_count:
+                    prev_count = gaps.resync(prev_count // num_chans, curr_count) * num_chans
+                    new_data_count = curr_count - prev_count
+                    if prev_count >= points_to_write:
+                        break
+
+                # -- Whole scans acquired since the last copy, at most one staging array and never past the end of the recording
+                new_scans = min(new_data_count // num_chans, transfer.max_scans, (points_to_write - prev_count) // num_chans)
+
+                if new_scans > 0:
+
+                    # -- Copy the new scans out of the UL buffer (two slices when they wrap around its end)
+                    first_scan = prev_count // num_chans
+                    scans = transfer.read(first_scan, new_scans)
+
+                    # -- Check for a buffer overrun just after copying the data from the UL buffer
+                    #    This ensures that data was not overwritten in the UL buffer before the copy was completed. 
+                    #    This should be done before writing to the file, so that corrupt data does not end up in the file
+                    status, curr_count, _ = daq.get_status( board_num, FunctionType.AIFUNCTION )
+                
+                    if curr_count - prev_count > ul_buffer_count:
 
-                for i in range(write_chunk_size):
-                    f.write(str(write_chunk_array[i]) + ',')
-                    write_ch_num += 1
+                        # -- Drop the scans overwritten during the copy (recorded as a gap)
+                        intact = gaps.intact_from(first_scan, curr_count)
+                        scans = scans[intact - first_scan:]
+                    else:
+                        intact = first_scan
 
-                    if write_ch_num == high_chan + 1:
-                        write_ch_num = low_chan
-                        f.write(u'\n')
-            else:
-                wrote_chunk = False
+                    # -- Hand the scans to the writer thread (file, live view, quality monitor)
+                    writer.add_block(np.arange(intact, first_scan + new_scans) * delay, scans)
 
-            if wrote_chunk:
+                    # -- Move prev_count past the scans copied, or past the lost ones if the overrun reached beyond them
+                    prev_count = max(intact, first_scan + new_scans) * num_chans
 
-                prev_count += write_chunk_size
-                prev_index += write_chunk_size
-                prev_index %= ul_buffer_count
+                    reporter.update(prev_count // num_chans, 1 - (curr_count - prev_count) / ul_buffer_count, writer.depth)
 
-                if prev_count >= points_to_write:
-                    break
-            else:
-                sleep(0.1)
+                    if prev_count >= points_to_write:
+                        break
 
-    #print('---------- TWO DONE:     ', time.time())
+                else:
+                    # -- Caught up: let the writer have the partial block, then wait a short amount of time for more data to be acquired.
+                    writer.flush()
+                    sleep(0.1)
 
-    ul.stop_background(board_num, FunctionType.AIFUNCTION)
+            # -- Write the remaining blocks before the file is closed (raises the error of a failed writer)
+            writer.close()
 
-    if memhandle:
-        ul.win_buf_free(memhandle)
+        finally:
+            daq.stop_background(board_num, FunctionType.AIFUNCTION)
 
-    if use_device_detection:
-        ul.release_daq_device(board_num)
+            # -- Free the buffer in a finally block to prevent  a memory leak.
+            daq.win_buf_free(memhandle)
 
-# -- Data acquisition for flex sensor
-def flex_read(synch, buffer_size_seconds, flex_file):
+            if connected_here:
+                # -- Disconnect the DAQ device
+                release_board(board_num)
 
-    # -- Establish serial port connection
-    ser = serial.Serial('COM3', 115200, timeout=1)
-    ser.flushInput()
+    reporter.update(prev_count // num_chans, force=True)
+    if writer.extra_blocks:
+        print('  ' + board_label(board) + ' writer fell behind by up to', writer.max_depth, 'blocks.\n')
 
-    # -- Readline until successful connection indicator is removed
-    temp_scan = ""
-    while temp_scan != "One Axis ADS initialization succeeded...":
-        temp_scan = ser.readline()
-        try:
-            temp_scan = temp_scan.decode("utf-8")
-            temp_scan = temp_scan[:-2]
-        except UnicodeDecodeError:
-            pass
+    # -- Lost scan ranges next to the device file
+    gaps.save(daq_file, rate)
+    # -- Clock log next to the device file (a triggered session has no continuous recording to correct)
+    if capture == None:
+        clock_log.save(daq_file)
+    else:
+        capture.close()
 
-    print('  Flex Sensor: Connected to COM3 at 115200 baud\n')
+# -- Data acquisition for flex sensor
+# -- ser: serial port already opened by a scan session (kept open), None to open and close it here
+def flex_read(start, buffer_size_seconds, flex_file, trigger = None, ser = None, progress = None, cancel = None):
 
-    digital_data = np.array([])
-    flex_timestamp = np.array([])
+    opened_here = ser == None
+    if opened_here:
+        ser = open_flex_port()
+
+    # -- Raw serial lines, decoded once the scan ends (appending to a list keeps each read O(1) over hour-long scans)
+    digital_data = []
     print('  Scanning . . .\n')
 
-    synch.wait()
+    # -- Banner consumed: wait for the start instant shared by every process
+    start.ready()
+    try:
+        started = start.wait()
+    except StartAborted:
+        if opened_here:
+            ser.close()
+        raise
+
+    # -- Drop lines buffered while waiting (or since the previous scan) and the partial line after them
+    ser.reset_input_buffer()
+    ser.readline()
+    start.started(time.perf_counter())
+
+    # -- Triggered session: parse each line as it arrives and keep it in the pre-trigger ring (about 100 samples/s)
+    if trigger != None:
+        capture = from_trigger(trigger, 'flex', flex_file, 'Time (s)' + ',' + 'Angular Displacement (deg)' + ',' + u'\n', 1, 100)
+
+        # -- Stamped in seconds from the shared start instant (perf_counter), the time origin of the DAQ boards' scan index
+        while time.perf_counter() - started <= buffer_size_seconds and not cancelled(cancel):
+            try:
+                value = float(ser.readline().decode('utf-8').strip())
+            except (UnicodeDecodeError, ValueError):
+                continue
+            capture.put((time.perf_counter() - started, [value]))
+
+        capture.close()
+        if opened_here:
+            ser.close()
+        return
 
     #print( ' --------- FLEX START: ', time.time())
 
     # -- Begin scan for duration
     te = time.time() + buffer_size_seconds
+    reporter = ProgressReporter(progress, 'flex')
 
-    while time.time() <= te:
-        digital_data = np.append(digital_data, ser.readline().decode('utf-8'))
+    # -- (sample index, host time) pairs of the Arduino's clock, for drift correction in the merge
+    clock_log = ClockLog()
+    drift_clock = AnchorClock(clock_log, 1)
+
+    while time.time() <= te and not cancelled(cancel):
+        line = ser.readline()
+
+        # -- Anchor the line's arrival before any other work, so processing time does not enter the clock log
+        drift_clock.update(len(digital_data) + 1)
+        digital_data.append(line)
+        reporter.update(len(digital_data))
         
     print('  Scan completed in', '{:.1f}'.format(time.time() - (te - buffer_size_seconds)), 'seconds. \n')   
+    reporter.update(len(digital_data), force=True)
 
     # -- Close serial port connection
-    ser.close()
-    del ser
+    if opened_here:
+        ser.close()
+        del ser
 
-    # -- Catch slight time error
-    if(len(digital_data) != 100 * buffer_size_seconds + 1):
-        print('  ERROR: FLEX SENSOR DATA ACQUISITION FAILED. RUN THE SCAN AGAIN.\n')
-        sys.exit()
+    if cancelled(cancel):
+        return
+
+    # -- The Arduino's clock does not match the host's, so the sample count varies around 100 per second
+    #    The merge places the samples by the clock log, not by count
+    if len(digital_data) != 100 * buffer_size_seconds + 1:
+        print('  Flex sensor: ' + str(len(digital_data)) + ' samples read (' + str(100 * buffer_size_seconds + 1) + ' nominal).\n')
 
     # -- Process acquired data
-    increment = 0
-    for i in range(len(digital_data)):
-        digital_data[i] = digital_data[i].strip()
+    digital_data = [line.decode('utf-8').strip() for line in digital_data]
 
-    # -- Create timestamp column for flex sensor
-    increment = 0
-    while increment <= buffer_size_seconds:
-        flex_timestamp = np.append(flex_timestamp, increment)
-        increment = float('{:.5f}'.format(increment + 0.01))
+    # -- Timestamp column for flex sensor: nominal 100Hz from the samples read
+    flex_timestamp = np.round(np.arange(len(digital_data)) * 0.01, 5)
 
     # -- Export to temporary CSV
     temp_df = pd.DataFrame({'Time (s)' : flex_timestamp, 'Angular Displacement (deg)': digital_data})
     temp_df.to_csv(flex_file, index=False)
+    clock_log.save(flex_file)
@@ -0,0 +1,283 @@
+'''
+    Live plot window running in its own process
+    The control process writes samples into per-channel rings in shared memory; the plot process only reads them
+    A duplex pipe carries commands to the plot process ('pause', 'resume', 'stop') and reports back when its window is closed
+    Rendering therefore never blocks the control window and does not compete with it for the GIL
+    Given window_seconds, channels are drawn against their sample times on a shared seconds axis, so sources with different rates stay aligned
+    Given the channels' sample rates, a QualityMonitor per channel auto-scales its y-axis and shows its status (clipping, flat, mains hum)
+
+'''
+
+from multiprocessing import Pipe, Process, shared_memory
+from threading import Thread
+import numpy as np
+import time
+
+try:
+    from acquisition_tee import poll_monitor
+    from signal_quality import QualityMonitor
+except ImportError:
+    from .acquisition_tee import poll_monitor
+    from .signal_quality import QualityMonitor
+
+# -- Per-channel sample rings in shared memory (one writer process, any number of reader processes)
+class SharedTraceBuffer:
+    def __init__(self, num_channels, capacity, name = None):
+
+        self.num_channels = num_channels
+        self.capacity = capacity
+
+        # -- Layout: one int64 write counter per channel, followed by the (channels, capacity) float64 samples and their times
+        size = num_channels * 8 + 2 * num_channels * capacity * 8
+        self.owner = name == None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.name = self.shm.name
+
+        self.write_counts = np.ndarray((num_channels,), dtype=np.int64, buffer=self.shm.buf)
+        self.samples = np.ndarray((num_channels, capacity), dtype=np.float64, buffer=self.shm.buf, offset=num_channels * 8)
+        self.times = np.ndarray((num_channels, capacity), dtype=np.float64, buffer=self.shm.buf, offset=num_channels * 8 + num_channels * capacity * 8)
+
+        if self.owner:
+            self.write_counts[:] = 0
+            self.samples[:] = 0
+            self.times[:] = np.nan
+
+    # -- Writer: append values (and optionally their times in seconds) to one channel
+    def push(self, ch, values, times = None):
+
+        count = len(values)
+        if count == 0:
+            return
+        if count > self.capacity:
+            values = values[-self.capacity:]
+            if times is not None:
+                times = times[-self.capacity:]
+
+        start = int(self.write_counts[ch])
+        index = (start + np.arange(len(values))) % self.capacity
+        self.samples[ch, index] = values
+        if times is not None:
+            self.times[ch, index] = times
+
+        # -- Publish after the samples are in place
+        self.write_counts[ch] = start + count
+
+    # -- Reader: copy the last `length` samples of one channel into out (oldest first), returns the write count
+    #    times_out, if given, receives the matching sample times
+    def latest(self, ch, out, times_out = None):
+
+        end = int(self.write_counts[ch])
+        length = len(out)
+        index = (end - length + np.arange(length)) % self.capacity
+        np.take(self.samples[ch], index, out=out)
+        if times_out is not None:
+            np.take(self.times[ch], index, out=times_out)
+        return end
+
+    def close(self):
+
+        # -- Drop the array views before releasing the mapping
+        self.write_counts = None
+        self.samples = None
+        self.times = None
+        self.shm.close()
+
+        if self.owner:
+            self.shm.unlink()
+
+# -- Control-process handle of a plot process
+class LivePlotProcess:
+    #    rates: sample rate of each channel, enabling quality monitoring; limits: each channel's input limits (None: no clipping check)
+    def __init__(self, labels, y_ranges, plot_limit, time_base, nrows, ncols, title = 'Live Plot', window_seconds = None, rates = None, limits = None):
+
+        self.buffer = SharedTraceBuffer(len(labels), plot_limit)
+        self.commands, child_commands = Pipe()
+
+        # -- Sample times are sent as seconds from this instant (perf_counter)
+        self.origin = time.perf_counter()
+
+        self.process = Process(target=render_main, args=(self.buffer.name, labels, y_ranges, plot_limit, time_base, nrows, ncols, title, child_commands, window_seconds, rates, limits), daemon=True)
+        self.process.start()
+
+        # -- Feeder thread moving samples from local queues into shared memory
+        self.feeding = False
+        self.feeder_thread = None
+        self.window_closed = False
+
+    # -- Write one channel's new samples (callable from any single thread of the control process)
+    #    times: perf_counter acquisition times, needed when the plot has a time axis (window_seconds)
+    def push(self, ch, values, times = None):
+        self.buffer.push(ch, values, None if times is None else np.asarray(times) - self.origin)
+
+    # -- Forward samples to the plot process from a feeder thread
+    #    collect() returns (channel, new values) or (channel, new values, times) tuples, e.g. drained SampleProducer queues or recording monitor chunks
+    def feed_from(self, collect, period = 0.01):
+
+        self.feeding = True
+
+        def feed():
+            while self.feeding:
+                for item in collect():
+                    self.push(*item)
+                time.sleep(period)
+
+        self.feeder_thread = Thread(target=feed, daemon=True)
+        self.feeder_thread.start()
+
+    # -- 'pause', 'resume' or 'stop'
+    def send(self, command):
+        if self.process.is_alive():
+            try:
+                self.commands.send(command)
+            except (BrokenPipeError, OSError):
+                pass
+
+    # -- Non-blocking check from the control GUI event loop
+    def is_closed(self):
+
+        try:
+            while self.commands.poll():
+                if self.commands.recv() == 'closed':
+                    self.window_closed = True
+
+        # -- Plot process exited without reporting (e.g. it failed to open a window)
+        except (EOFError, OSError):
+            self.window_closed = True
+
+        return self.window_closed or not self.process.is_alive()
+
+    # -- Stop the feeder, close the window if still open and release shared memory
+    def close(self):
+
+        self.feeding = False
+        if self.feeder_thread != None:
+            self.feeder_thread.join()
+
+        self.send('stop')
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.buffer.close()
+
+# -- collect() for feed_from reading recording monitor queues (see acquisition_tee)
+#    monitors: list of (queue, first plot channel, number of channels) for each recording source
+def monitor_collector(monitors):
+
+    def collect():
+        pairs = []
+        for monitor, first_ch, num_chans in monitors:
+            chunks = poll_monitor(monitor)
+            if chunks:
+                block = np.array([values[:num_chans] for t, values in chunks])
+                for i in range(num_chans):
+                    pairs.append((first_ch + i, block[:, i]))
+        return pairs
+
+    return collect
+
+# -- Entry point of the plot process
+def render_main(shm_name, labels, y_ranges, plot_limit, time_base, nrows, ncols, title, commands, window_seconds = None, rates = None, limits = None):
+
+    # -- matplotlib is only imported here, so the control process never loads a GUI backend for plotting
+    import matplotlib
+    matplotlib.use('Qt5Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.animation as animation
+
+    buffer = SharedTraceBuffer(len(labels), plot_limit, name=shm_name)
+    paused = [False]
+    close_timer = [None]
+
+    # -- matplotlib graph properties
+    fig, axes = plt.subplots(nrows=nrows, ncols=ncols, sharex=True, squeeze=False, figsize=(20, 2 * nrows + 2))
+    fig.canvas.manager.set_window_title(title)
+    axes = axes.flatten()
+
+    # -- x is the sample index, or each channel's sample times (s) when plotting against time
+    x = np.arange(plot_limit)
+    traces = [np.zeros(plot_limit) for ch in labels]
+    times = [np.full(plot_limit, np.nan) for ch in labels]
+    graphs = []
+
+    for ch, label in enumerate(labels):
+        axes[ch].set_xlim([0, plot_limit] if window_seconds == None else [0, window_seconds])
+        if y_ranges[ch] != None:
+            axes[ch].set_ylim(y_ranges[ch])
+        graphs.append(axes[ch].plot([], [], label=label, linewidth=0.5)[0])
+        axes[ch].legend(loc="upper left")
+
+    # -- Per-channel quality monitors fed with the samples that arrived since the previous frame
+    quality = None
+    if rates != None:
+        quality = [QualityMonitor([label], rates[ch], None if limits == None else [limits[ch]]) for ch, label in enumerate(labels)]
+        seen = [0] * len(labels)
+        status_labels = [axes[ch].text(0.99, 0.95, '', transform=axes[ch].transAxes, ha='right', va='top', fontsize=8) for ch in range(len(labels))]
+
+    def check_quality(ch, count):
+
+        new = min(count - seen[ch], plot_limit)
+        seen[ch] = count
+        if new <= 0:
+            return
+
+        monitor = quality[ch]
+        monitor.add_block(traces[ch][-new:])
+
+        y_limits = monitor.y_limits(0)
+        if y_limits != None:
+            axes[ch].set_ylim(y_limits)
+
+        status = monitor.status(0)
+        status_labels[ch].set_text(monitor.summary(0) if status != 'WAITING' else '')
+        status_labels[ch].set_color('black' if status == 'OK' else 'red')
+
+    # -- Apply commands, then copy the latest window of every channel out of shared memory
+    def update_frame(frame):
+
+        while commands.poll():
+            command = commands.recv()
+            if command == 'stop':
+                # -- Close outside the animation callback, which must not tear down its own timer
+                close_timer[0] = fig.canvas.new_timer(interval=1)
+                close_timer[0].single_shot = True
+                close_timer[0].add_callback(plt.close, fig)
+                close_timer[0].start()
+                return
+            paused[0] = command == 'pause'
+
+        if paused[0]:
+            return
+
+        # -- Time axis: every channel against its own sample times, the window ending at the newest sample of any channel
+        newest = np.nan
+        for ch, graph in enumerate(graphs):
+            if window_seconds == None:
+                count = buffer.latest(ch, traces[ch])
+                graph.set_data(x, traces[ch])
+            else:
+                count = buffer.latest(ch, traces[ch], times[ch])
+                if count:
+                    newest = np.fmax(newest, times[ch][-1])
+                graph.set_data(times[ch], traces[ch])
+
+            if quality != None:
+                check_quality(ch, count)
+
+        if not np.isnan(newest):
+            axes[0].set_xlim([newest - window_seconds, newest])
+
+    anim = animation.FuncAnimation(fig, update_frame, interval=time_base, cache_frame_data=False)
+
+    fig.tight_layout()
+    mng = plt.get_current_fig_manager()
+    mng.window.showMaximized()
+    plt.show()
+
+    # -- Window closed (by the user or a 'stop' command)
+    try:
+        commands.send('closed')
+    except (BrokenPipeError, OSError):
+        pass
+
+    buffer.close()
@@ -0,0 +1,139 @@
+'''
+    Qt-native live trace renderer for the PyQt5 windows
+    Draws multi-channel traces straight from NumPy sample buffers with QPainter, bypassing matplotlib's Agg rasterizer
+    Each channel keeps a fixed-capacity sample history and a fixed-capacity QPolygonF vertex buffer that is written in place
+    When more samples are visible than there are pixel columns, each column is reduced to its min/max pair (peaks are never lost)
+
+'''
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+import numpy as np
+
+# -- Trace colours (matplotlib default cycle, so both renderers look alike)
+trace_colours = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b', '#e377c2', '#7f7f7f']
+
+# -- Largest number of vertices drawn per channel (two per pixel column on a 4K-wide trace)
+max_vertices = 8192
+
+# -- QPolygonF whose point storage is exposed as a writable (n, 2) float64 array
+def vertex_buffer(capacity):
+
+    polygon = QtGui.QPolygonF(capacity)
+    pointer = polygon.data()
+    pointer.setsize(capacity * 2 * 8)
+    vertices = np.frombuffer(pointer, dtype=np.float64).reshape(capacity, 2)
+
+    return polygon, vertices
+
+# -- Stacked live traces, one row per channel
+class TraceView(QtWidgets.QWidget):
+    def __init__(self, labels, y_ranges, capacity, parent = None):
+
+        QtWidgets.QWidget.__init__(self, parent)
+
+        # -- Channel properties
+        self.labels = labels
+        self.y_ranges = y_ranges
+        self.num_channels = len(labels)
+
+        # -- Sample history: the last capacity samples of every channel, oldest first
+        self.capacity = capacity
+        self.samples = np.zeros((self.num_channels, capacity))
+
+        # -- One preallocated vertex buffer per channel
+        self.polygons = []
+        self.vertices = []
+        for ch in range(self.num_channels):
+            polygon, vertices = vertex_buffer(max_vertices)
+            self.polygons.append(polygon)
+            self.vertices.append(vertices)
+
+        # -- Decimation scratch space, sized on the first paint and on every resize
+        self.columns = 0
+        self.bin_starts = None
+
+        # -- Rendered frame counter (used by the benchmark)
+        self.frames = 0
+
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
+        self.setMinimumHeight(60 * self.num_channels)
+
+    # -- Append a (scans, channels) block of new samples, scrolling the history left
+    def append(self, block):
+
+        count = len(block)
+        if count == 0:
+            return
+        if count >= self.capacity:
+            self.samples[:] = block[-self.capacity:].T
+        else:
+            self.samples[:, :-count] = self.samples[:, count:]
+            self.samples[:, -count:] = block.T
+
+        self.update()
+
+    # -- Recompute pixel column bins when the width changes
+    def resizeEvent(self, event):
+        self.columns = 0
+        QtWidgets.QWidget.resizeEvent(self, event)
+
+    def prepare_columns(self, width):
+
+        self.columns = min(width, max_vertices // 2)
+        self.bin_starts = np.linspace(0, self.capacity, self.columns + 1).astype(np.intp)[:-1]
+
+    # -- Fill a channel's vertex buffer for a trace drawn in rect, returns the number of vertices used
+    def fill_vertices(self, ch, rect):
+
+        vertices = self.vertices[ch]
+        data = self.samples[ch]
+        y_min, y_max = self.y_ranges[ch]
+        y_scale = rect.height() / (y_max - y_min)
+
+        # -- Fewer samples than two per column: draw every sample
+        if self.capacity <= 2 * self.columns:
+            used = self.capacity
+            vertices[:used, 0] = np.linspace(rect.left(), rect.right(), used)
+            np.multiply(y_max - data, y_scale, out=vertices[:used, 1])
+
+        # -- Otherwise one min/max pair per pixel column
+        else:
+            used = 2 * self.columns
+            column_x = rect.left() + np.arange(self.columns) * (rect.width() / self.columns)
+            vertices[0:used:2, 0] = column_x
+            vertices[1:used:2, 0] = column_x
+            np.multiply(y_max - np.maximum.reduceat(data, self.bin_starts), y_scale, out=vertices[0:used:2, 1])
+            np.multiply(y_max - np.minimum.reduceat(data, self.bin_starts), y_scale, out=vertices[1:used:2, 1])
+
+        vertices[:used, 1] += rect.top()
+
+        # -- Park the unused tail of the fixed-size buffer on the last vertex (zero-length segments draw nothing)
+        vertices[used:] = vertices[used - 1]
+        return used
+
+    def paintEvent(self, event):
+
+        if self.columns == 0:
+            self.prepare_columns(self.width())
+
+        painter = QtGui.QPainter(self)
+        painter.fillRect(self.rect(), QtCore.Qt.white)
+
+        row_height = self.height() / self.num_channels
+
+        for ch in range(self.num_channels):
+            rect = QtCore.QRectF(0, ch * row_height + 2, self.width(), row_height - 4)
+
+            # -- Axis frame and label
+            painter.setPen(QtGui.QPen(QtCore.Qt.lightGray))
+            painter.drawRect(rect)
+            painter.setPen(QtGui.QPen(QtCore.Qt.black))
+            painter.drawText(rect.adjusted(6, 4, 0, 0), QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop, self.labels[ch])
+
+            # -- Trace
+            self.fill_vertices(ch, rect)
+            painter.setPen(QtGui.QPen(QtGui.QColor(trace_colours[ch % len(trace_colours)]), 0))
+            painter.drawPolyline(self.polygons[ch])
+
+        painter.end()
+        self.frames += 1
@@ -1,5 +1,6 @@
 '''
-    Interactive GUI window with real-time plot and data acquisition functionalities (not concurrently)
+    Interactive GUI window with real-time plot and data acquisition functionalities
+    While recording, the live plot is fed from the same acquisition stream that is written to disk
     
 '''
 
@@ -22,8 +23,12 @@ import pandas as pd
 import numpy as np
 try:
     from console_examples_util import config_first_detected_device
+    from acquisition_tee import ChunkTee
+    from qt_trace_view import TraceView
 except ImportError:
     from .console_examples_util import config_first_detected_device
+    from .acquisition_tee import ChunkTee
+    from .qt_trace_view import TraceView
 
 import matplotlib
 matplotlib.use('Qt5Agg')
@@ -36,7 +41,7 @@ from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Navigatio
 
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import pyqtSlot, QThread
+from PyQt5.QtCore import pyqtSlot, QThread, QTimer
 
 anim0 = ''
 anim1 = ''
@@ -99,9 +104,33 @@ class DAQ():
         self.data = collections.deque([0] * 100, maxlen=100)
         self.plotMaxLength = 100
 
-    def save_get_value(self, frame, lines):
-        self.data.append(self.write_chunk_array[0])
-        lines.set_data(range(self.plotMaxLength), self.data)
+        # recording inits: every scan is teed to the file and to the live view (which may drop scans, never the file)
+        self.scan_file = None
+        self.scan_thread = None
+        self.tee = ChunkTee(self.write_scan)
+        self.monitor_data = [collections.deque([0] * self.plotMaxLength, maxlen=self.plotMaxLength) for ch in range(self.num_chans)]
+
+    # writer side of the tee, runs in the recording thread
+    def write_scan(self, chunk):
+        t, values = chunk
+        self.scan_file.write(str(t) + ',')
+        for value in values:
+            self.scan_file.write(str(value) + ',')
+        self.scan_file.write(u'\n')
+
+    # live view side of the tee: plots every scan the recording thread has handed over since the last frame
+    def monitor_get_value(self, frame, lines):
+        for t, values in self.tee.poll():
+            for ch, data in enumerate(self.monitor_data):
+                data.append(values[ch])
+        for line, data in zip(lines, self.monitor_data):
+            line.set_data(range(self.plotMaxLength), data)
+
+    # record in the background so the window (and the live view) stay responsive
+    def start_recording(self):
+        if self.scan_thread == None or not self.scan_thread.is_alive():
+            self.scan_thread = Thread(target=self.six_read, daemon=True)
+            self.scan_thread.start()
 
     def six_read(self): #synch
         ul.a_in_scan( self.board_num, self.low_chan, self.high_chan, self.ul_buffer_count, self.rate, self.ai_range, self.memhandle, self.scan_options)
@@ -113,6 +142,8 @@ class DAQ():
         
         # Create a file for storing the data
         with open( datetime.now().strftime('%Y-%m-%d %H;%M;%S') + ' .csv', 'w') as f:
+            self.scan_file = f
+
             # Write a header to the file
             f.write('Time (s)' + ',')
             for chan_num in range(self.low_chan, self.high_chan):
@@ -123,7 +154,6 @@ class DAQ():
             # Start the write loop
             prev_count = 0
             prev_index = 0
-            write_ch_num = self.low_chan
 
             #synch.wait()
             print('---------- SIX START:     ', time())
@@ -162,9 +192,6 @@ class DAQ():
                     else:
                         ul.scaled_win_buf_to_array(self.memhandle, self.write_chunk_array, prev_index,self.write_chunk_size)
 
-                    #self.data.append(self.write_chunk_array[0])
-                    #lines0.set_data(range(self.plotMaxLength), self.data)
-                
                     # Check for a buffer overrun just after copying the data from the UL buffer. This will ensure that the data was not overwritten in the UL buffer before the copy was
                     # completed. This should be done before writing to the file, so that corrupt data does not end up in it.
                     status, curr_count, _ = ul.get_status(self.board_num, FunctionType.AIFUNCTION)
@@ -174,15 +201,8 @@ class DAQ():
                         ul.stop_background(self.board_num, FunctionType.AIFUNCTION)
                         print('  ERROR: A BUFFER OVERRUN OCCURRED\n')
                         break
-                    f.write(str(t) + ',')
+                    self.tee.put((t, self.write_chunk_array[:self.write_chunk_size]))
                     t+=self.delay
-
-                    for i in range(self.write_chunk_size):
-                        f.write(str(self.write_chunk_array[i]) + ',')
-                        write_ch_num += 1
-                        if write_ch_num == self.high_chan + 1:
-                            write_ch_num = self.low_chan
-                            f.write(u'\n')
                 else:
                     wrote_chunk = False
                 if wrote_chunk:
@@ -201,20 +221,33 @@ class DAQ():
         print('---------- SIX DONE:     ', time())
         ul.stop_background(self.board_num, FunctionType.AIFUNCTION)
 
-    def plot_get_value(self, frame, lines, ch):
+    def read_channel(self, ch):
         if self.ai_info.resolution <= 16:
             # Use the a_in method for devices with a resolution <= 16
             raw_value = ul.a_in(self.board_num, ch, self.ai_range)
-            value = ul.to_eng_units(self.board_num, self.ai_range, raw_value)
+            return ul.to_eng_units(self.board_num, self.ai_range, raw_value)
         else:
             # Use the a_in_32 method for devices with a resolution > 16
             raw_value = ul.a_in_32(self.board_num, ch, self.ai_range)
-            value= ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
-         
+            return ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
+
+    def plot_get_value(self, frame, lines, ch):
+        value = self.read_channel(ch)
         self.data.append(value)    # we get the latest data point and append it to our array
         lines.set_data(range(self.plotMaxLength), self.data)
 
+    # new samples for the Qt renderer as a (scans, channels) block: the recording stream while recording, otherwise one polled scan
+    def get_block(self, chs):
+        if self.scan_thread != None and self.scan_thread.is_alive():
+            chunks = self.tee.poll()
+            return np.array([[values[ch] for ch in chs] for t, values in chunks]).reshape(len(chunks), len(chs))
+        return np.array([[self.read_channel(ch) for ch in chs]])
+
     def close(self):
+        # end a recording still in progress before freeing its buffer
+        if self.scan_thread != None and self.scan_thread.is_alive():
+            ul.stop_background(self.board_num, FunctionType.AIFUNCTION)
+            self.scan_thread.join()
         if self.memhandle:
             # Free the buffer in a finally block to prevent  a memory leak.
             ul.win_buf_free(self.memhandle)
@@ -228,12 +261,12 @@ def onClick(event):
 
 def animate():
     global animQ
-    print('here')
-    animQ = animation.FuncAnimation(fig, d1.save_get_value, fargs=(lines0,), interval=100)
+    animQ = animation.FuncAnimation(fig, d1.monitor_get_value, fargs=([lines0, lines1],), interval=100)
     fig.canvas.draw()
 
+# renderer: 'matplotlib' (FuncAnimation on the embedded figure) or 'qt' (QPainter traces drawn straight from NumPy buffers)
 class ScrollableWindow(QtWidgets.QMainWindow):
-    def __init__(self, fig):
+    def __init__(self, fig, renderer='matplotlib'):
         self.qapp = QtWidgets.QApplication([])
 
         QtWidgets.QMainWindow.__init__(self)
@@ -243,16 +276,26 @@ class ScrollableWindow(QtWidgets.QMainWindow):
         self.widget.layout().setContentsMargins(0,0,0,0)
         self.widget.layout().setSpacing(0)
 
+        self.renderer = renderer
         self.fig = fig
-        self.canvas = FigureCanvas(self.fig)
 
-        self.canvas.draw()
-        self.scroll = QtWidgets.QScrollArea(self.widget)
-        self.scroll.setWidget(self.canvas)
+        if self.renderer == 'qt':
+            # carotid and femoral traces, redrawn by a timer instead of FuncAnimation
+            self.trace_view = TraceView(['Carotid Piezo', 'Femoral Piezo'], [(-3, 3), (-3, 3)], d1.plotMaxLength)
+            self.widget.layout().addWidget(self.trace_view)
+            self.polling = False
+            self.trace_timer = QTimer(self)
+            self.trace_timer.timeout.connect(self.update_traces)
+        else:
+            self.canvas = FigureCanvas(self.fig)
+
+            self.canvas.draw()
+            self.scroll = QtWidgets.QScrollArea(self.widget)
+            self.scroll.setWidget(self.canvas)
 
-        self.nav = NavigationToolbar(self.canvas, self.widget)
-        self.widget.layout().addWidget(self.nav)
-        self.widget.layout().addWidget(self.scroll)
+            self.nav = NavigationToolbar(self.canvas, self.widget)
+            self.widget.layout().addWidget(self.nav)
+            self.widget.layout().addWidget(self.scroll)
 
         self.title = 'PyQt5 button - pythonspot.com'
         self.left = 10
@@ -289,16 +332,34 @@ class ScrollableWindow(QtWidgets.QMainWindow):
 
         self.show()
 
+    # Qt renderer frame: append whatever arrived since the last tick and repaint
+    def update_traces(self):
+        if self.polling or (d1.scan_thread != None and d1.scan_thread.is_alive()):
+            self.trace_view.append(d1.get_block([0, 1]))
+
     @pyqtSlot()
     def on_plot_click(self):
+        if self.renderer == 'qt':
+            self.polling = True
+            self.trace_timer.start(100)
+            return
         live_plot()
 
     @pyqtSlot()
     def on_scan_click(self):
+        if self.renderer == 'qt':
+            self.polling = False
+            self.trace_timer.start(100)
+            d1.start_recording()
+            return
+
+        # the board cannot be polled while it scans, so the live view switches over to the recording stream
         animations = [anim0, anim1]
         for anim in animations:
-            anim.event_source.stop()
-        d1.six_read()
+            if anim != '':
+                anim.event_source.stop()
+        animate()
+        d1.start_recording()
 
     @pyqtSlot()
     def on_save_click(self):
@@ -337,8 +398,8 @@ if __name__ == '__main__':
         anim1 = animation.FuncAnimation(fig, d1.plot_get_value, fargs=(lines1, 1), interval=100)
         fig.canvas.draw()
 
-    # pass the figure to the custom window
-    a = ScrollableWindow(fig)
+    # pass the figure to the custom window ('--qt' selects the Qt-native trace renderer)
+    a = ScrollableWindow(fig, 'qt' if '--qt' in sys.argv else 'matplotlib')
 
 
 
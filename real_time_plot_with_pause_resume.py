@@ -1,5 +1,7 @@
 '''
     Real-time plot with pause/resume functionality when window is clicked
+    Acquisition never stops while paused: the last 10 minutes are kept, so a paused view can be scrolled and zoomed
+    Paused controls: mouse wheel zooms around the cursor, left/right arrow keys pan by half a window, click resumes live
     
 '''
 
@@ -7,7 +9,6 @@
 from __future__ import absolute_import, division, print_function
 from builtins import *  # @UnusedWildImport
 from mcculw import ul
-from mcculw.device_info import DaqDeviceInfo
 from threading import Thread
 from tkinter import *
 
@@ -17,11 +18,20 @@ import collections, time, sys
 #import pandas as pd
 
 try:
-    from console_examples_util import config_first_detected_device
+    from console_examples_util import get_board, release_board
+    from live_acquisition import SampleProducer, drain
+    from history_buffer import HistoryBuffer
+    from signal_quality import QualityMonitor
 except ImportError:
-    from .console_examples_util import config_first_detected_device
+    from .console_examples_util import get_board, release_board
+    from .live_acquisition import SampleProducer, drain
+    from .history_buffer import HistoryBuffer
+    from .signal_quality import QualityMonitor
 
 pause = False
+sampleRate = 100    # samples/s, independent of the plot interval
+historySeconds = 600    # scrollback kept while live or paused
+maxPoints = 2000    # most vertices drawn for a paused view, however far it is zoomed out
 
 class DAQ:
     def __init__(self, ch, bn, ddi):
@@ -30,64 +40,107 @@ class DAQ:
         self.board_num = bn
         self.rate = 1000
         self.memhandle = None
-        self.data = collections.deque([0] * 100, maxlen=100)
         self.plotTimer = 0
         self.previousTimer = 0
         self.plotMaxLength = 100
+        self.pending = collections.deque()
+
+        # every acquired sample goes into the history, paused or not
+        self.history = HistoryBuffer(historySeconds * sampleRate)
+
+        # streaming signal quality, whose smoothed limits scale the live view's y-axis
+        self.quality = QualityMonitor(['CH' + str(ch)], sampleRate)
+
+        # paused view: right edge (absolute sample index, None while live) and width in samples
+        self.viewEnd = None
+        self.viewSpan = self.plotMaxLength
 
         self.ai_info = ddi.get_ai_info()
         self.ai_range = self.ai_info.supported_ranges[0]
         self.channel = ch
     
+    # called by the background producer at the fixed sampling rate
+    def read_value(self):
+        if self.ai_info.resolution <= 16:
+            raw_value = ul.a_in(self.board_num, self.channel, self.ai_range)
+            return ul.to_eng_units(self.board_num, self.ai_range, raw_value)
+        else:
+            raw_value = ul.a_in_32(self.board_num, self.channel, self.ai_range)
+            return ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
+
     def get_value(self, frame, lines, timeText):
+        values = drain(self.pending)    # everything acquired since the last frame
+        self.history.extend(values)
+        if values:
+            self.quality.add_block(values)
         if not pause:
-            if self.ai_info.resolution <= 16:
-                raw_value = ul.a_in(self.board_num, self.channel, self.ai_range)
-                value = ul.to_eng_units(self.board_num, self.ai_range, raw_value)
-            else:
-                raw_value = ul.a_in_32(self.board_num, self.channel, self.ai_range)
-                value= ul.to_eng_units_32(self.board_num, self.ai_range, raw_value)
-
             currentTimer = time.perf_counter()
             self.plotTimer = int((currentTimer - self.previousTimer) * 1000)     # the first reading will be erroneous
             self.previousTimer = currentTimer
             timeText.set_text('Plot Interval = ' + str(self.plotTimer) + 'ms')  
 
-            self.data.append(value)    # we get the latest data point and append it to our array
-            lines.set_data(range(self.plotMaxLength), self.data)
+            # live: the latest window, resuming exactly where acquisition is (nothing was skipped while paused)
+            self.viewEnd = None
+            self.viewSpan = self.plotMaxLength
+            end = self.history.total
+            start = end - self.plotMaxLength
+
+            # live: y-limits follow the signal once a window is complete (a paused view keeps them while scrolled)
+            yLimits = self.quality.y_limits(0)
+            if yLimits != None:
+                lines.axes.set_ylim(yLimits)
+        else:
+            # paused: freeze the right edge on the first paused frame, then follow scroll/zoom
+            if self.viewEnd == None:
+                self.viewEnd = self.history.total
+            start, end = self.history.clamp(self.viewEnd - self.viewSpan, self.viewEnd)
+            behind = (self.history.total - end) / sampleRate
+            timeText.set_text('Paused: ' + '{:.1f}'.format(behind) + 's behind live, ' + '{:.1f}'.format((end - start) / sampleRate) + 's shown')
+
+        x, y = self.history.view(start, end, maxPoints)
+        lines.set_data(x / sampleRate, y)
+        lines.axes.set_xlim([(end - self.viewSpan) / sampleRate, end / sampleRate])
+
+    # mouse wheel while paused: zoom in/out around the cursor
+    def on_scroll(self, event):
+        if not pause or self.viewEnd == None:
+            return
+        span = self.viewSpan / 1.25 if event.button == 'up' else self.viewSpan * 1.25
+        span = int(min(max(span, 10), self.history.capacity))
+        centre = event.xdata * sampleRate if event.xdata != None else self.viewEnd - self.viewSpan / 2
+        self.viewSpan = span
+        self.set_view_end(int(centre + span / 2))
+
+    # left/right arrow keys while paused: pan by half a window
+    def on_key(self, event):
+        if not pause or self.viewEnd == None:
+            return
+        if event.key == 'left':
+            self.set_view_end(self.viewEnd - self.viewSpan // 2)
+        elif event.key == 'right':
+            self.set_view_end(self.viewEnd + self.viewSpan // 2)
+
+    def set_view_end(self, end):
+        self.viewEnd = min(max(end, self.history.first + self.viewSpan), self.history.total)
 
 
     def close(self):
         if self.use_device_detection:
-            ul.release_daq_device(self.board_num)
+            release_board(self.board_num)
 
 daq_instance = [None] * 1
 
 def inst0():
-    config_first_detected_device(0, [])
-    daq_dev_info = DaqDeviceInfo(0)
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+    daq_dev_info = get_board(0)
     daq_instance[0] = DAQ(0,0, daq_dev_info)
-    time.sleep(0.1)
 
 def inst1():
-    config_first_detected_device(1, [])
-    daq_dev_info = DaqDeviceInfo(1)
-    if not daq_dev_info.supports_analog_input:
-        raise Exception('Error: The DAQ device does not support analog input')
-    print('  Active DAQ device: ', daq_dev_info.product_name, ' (', daq_dev_info.unique_id, ')\n', sep='')
+    daq_dev_info = get_board(1)
     daq_instance[2] = DAQ(0,1, daq_dev_info)
-    time.sleep(0.1)
     daq_instance[3] = DAQ(1,1, daq_dev_info)
-    time.sleep(0.1)
     daq_instance[4] = DAQ(2,1, daq_dev_info)
-    time.sleep(0.1)
     daq_instance[5] = DAQ(3,1, daq_dev_info)
-    time.sleep(0.1)
     daq_instance[6] = DAQ(4,1, daq_dev_info)
-    time.sleep(0.1)
     daq_instance[7] = DAQ(5,1, daq_dev_info)
 
 def onClick(event):
@@ -105,14 +158,19 @@ def plot_piezos():
     # -- GRAPH CONFIG
     pltInterval = 10
     fig, (ax0) = plt.subplots(nrows=1, ncols=1, sharex=True, sharey='row', figsize=(20,8))
-    ax0.set_xlim([0, 100])
+    ax0.set_xlim([0, 1])
     ax0.set_ylim([-3,3])
+    ax0.set_xlabel('Time (s)')
     fig.canvas.mpl_connect('button_press_event', onClick)
+    fig.canvas.mpl_connect('scroll_event', board_zero_ch_zero.on_scroll)
+    fig.canvas.mpl_connect('key_press_event', board_zero_ch_zero.on_key)
 
     # --- LIVE PLOT
     lineLabel = 'Carotid Piezo'
     timeText = ax0.text(0.50, 0.95, '', transform=ax0.transAxes)
     lines = ax0.plot([], [], label=lineLabel, linewidth=0.5)[0]
+    producer = SampleProducer([board_zero_ch_zero], sampleRate)
+    producer.start()
     anim = animation.FuncAnimation(fig, board_zero_ch_zero.get_value, fargs=(lines,timeText), interval=pltInterval) 
 
     # --- BRING UP GRID
@@ -123,6 +181,7 @@ def plot_piezos():
     plt.show()
 
     # --- DELETION
+    producer.close()
     try:
         board_zero_ch_zero.close()
         del board_zero_ch_zero
@@ -0,0 +1,184 @@
+'''
+    Replays a saved recording as though it were hardware
+    Reads a read_and_save CSV (main file or any per-device file) or a TracerDAQ export and releases its scans at 1x, Nx or maximum speed
+    Consumers pull blocks with read() (same shape as a UL scan block), or get every scan pushed to a sink with run(), as from six_read/two_read
+    Lets the live plots, quality monitor and beat detectors run on realistic data without a DAQ device, e.g. on Linux
+
+    Usage:
+        python replay_source.py <recording.csv> [--speed N | --speed max] [--screen]
+        (without --screen the recording is shown in a live plot window; with it, the whole file is screened as fast as possible)
+
+'''
+
+import argparse, time
+import numpy as np
+
+# -- Channel names of a TracerDAQ export (as read by scan.py), and its sampling rate
+tracerdaq_names = ['Carotid Piezo (V)', 'Femoral Piezo (V)', 'Acoustic Piezo (V)', 'Chest Strap Channel 1 Piezo (V)', 'Chest Strap Channel 2 Piezo (V)',
+                   'Chest Strap Channel 3 Piezo (V)', 'Chest Strap Channel 4 Piezo (V)', 'Chest Strap Channel 5 Piezo (V)', 'Electrodes (V)']
+tracerdaq_rate = 1000
+
+# -- (rate, channel names, times (s), (scans, channels) block) of a recording
+def load_recording(file_name):
+
+    import pandas as pd
+
+    with open(file_name) as f:
+        first_line = f.readline()
+
+    # -- read_and_save output: 'Time (s)' header, trailing comma on every row (empty last column)
+    if 'Time (s)' in first_line:
+        df = pd.read_csv(file_name)
+        df = df.loc[:, [name for name in df.columns if not name.startswith('Unnamed')]]
+        times = df['Time (s)'].to_numpy(dtype=np.float64)
+        channels = df.drop(columns='Time (s)').apply(pd.to_numeric, errors='coerce')
+        rate = int(round(1 / np.median(np.diff(times))))
+
+    # -- TracerDAQ export: 8 information rows, then Date/Time, 9 channels, Events
+    else:
+        df = pd.read_csv(file_name, skiprows=8, sep=',', header=None)
+        channels = df.iloc[:, 1:1 + len(tracerdaq_names)].apply(pd.to_numeric, errors='coerce')
+        channels.columns = tracerdaq_names
+        rate = tracerdaq_rate
+        times = np.arange(len(channels)) / rate
+
+    return rate, list(channels.columns), times, channels.to_numpy(dtype=np.float64)
+
+class ReplaySource:
+    def __init__(self, file_name, speed = 1.0, chunk_seconds = 0.01, loop = False):
+
+        self.file_name = file_name
+        self.rate, self.names, self.times, self.block = load_recording(file_name)
+        self.num_channels = len(self.names)
+
+        # -- Playback speed relative to real time; None or 0 releases chunk_seconds of scans per read() with no pacing
+        self.speed = speed
+        self.chunk = max(1, int(chunk_seconds * self.rate))
+        self.loop = loop
+
+        self.position = 0
+        self.start_t = None
+
+    @property
+    def finished(self):
+        return self.position >= len(self.block) and not self.loop
+
+    # -- (times, (scans, channels) block) of the scans due since the previous call
+    def read_timed(self):
+
+        if self.start_t == None:
+            self.start_t = time.perf_counter()
+
+        if self.position >= len(self.block):
+            if not self.loop:
+                return self.times[:0], self.block[:0]
+            self.position = 0
+            self.start_t = time.perf_counter()
+
+        if self.speed:
+            due = int((time.perf_counter() - self.start_t) * self.rate * self.speed)
+        else:
+            due = self.position + self.chunk
+        due = min(max(due, self.position), len(self.block))
+
+        start = self.position
+        self.position = due
+        return self.times[start:due], self.block[start:due]
+
+    def read(self):
+        return self.read_timed()[1]
+
+    # -- Push every scan to sink((t, values)) at the playback speed, as the recording loops do
+    def run(self, sink):
+
+        while not self.finished:
+            times, block = self.read_timed()
+            for t, values in zip(times, block):
+                sink((t, values))
+            if self.speed:
+                time.sleep(self.chunk / self.rate)
+
+    # -- collect() for LivePlotProcess.feed_from: new (channel, values) pairs, NaN gaps (e.g. 100Hz flex in a 1kHz file) removed
+    def collector(self):
+
+        def collect():
+            block = self.read()
+            pairs = []
+            for ch in range(self.num_channels):
+                values = block[:, ch]
+                pairs.append((ch, values[~np.isnan(values)]))
+            return pairs
+
+        return collect
+
+# -- Live plot window fed from a replay (plot process, as the live tests use)
+def replay_plot(source, time_base = 50):
+
+    try:
+        from plot_process import LivePlotProcess
+    except ImportError:
+        from .plot_process import LivePlotProcess
+
+    ncols = 2 if source.num_channels > 3 else 1
+    nrows = -(-source.num_channels // ncols)
+
+    view = LivePlotProcess(source.names, [None] * source.num_channels, 5 * source.rate, time_base, nrows, ncols,
+                           'Replay: ' + source.file_name, rates=[source.rate] * source.num_channels)
+    view.feed_from(source.collector())
+
+    while not view.is_closed():
+        time.sleep(0.2)
+
+    view.close()
+
+# -- Run a recording through the quality monitor and beat detectors, returns the printed summary lines
+def screen(source):
+
+    try:
+        from signal_quality import QualityMonitor
+        from beat_detector import BeatDetector
+    except ImportError:
+        from .signal_quality import QualityMonitor
+        from .beat_detector import BeatDetector
+
+    # -- Channels sampled at the file's rate (columns with NaN gaps, e.g. a 100Hz flex column, are left out)
+    complete = [ch for ch in range(source.num_channels) if not np.isnan(source.block[:, ch]).any()]
+    names = [source.names[ch] for ch in complete]
+    quality = QualityMonitor(names, source.rate)
+
+    detectors = {}
+    for i, name in enumerate(names):
+        if 'Carotid' in name or 'Femoral' in name:
+            detectors[i] = BeatDetector(source.rate, 'pulse')
+        elif 'Electrode' in name:
+            detectors[i] = BeatDetector(source.rate, 'ecg')
+
+    start = time.perf_counter()
+    while not source.finished:
+        block = source.read()[:, complete]
+        quality.add_block(block)
+        for i, detector in detectors.items():
+            detector.extend(block[:, i])
+
+    lines = ['  ' + quality.summary(i) + ('  rate ' + '{:.0f}'.format(detectors[i].bpm) + ' bpm' if i in detectors else '') for i in range(len(names))]
+    lines.append('  Screened ' + '{:.1f}'.format(len(source.block) / source.rate) + 's of recording in ' + '{:.2f}'.format(time.perf_counter() - start) + 's\n')
+
+    for line in lines:
+        print(line)
+    return lines
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Replay a saved recording into the live plot or screen it')
+    parser.add_argument('file', help='read_and_save CSV or TracerDAQ export')
+    parser.add_argument('--speed', default='1', help='playback speed (e.g. 1, 4) or max')
+    parser.add_argument('--screen', action='store_true', help='run quality and beat detection over the whole file as fast as possible')
+    args = parser.parse_args()
+
+    speed = None if args.screen or args.speed == 'max' else float(args.speed)
+    source = ReplaySource(args.file, speed, chunk_seconds=1.0 if speed == None else 0.01)
+
+    if args.screen:
+        screen(source)
+    else:
+        replay_plot(source)
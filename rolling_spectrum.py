@@ -0,0 +1,126 @@
+'''
+    Rolling power spectrum (Welch average) and spectrogram of one live channel
+    Samples are consumed one hop at a time: every complete hop slides the analysis segment forward and adds one spectrogram column,
+    so each frame only transforms the samples that arrived since the previous frame
+    Segments, windows, spectra and the spectrogram image are preallocated; the Welch estimate is a running sum over the last `average` columns
+    Samples are assumed evenly spaced: after a discontinuity (skipped or lost samples) the estimate is marked invalid until no
+    averaged segment spans it
+
+'''
+
+import numpy as np
+
+# -- Floor of the dB scale (keeps log10 finite for an all-zero segment)
+floor_db = -200
+
+class RollingSpectrum:
+    def __init__(self, rate, segment = 1024, hop = 128, average = 16, columns = 200):
+
+        self.rate = rate
+        self.segment = segment
+        self.hop = hop
+        self.average = average
+
+        # -- Hann window and one-sided power spectral density scaling (V**2/Hz, as scipy.signal.welch)
+        self.window = np.hanning(segment)
+        self.scale = 1.0 / (rate * np.sum(self.window ** 2))
+        self.frequencies = np.fft.rfftfreq(segment, 1 / rate)
+        bins = len(self.frequencies)
+
+        # -- Analysis segment (latest `segment` samples), its windowed copy, and the hop being filled
+        self.samples = np.zeros(segment)
+        self.weighted = np.zeros(segment)
+        self.next_hop = np.zeros(hop)
+        self.filled = 0
+
+        # -- Power of the latest hop, the last `average` of them and their running sum
+        self.power = np.zeros(bins)
+        self.recent = np.zeros((average, bins))
+        self.recent_sum = np.zeros(bins)
+        self.welch = np.zeros(bins)
+        self.hops = 0
+
+        # -- Samples consumed before the Welch estimate is free of the latest discontinuity
+        self.valid_from = 0
+
+        # -- Spectrogram in dB, one column per hop, newest on the right
+        self.image = np.full((bins, columns), float(floor_db))
+
+    # -- Consume newly acquired samples, returns the number of spectrogram columns added
+    def extend(self, values):
+
+        values = np.asarray(values, dtype=np.float64)
+        added = 0
+        start = 0
+
+        while start < len(values):
+            take = min(self.hop - self.filled, len(values) - start)
+            self.next_hop[self.filled:self.filled + take] = values[start:start + take]
+            self.filled += take
+            start += take
+
+            if self.filled == self.hop:
+                self.add_hop()
+                self.filled = 0
+                added += 1
+
+        return added
+
+    # -- Slide the segment by one hop and transform it
+    def add_hop(self):
+
+        self.samples[:-self.hop] = self.samples[self.hop:]
+        self.samples[-self.hop:] = self.next_hop
+
+        # -- numpy keeps the FFT plan of a given length cached, so every hop reuses the same one
+        np.multiply(self.samples, self.window, out=self.weighted)
+        spectrum = np.fft.rfft(self.weighted)
+
+        np.abs(spectrum, out=self.power)
+        np.square(self.power, out=self.power)
+        self.power *= self.scale
+        self.power[1:-1] *= 2    # one-sided: fold the negative frequencies (DC and Nyquist appear once)
+
+        # -- Welch running sum over the last `average` hops (recomputed once per cycle so rounding cannot accumulate)
+        slot = self.hops % self.average
+        self.recent_sum -= self.recent[slot]
+        self.recent[slot] = self.power
+        if slot == self.average - 1:
+            np.sum(self.recent, axis=0, out=self.recent_sum)
+        else:
+            self.recent_sum += self.power
+        self.hops += 1
+
+        # -- Scroll the spectrogram left and write the new column
+        self.image[:, :-1] = self.image[:, 1:]
+        column = self.image[:, -1]
+        np.maximum(self.power, 10 ** (floor_db / 10), out=column)
+        np.log10(column, out=column)
+        column *= 10
+
+    # -- Welch power spectral density (V**2/Hz) averaged over the last `average` hops
+    def psd(self):
+
+        np.divide(self.recent_sum, max(1, min(self.hops, self.average)), out=self.welch)
+        return self.frequencies, self.welch
+
+    # -- Averaged power density in dB at the bin nearest to frequency (e.g. 50 or 60Hz line interference)
+    def level_at(self, frequency):
+
+        index = int(round(frequency * self.segment / self.rate))
+        average = self.recent_sum[index] / max(1, min(self.hops, self.average))
+        return 10 * np.log10(max(average, 10 ** (floor_db / 10)))
+
+    # -- The stream is not evenly spaced at sample position (samples consumed since the start) position
+    def discontinuity(self, position):
+        self.valid_from = max(self.valid_from, position + self.segment + (self.average - 1) * self.hop)
+
+    # -- False while a segment of the Welch average spans a discontinuity
+    @property
+    def valid(self):
+        return self.hops * self.hop >= self.valid_from
+
+    # -- Seconds of signal covered by the spectrogram
+    @property
+    def image_seconds(self):
+        return self.image.shape[1] * self.hop / self.rate
@@ -0,0 +1,87 @@
+'''
+    Bounded single-producer/single-consumer sample ring for background reader threads
+    The reader thread pushes already-parsed values with their acquisition times; the plot callback drains them in batches
+    No lock is taken: only the producer advances write_count and only the consumer advances read_count
+    When the consumer falls a full ring behind, new samples are refused and counted in dropped instead of overwriting unread ones
+
+'''
+
+import numpy as np
+import time
+
+class SampleRing:
+    def __init__(self, capacity):
+
+        # -- Preallocated storage (values and acquisition times in perf_counter seconds)
+        self.capacity = capacity
+        self.values = np.zeros(capacity)
+        self.times = np.zeros(capacity)
+
+        # -- Monotonic counters, each written by one side only
+        self.write_count = 0
+        self.read_count = 0
+
+        # -- Samples refused because the ring was full
+        self.dropped = 0
+
+    # -- Producer side: store one sample, returns False if it had to be dropped
+    def push(self, value, t = None):
+
+        if self.write_count - self.read_count >= self.capacity:
+            self.dropped += 1
+            return False
+
+        index = self.write_count % self.capacity
+        self.values[index] = value
+        self.times[index] = time.perf_counter() if t == None else t
+
+        # -- Publish only after the slot is fully written
+        self.write_count += 1
+        return True
+
+    # -- Consumer side: number of samples waiting
+    def __len__(self):
+        return self.write_count - self.read_count
+
+    # -- Consumer side: remove and return (times, values) of every waiting sample, oldest first
+    def drain(self):
+
+        start = self.read_count
+        end = self.write_count
+        count = end - start
+
+        first = start % self.capacity
+        stop = first + count
+
+        # -- Contiguous or wrapped around the end of the ring
+        if stop <= self.capacity:
+            times = self.times[first:stop].copy()
+            values = self.values[first:stop].copy()
+        else:
+            stop -= self.capacity
+            times = np.concatenate((self.times[first:], self.times[:stop]))
+            values = np.concatenate((self.values[first:], self.values[:stop]))
+
+        # -- Release the slots to the producer only after they have been copied
+        self.read_count = end
+        return times, values
+
+    # -- Consumer side: hand every waiting sample to sink(times, values) without copying, returns the number of samples
+    #    sink receives views into the ring (twice when the samples wrap around its end) and must not keep them
+    def drain_to(self, sink):
+
+        start = self.read_count
+        end = self.write_count
+        count = end - start
+
+        first = start % self.capacity
+        stop = first + count
+
+        if stop <= self.capacity:
+            sink(self.times[first:stop], self.values[first:stop])
+        else:
+            sink(self.times[first:], self.values[first:])
+            sink(self.times[:stop - self.capacity], self.values[:stop - self.capacity])
+
+        self.read_count = end
+        return count
@@ -24,6 +24,11 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
 from matplotlib.backend_bases import key_press_handler
 
+try:
+    from event_markers import save_markers
+except ImportError:
+    from .event_markers import save_markers
+
 # -- Central File Name
 fn = ''
 
@@ -92,7 +97,7 @@ def gui_start(q, status):
                 q.put(fn)
 
                 # -- Extract Main Data
-                df = pd.read_csv(fn, skiprows=8, sep=',', names=[ 'Date/Time', 'Carotid Piezo (V)', 'Femoral Piezo (V)', 'Acoustic Piezo (V)', 'Chest Strap Channel 1 Piezo (V)', 'Chest Strap Channel 2 Piezo (V)','Chest Strap Channel 3 Piezo (V)', 'Chest Strap Channel 4 Piezo (V)', 'Chest Strap Channel 5 Piezo (V)', 'Electrodes (V)', 'Angular Displacement (deg)'])
+                df = pd.read_csv(fn, skiprows=8, sep=',', names=[ 'Date/Time', 'Carotid Piezo (V)', 'Femoral Piezo (V)', 'Acoustic Piezo (V)', 'Chest Strap Channel 1 Piezo (V)', 'Chest Strap Channel 2 Piezo (V)','Chest Strap Channel 3 Piezo (V)', 'Chest Strap Channel 4 Piezo (V)', 'Chest Strap Channel 5 Piezo (V)', 'Electrodes (V)', 'Angular Displacement (deg)', 'Events'])
                 
                 t = pd.DataFrame(np.arange(0, 60, 0.001).tolist(), columns=['Time (s)'])
                 t.index += 1
@@ -319,7 +324,7 @@ def save(q,status):
             main_df = pd.read_csv('1.csv', skiprows=8, sep=',', names=[ 'Date/Time', 'Carotid Piezo (V)', 'Femoral Piezo (V)', 'Acoustic Piezo (V)', 
                                                                         'Chest Strap Channel 1 Piezo (V)', 'Chest Strap Channel 2 Piezo (V)','Chest Strap Channel 3 Piezo (V)', 
                                                                         'Chest Strap Channel 4 Piezo (V)', 'Chest Strap Channel 5 Piezo (V)', 'Electrodes (V)', 'Events', ' '])
-            main_df.drop(axis=1, labels=['Events', ' '], inplace=True )
+            main_df.drop(axis=1, labels=[' '], inplace=True )
 
             # -- Dequeue User Fields (Queue Size = 3)
 
@@ -381,8 +386,16 @@ def save(q,status):
 
                 j += 1
 
-            # -- Main DataFrame and Flex Sensor DataFrame Concatenation by Index Column
-            df = pd.concat([main_df,alt_df], axis=1).fillna('')
+            # -- Main DataFrame and Flex Sensor DataFrame Concatenation by Index Column (TracerDAQ Events Kept as the Last Column)
+            events = main_df.pop('Events')
+            df = pd.concat([main_df,alt_df], axis=1)
+            df['Events'] = events
+            df = df.fillna('')
+
+            # -- Indexed Sidecar of TracerDAQ Events (Sample Index = Row Index - 1 at 1000 Samples/s)
+            marked = events.dropna()
+            marked = marked[marked.astype(str).str.strip() != '']
+            save_markers(fn, [(index - 1, (index - 1) / 1000, str(label).strip(), 'TracerDAQ') for index, label in marked.items()])
         
             # -- Update Temporary File Name to Central File Name
             os.rename('1.csv', fn)
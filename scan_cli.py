@@ -0,0 +1,216 @@
+'''
+    Headless acquisition: runs read_and_save from command-line arguments or a JSON config file, without any window
+    Never imports tkinter or matplotlib, so batch sessions start quickly and run on lab machines without a display
+    Command-line arguments override the config file; files are named as the GUI names them
+
+    Usage:
+        python scan_cli.py --rate 1000 --duration 60 --name "Jane Doe" --sex F [--output single|multiple] [--output-dir DIR]
+                           [--channels carotid femoral electrode ...] [--config session.json] [--marker-key m]
+                           [--channel-map boards.json] [--executor six=thread two=thread flex=process]
+
+    Config file (any of the options above, by their long names):
+        {"rate": 1000, "duration": 60, "name": "Jane Doe", "sex": "F", "output": "single", "channels": ["carotid", "electrode"]}
+
+    Channel map file (see channel_map): a JSON list of board entries, e.g. to add a third board; --channels then also accepts
+    the map's channel names
+
+    Queue of scans with the devices kept connected between them (a JSON list of session options; the command line sets shared defaults):
+        python scan_cli.py --queue clinic_day.json [--output-dir DIR]
+
+    As an API:
+        from scan_cli import run_session
+        run_session(1000, 60, 'Jane Doe', 'F')
+
+'''
+
+from datetime import datetime
+import argparse, json, sys
+
+try:
+    from live_scan import read_and_save
+    from event_markers import MarkerStream
+    from scan_session import ScanSession
+    from channel_map import load_map, column_names
+except ImportError:
+    from .live_scan import read_and_save
+    from .event_markers import MarkerStream
+    from .scan_session import ScanSession
+    from .channel_map import load_map, column_names
+
+# -- Channel keys accepted by --channels, and their columns in the single-file output
+channel_columns = {'carotid': 'Carotid Piezo (V)', 'femoral': 'Femoral Piezo (V)',
+                   'piezo0': 'Piezo Channel 0 (V)', 'piezo1': 'Piezo Channel 1 (V)', 'piezo2': 'Piezo Channel 2 (V)',
+                   'piezo3': 'Piezo Channel 3 (V)', 'piezo4': 'Piezo Channel 4 (V)', 'piezo5': 'Piezo Channel 5 (V)',
+                   'electrode': 'Electrode (V)', 'flex': 'Angular Displacement (deg)'}
+
+save_options = {'single': 1, 'multiple': 2}
+
+# -- Defaults for options given neither on the command line nor in the config file
+defaults = {'rate': 1000, 'output': 'single', 'output_dir': None, 'channels': None, 'marker_key': None, 'channel_map': None,
+            'executor': None}
+
+# -- Recording file name (without extension), as the GUI builds it
+def build_file_name(name, sex, rate, duration):
+    return datetime.now().strftime('%Y-%m-%d %H;%M;%S') + ' -- ' + name + ' (' + sex + ') -- ' + str(rate) + 'Hz for ' + str(duration) + 's'
+
+# -- Channel keys accepted with a board map: the keys above whose column the map records, and the map's channel names
+def map_channels(boards):
+
+    recorded = [column for board in boards for column in column_names(board)] + [channel_columns['flex']]
+    known = {key: column for key, column in channel_columns.items() if column in recorded}
+    for board in boards:
+        known.update({name: name + ' (V)' for name in board['channels']})
+    return known
+
+# -- {source: run mode} from 'source=mode' arguments
+def parse_executors(items):
+
+    if items == None:
+        return None
+    if isinstance(items, dict):
+        return items
+
+    executors = {}
+    for item in items:
+        if '=' not in item:
+            raise ValueError('Executor must be given as source=mode: ' + item)
+        source, mode = item.split('=', 1)
+        executors[source] = mode
+    return executors
+
+# -- Same checks as the GUI entry fields; returns an error message, or None
+def check_session(rate, duration, name, sex, output, channels, boards = None):
+
+    if rate < 200:
+        return 'Sampling rate must be at least 200 Hz.'
+    if duration <= 0:
+        return 'Duration must be greater than 0 seconds.'
+    if not name or not sex:
+        return 'Patient name and sex are required.'
+    if output not in save_options:
+        return 'Output must be one of: ' + ', '.join(save_options) + '.'
+    if channels != None:
+        known = map_channels(boards if boards != None else load_map())
+        unknown = [channel for channel in channels if channel not in known]
+        if unknown:
+            return 'Unknown channel(s): ' + ', '.join(unknown) + ' (choose from ' + ', '.join(known) + ').'
+        if output != 'single':
+            return 'Channel selection applies to the single-file output only.'
+    return None
+
+# -- Record one session; returns the recording's file name (without extension)
+#    channels: optional list of channel keys kept in the single-file output; marker_key: optional hotkey marking events
+#    channel_map: optional channel map file (the default boards if None); executors: optional {source: run mode}
+def run_session(rate, duration, name, sex, output = 'single', output_dir = None, channels = None, marker_key = None, channel_map = None,
+                executors = None):
+
+    boards = load_map(channel_map)
+    error = check_session(rate, duration, name, sex, output, channels, boards)
+    if error != None:
+        raise ValueError(error)
+
+    file_name = build_file_name(name, sex, rate, duration)
+    columns = [map_channels(boards)[channel] for channel in channels] if channels != None else None
+
+    markers = MarkerStream() if marker_key != None else None
+    marker_keys = {marker_key: 'Marker'} if marker_key != None else None
+
+    read_and_save(rate, duration, save_options[output], file_name, markers=markers, marker_keys=marker_keys,
+                  output_dir=output_dir, columns=columns, channel_map=boards, executors=parse_executors(executors))
+    return file_name
+
+# -- Record a queue of sessions (dicts of run_session arguments) in one ScanSession; returns the completed file names
+#    Every session is checked before the devices are connected, so a typo does not stop the queue halfway
+#    The session keeps one set of boards connected, so every queued session uses the same channel map
+def run_queue(sessions):
+
+    channel_maps = set(options.get('channel_map') for options in sessions)
+    if len(channel_maps) > 1:
+        raise ValueError('Every queued session must use the same channel map.')
+    boards = load_map(channel_maps.pop() if channel_maps else None)
+    executors = parse_executors(sessions[0].get('executor')) if sessions else None
+
+    scans = []
+    for options in sessions:
+        rate, duration = int(options['rate']), int(options['duration'])
+        error = check_session(rate, duration, options['name'], options['sex'], options['output'], options.get('channels'), boards)
+        if error != None:
+            raise ValueError(options['name'] + ': ' + error)
+
+        channels = options.get('channels')
+        scans.append({'rate': rate, 'buffer_size_seconds': duration, 'save_option': save_options[options['output']],
+                      'file_name': None, 'output_dir': options.get('output_dir'),
+                      'columns': [map_channels(boards)[channel] for channel in channels] if channels != None else None,
+                      'name': options['name'], 'sex': options['sex']})
+
+    completed = []
+    with ScanSession(boards, executors) as session:
+        for i, scan in enumerate(scans):
+            print('  Scan', i + 1, 'of', len(scans), '\n')
+
+            # -- Named when the scan starts, as the GUI does
+            file_name = build_file_name(scan.pop('name'), scan.pop('sex'), scan['rate'], scan['buffer_size_seconds'])
+            scan['file_name'] = file_name
+            if session.scan(**scan):
+                completed.append(file_name)
+
+    return completed
+
+# -- Options from the config file (if any) overridden by the command line
+def session_options(args, config = None):
+
+    options = dict(defaults)
+
+    if args.config != None:
+        with open(args.config) as f:
+            config = json.load(f)
+    if config != None:
+        options.update({key.replace('-', '_'): value for key, value in config.items()})
+
+    options.update({key: value for key, value in vars(args).items() if value != None and key not in ('config', 'queue')})
+
+    missing = [key for key in ('duration', 'name', 'sex') if options.get(key) == None]
+    if missing:
+        raise ValueError('Missing option(s): ' + ', '.join(missing) + ' (give them as arguments or in the config file).')
+
+    return options
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Record a session without the GUI')
+    parser.add_argument('--config', help='JSON file with any of the options below')
+    parser.add_argument('--rate', type=int, help='sampling rate in Hz (at least 200, default 1000)')
+    parser.add_argument('--duration', type=int, help='duration in seconds')
+    parser.add_argument('--name', help='patient name')
+    parser.add_argument('--sex', help='patient sex')
+    parser.add_argument('--output', choices=list(save_options), help='one merged file or one file per device (default single)')
+    parser.add_argument('--output-dir', dest='output_dir', help='folder for the recording files (default: working directory)')
+    parser.add_argument('--channels', nargs='+', help='channels kept in the single-file output: ' + ', '.join(channel_columns))
+    parser.add_argument('--marker-key', dest='marker_key', help='key that stamps an event marker during the scan')
+    parser.add_argument('--channel-map', dest='channel_map', help='JSON channel map file of the DAQ boards (default: carotid/femoral and chest strap boards)')
+    parser.add_argument('--executor', nargs='+', help='where sources run, as source=mode (mode: process, thread or inline; default process)')
+    parser.add_argument('--queue', help='JSON list of sessions recorded back to back with the devices kept connected')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.queue != None:
+            with open(args.queue) as f:
+                queue = json.load(f)
+            args.config = None
+            completed = run_queue([session_options(args, config) for config in queue])
+            print('  ' + str(len(completed)) + ' of ' + str(len(queue)) + ' recordings saved.\n')
+            return 0 if len(completed) == len(queue) else 1
+
+        options = session_options(args)
+        file_name = run_session(int(options['rate']), int(options['duration']), options['name'], options['sex'], options['output'],
+                                options['output_dir'], options['channels'], options['marker_key'], options['channel_map'],
+                                options['executor'])
+    except ValueError as error:
+        print('  Error: ' + str(error) + '\n')
+        return 1
+
+    print('  Recording saved: ' + file_name + '\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
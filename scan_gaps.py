@@ -0,0 +1,94 @@
+'''
+    Buffer overrun recovery for the DAQ recording loops
+    When a loop falls more than a UL buffer behind, the scans the board overwrote are recorded as a gap (exact range of scan
+    indices) and the read cursor moves forward to scans still in the buffer, leaving part of the buffer as headroom; the scan
+    keeps running. Scans overwritten while they were being copied are dropped the same way
+    Gaps are saved as a sidecar CSV next to the device file; the merge fills the lost rows with NaN, so row n of a saved
+    recording is still scan index n, and lists every source's gaps in '<name> -- Gaps .csv'
+
+'''
+
+import csv, os
+import numpy as np
+
+# -- Share of the UL buffer left as headroom when the cursor is moved forward after an overrun
+resync_fraction = 0.5
+
+class GapLog:
+    def __init__(self, source, num_chans, ul_buffer_count, end_scan):
+
+        self.source = source
+        self.num_chans = num_chans
+        self.ul_buffer_count = ul_buffer_count
+
+        # -- Scans in the recording; the cursor never moves past it
+        self.end_scan = end_scan
+
+        # -- (source, first lost scan, first scan after the gap)
+        self.gaps = []
+
+    def add(self, first, end):
+
+        if end > first:
+            self.gaps.append((self.source, first, end))
+            print('  WARNING: BUFFER OVERRUN, ' + str(end - first) + ' scans lost (' + self.source + ', scans ' + str(first) + ' to ' + str(end - 1) + ')\n')
+
+    # -- Before a copy: the cursor (first_scan) is more than a UL buffer behind curr_count; returns the scan to resume from
+    def resync(self, first_scan, curr_count):
+
+        newest = curr_count // self.num_chans
+        resume = newest - int(self.ul_buffer_count // self.num_chans * resync_fraction)
+
+        # -- Never before the oldest scan still in the buffer
+        oldest = -(-(curr_count - self.ul_buffer_count) // self.num_chans)
+        resume = min(max(resume, oldest, first_scan), self.end_scan)
+
+        self.add(first_scan, resume)
+        return resume
+
+    # -- After copying scans from first_scan: the first of them not overwritten by curr_count (the ones before it are lost)
+    #    When more than the copied scans were overwritten, this is past them and the cursor moves there
+    def intact_from(self, first_scan, curr_count):
+
+        intact = min(max(first_scan, -(-(curr_count - self.ul_buffer_count) // self.num_chans)), self.end_scan)
+        self.add(first_scan, intact)
+        return intact
+
+    # -- Sidecar file of the device file, written only if scans were lost
+    def save(self, file_name, rate):
+        if self.gaps:
+            save_gaps(file_name, self.gaps, rate)
+
+# -- Sidecar file name of a recording: '<name> -- Gaps .csv'
+def gap_file_name(file_name):
+    return file_name.replace(' .csv', '') + ' -- Gaps .csv'
+
+# -- gaps: (source, first lost scan, first scan after the gap)
+def save_gaps(file_name, gaps, rate):
+
+    with open(gap_file_name(file_name), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Source', 'First Sample', 'Last Sample', 'Samples Lost', 'Start (s)', 'End (s)'])
+        for source, first, end in sorted(gaps, key=lambda gap: gap[1]):
+            writer.writerow([source, first, end - 1, end - first, '{:.6f}'.format(first / rate), '{:.6f}'.format(end / rate)])
+
+# -- Gaps of a recording as a list of (source, first lost scan, first scan after the gap); empty if none were saved
+def load_gaps(file_name):
+
+    if not os.path.exists(gap_file_name(file_name)):
+        return []
+
+    with open(gap_file_name(file_name), newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [(row[0], int(row[1]), int(row[2]) + 1) for row in reader]
+
+# -- Device file DataFrame with a NaN row for every lost scan (the time column is rebuilt from the scan index)
+#    gaps: the device's gaps (load_gaps); scans lost at the end of the recording are only known from them
+def fill_gaps(df, rate, gaps):
+
+    index = (df['Time (s)'] * rate).round().astype(int)
+    scans = max([index.iloc[-1] + 1 if len(index) else 0] + [end for source, first, end in gaps])
+    df = df.set_index(index).reindex(range(scans)).reset_index(drop=True)
+    df['Time (s)'] = np.arange(len(df)) * (1 / rate)
+    return df
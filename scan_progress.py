@@ -0,0 +1,59 @@
+'''
+    Progress and metrics channel from a running scan to the window that started it
+    Recording processes post the scans captured and the free share of their UL buffer (at most every report_period);
+    read_and_save posts the merge steps and how the scan ended. The window polls the queue from its event loop
+    A shared cancel event stops every recording loop cleanly (devices stopped and released, temporary files removed)
+
+    Messages:
+        ('samples', source, scans, headroom, backlog)
+                                            headroom: free fraction of the UL buffer, None for the serial port
+                                            backlog: blocks waiting for the source's writer thread, None without one
+        ('merge', step, steps)
+        ('done', 'saved' | 'cancelled' | 'failed', detail)
+
+'''
+
+from multiprocessing import Event, Queue
+import queue, time
+
+# -- Seconds between sample reports from a recording loop
+report_period = 0.5
+
+# -- (progress queue, cancel event) for one scan
+def scan_channel():
+    return (Queue(), Event())
+
+def post(progress, *message):
+    if progress != None:
+        progress.put(message)
+
+def cancelled(cancel):
+    return cancel != None and cancel.is_set()
+
+# -- Recording loop side: rate-limited sample reports of one source
+class ProgressReporter:
+    def __init__(self, progress, source):
+
+        self.progress = progress
+        self.source = source
+        self.next_t = 0.0
+
+    def update(self, scans, headroom = None, backlog = None, force = False):
+
+        if self.progress == None:
+            return
+
+        t = time.perf_counter()
+        if force or t >= self.next_t:
+            self.progress.put(('samples', self.source, scans, headroom, backlog))
+            self.next_t = t + report_period
+
+# -- Window side: every message queued so far
+def poll(progress):
+
+    messages = []
+    while True:
+        try:
+            messages.append(progress.get_nowait())
+        except queue.Empty:
+            return messages
@@ -0,0 +1,184 @@
+'''
+    Scan session: keeps the DAQ boards of a channel map and the flex sensor's serial port open across back-to-back scans
+    One worker process per source connects once (board configuration, serial banner), then records every scan put on its job queue
+    Every scan starts at a common instant scheduled through a start gate once all sources are ready
+    Scans (different patients or protocols) run from a queue with only the merge of the previous recording between them,
+    instead of the 4-5 seconds of device detection, start-up sleep and serial reconnection of every read_and_save call
+
+    Usage:
+        session = ScanSession()              # or ScanSession(channel_map) for another set of boards
+        session.scan(1000, 60, 1, file_name)
+        session.run_queue([{'rate': 1000, 'buffer_size_seconds': 60, 'save_option': 1, 'file_name': ...}, ...])
+        session.close()
+
+'''
+
+from multiprocessing import Queue
+import os, queue, time
+
+try:
+    from console_examples_util import get_board, release_board
+    from live_scan import open_flex_port, daq_read, flex_read, save_recording
+    from start_gate import StartGate, ScanStart, StartAborted, save_start_report
+    from channel_map import default_map, find_board, device_file_name, sources
+    from source_runner import make_runner, source_modes
+except ImportError:
+    from .console_examples_util import get_board, release_board
+    from .live_scan import open_flex_port, daq_read, flex_read, save_recording
+    from .start_gate import StartGate, ScanStart, StartAborted, save_start_report
+    from .channel_map import default_map, find_board, device_file_name, sources
+    from .source_runner import make_runner, source_modes
+
+# -- Seconds between checks that the workers still waiting to report are alive
+worker_check_period = 1
+
+# -- Worker process of one source: connect once, record each job, disconnect on None
+#    board: channel map entry of a DAQ source, None for the flex sensor
+#    Reports ('ready' | 'failed', source, message) after connecting and ('done' | 'failed', source, message) after each job
+def source_worker(source, board, gate, jobs, results):
+
+    try:
+        if source == 'flex':
+            device = open_flex_port()
+        else:
+            device = get_board(board['board_num'])
+    except (Exception, SystemExit) as error:
+        results.put(('failed', source, 'connection failed: ' + str(error)))
+        return
+
+    results.put(('ready', source, ''))
+
+    while True:
+        job = jobs.get()
+        if job == None:
+            break
+
+        rate, buffer_size_seconds, file_name = job
+        start = ScanStart(gate, file_name, source)
+        try:
+            if source != 'flex':
+                daq_read(start, board, rate, buffer_size_seconds, device_file_name(file_name, board), daq_dev_info=device)
+            else:
+                flex_read(start, buffer_size_seconds, file_name + ' -- Flex Sensor .csv', ser=device)
+            results.put(('done', source, ''))
+        except StartAborted:
+            results.put(('failed', source, 'scan aborted'))
+        except (Exception, SystemExit) as error:
+            # -- Release the other sources if this one failed before the start; the read functions print their own error before sys.exit()
+            start.fail()
+            results.put(('failed', source, str(error) or 'scan stopped'))
+
+    # -- Disconnect
+    if source == 'flex':
+        device.close()
+    else:
+        release_board(board['board_num'])
+
+class ScanSession:
+    # -- executors: optional {source: 'process' | 'thread'} overriding the map entries' 'executor'
+    def __init__(self, channel_map = None, executors = None):
+
+        # -- Boards of the session (default_map if None) and the flex sensor
+        self.boards = channel_map if channel_map != None else default_map
+        self.sources = sources(self.boards)
+
+        # -- Workers stay up between scans, so none can run in-loop
+        modes = source_modes(self.sources, {board['source']: board.get('executor') for board in self.boards}, executors)
+        if 'inline' in modes.values():
+            raise ValueError('Scan session workers run in a process or a thread, not in-loop.')
+
+        # -- Reused by every scan: all sources start recording together
+        self.gate = StartGate(self.sources)
+        self.results = Queue()
+        self.jobs = {source: Queue() for source in self.sources}
+
+        start = time.time()
+        self.workers = [make_runner(modes[source], source_worker, (source, find_board(self.boards, source) if source != 'flex' else None,
+                                                                  self.gate, self.jobs[source], self.results))
+                        for source in self.sources]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+
+        failed = [message for state, source, message in self.collect() if state == 'failed']
+        if failed:
+            self.close()
+            raise Exception('Error: ' + '; '.join(failed))
+
+        print('  Scan session ready in', '{:.1f}'.format(time.time() - start), 'seconds.\n')
+
+    # -- One result per source; a worker that stopped without reporting (killed, crashed in the driver) fails its source
+    def collect(self):
+
+        results = []
+        reported = set()
+        stopped = set()
+
+        while len(results) < len(self.sources):
+            try:
+                state, source, message = self.results.get(timeout=worker_check_period)
+            except queue.Empty:
+                for source, worker in zip(self.sources, self.workers):
+                    if source in reported or worker.is_alive():
+                        continue
+                    # -- Stopped on two checks in a row, so a result it posted just before exiting would have arrived
+                    if source in stopped:
+                        print('  ERROR: ' + source + ' worker stopped\n')
+                        results.append(('failed', source, 'worker stopped'))
+                        reported.add(source)
+                    stopped.add(source)
+                continue
+
+            if state == 'failed':
+                print('  ERROR: ' + source + ' ' + message + '\n')
+            results.append((state, source, message))
+            reported.add(source)
+
+        return results
+
+    # -- Record one scan and merge/split it as read_and_save does; returns True if every source completed
+    def scan(self, rate, buffer_size_seconds, save_option, file_name, output_dir = None, columns = None):
+
+        if output_dir != None:
+            os.makedirs(output_dir, exist_ok=True)
+            file_name = os.path.join(output_dir, file_name)
+
+        print( '=================================================================\n')
+
+        for source in self.sources:
+            self.jobs[source].put((rate, buffer_size_seconds, file_name))
+
+        # -- Common start once every source is ready (a source failing first calls the scan off)
+        start_at = self.gate.arm(file_name)
+
+        if any(state == 'failed' for state, source, message in self.collect()) or start_at == None:
+            print('  Scan failed, the recording was not saved.\n\n')
+            return False
+
+        save_start_report(file_name, self.gate.offsets(file_name, start_at))
+
+        save_recording(rate, buffer_size_seconds, save_option, file_name, columns, channel_map=self.boards)
+        return True
+
+    # -- Run queued scans back to back: dicts of scan() arguments; returns the file names of the completed scans
+    def run_queue(self, scans):
+
+        completed = []
+        for i, scan in enumerate(scans):
+            print('  Scan', i + 1, 'of', len(scans), '\n')
+            if self.scan(**scan):
+                completed.append(scan['file_name'])
+        return completed
+
+    def close(self):
+
+        for source in self.sources:
+            self.jobs[source].put(None)
+        for worker in self.workers:
+            worker.join(timeout=5)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
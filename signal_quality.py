@@ -0,0 +1,212 @@
+'''
+    Streaming per-channel signal quality: running min/max/RMS, clipping ratio, flatline duration and line-frequency (mains hum) power
+    Statistics are accumulated over tumbling windows (1 second by default) in fixed memory and vectorised across channels,
+    so feeding it one scan at a time from an acquisition loop costs a few array operations per batch of scans
+    Line-frequency power is a single-bin DFT per frequency accumulated sample by sample (the Goertzel quantity), from precomputed phasor tables
+    Each completed window updates a status per channel and smoothed y-limits for auto-scaling live plots
+
+'''
+
+import numpy as np
+
+# -- Input range of the USB-1608FS-Plus (first supported range, +/-10V), for the clipping check
+input_limits = (-10, 10)
+
+# -- Status thresholds
+clip_margin = 0.02         # fraction of the input range next to a limit that counts as clipped
+clip_warning = 0.01        # fraction of clipped samples in a window
+flat_seconds = 1.0         # unchanged signal for this long is reported as flat
+flat_tolerance = 1e-4      # largest sample-to-sample change (V) treated as unchanged
+hum_warning = 0.5          # share of the window's AC power at the line frequencies
+
+class QualityMonitor:
+    def __init__(self, names, rate, limits = None, line_frequencies = (50, 60), window_seconds = 1, batch = 64):
+
+        self.names = names
+        self.num_channels = len(names)
+        self.rate = rate
+
+        # -- Per-channel (low, high) input limits, or None where clipping does not apply (e.g. the flex sensor angle)
+        self.limits = limits if limits != None else [input_limits] * self.num_channels
+        low = np.array([limit[0] if limit != None else -np.inf for limit in self.limits])
+        high = np.array([limit[1] if limit != None else np.inf for limit in self.limits])
+        margin = np.where(np.isfinite(high - low), (high - low) * clip_margin, 0)
+        self.clip_low = low + margin
+        self.clip_high = high - margin
+
+        # -- Scans waiting to be processed (add_scan), preallocated
+        self.batch = np.zeros((batch, self.num_channels))
+        self.filled = 0
+
+        # -- Window accumulators
+        self.window = max(1, int(window_seconds * rate))
+        self.position = 0
+        self.sum = np.zeros(self.num_channels)
+        self.sum_squares = np.zeros(self.num_channels)
+        self.low = np.full(self.num_channels, np.inf)
+        self.high = np.full(self.num_channels, -np.inf)
+        self.clipped = np.zeros(self.num_channels)
+
+        # -- Line frequencies below Nyquist only; cos/sin tables over one window
+        self.line_frequencies = [f for f in line_frequencies if f < rate / 2]
+        n = np.arange(self.window)
+        self.cos_tables = [np.cos(2 * np.pi * f * n / rate) for f in self.line_frequencies]
+        self.sin_tables = [np.sin(2 * np.pi * f * n / rate) for f in self.line_frequencies]
+        self.re = np.zeros((len(self.line_frequencies), self.num_channels))
+        self.im = np.zeros((len(self.line_frequencies), self.num_channels))
+
+        # -- Flatline: consecutive unchanged samples per channel, and the previous sample
+        self.flat_count = np.zeros(self.num_channels, dtype=np.int64)
+        self.previous = None
+
+        # -- Results of the last complete window
+        self.windows = 0
+        self.minimum = np.zeros(self.num_channels)
+        self.maximum = np.zeros(self.num_channels)
+        self.rms = np.zeros(self.num_channels)
+        self.clip_ratio = np.zeros(self.num_channels)
+        self.hum_ratio = np.zeros(self.num_channels)
+
+        # -- Smoothed plot limits (grow at once, shrink slowly)
+        self.y_low = None
+        self.y_high = None
+
+    # -- Acquisition loop: one scan (one value per channel); processed in batches
+    def add_scan(self, values):
+
+        self.batch[self.filled] = values
+        self.filled += 1
+        if self.filled == len(self.batch):
+            self.add_block(self.batch)
+            self.filled = 0
+
+    # -- Process any scans still waiting in the batch
+    def flush(self):
+
+        if self.filled:
+            self.add_block(self.batch[:self.filled])
+            self.filled = 0
+
+    # -- A (scans, channels) block of new samples
+    def add_block(self, block):
+
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.num_channels)
+        self.update_flatline(block)
+
+        # -- Split the block at window boundaries
+        start = 0
+        while start < len(block):
+            take = min(self.window - self.position, len(block) - start)
+            self.accumulate(block[start:start + take])
+            start += take
+            if self.position == self.window:
+                self.finish_window()
+
+    def accumulate(self, part):
+
+        self.sum += part.sum(axis=0)
+        self.sum_squares += np.einsum('ij,ij->j', part, part)
+        np.minimum(self.low, part.min(axis=0), out=self.low)
+        np.maximum(self.high, part.max(axis=0), out=self.high)
+        self.clipped += ((part <= self.clip_low) | (part >= self.clip_high)).sum(axis=0)
+
+        phase = slice(self.position, self.position + len(part))
+        for i in range(len(self.line_frequencies)):
+            self.re[i] += self.cos_tables[i][phase] @ part
+            self.im[i] -= self.sin_tables[i][phase] @ part
+
+        self.position += len(part)
+
+    def update_flatline(self, block):
+
+        if self.previous is None:
+            self.previous = block[0].copy()
+
+        changed = np.abs(np.diff(block, axis=0, prepend=self.previous[None, :])) > flat_tolerance
+        any_changed = changed.any(axis=0)
+
+        # -- Samples since the last change (the whole block added to the running count where nothing changed)
+        last_change = len(block) - 1 - np.argmax(changed[::-1], axis=0)
+        self.flat_count = np.where(any_changed, len(block) - 1 - last_change, self.flat_count + len(block))
+        self.previous = block[-1].copy()
+
+    def finish_window(self):
+
+        n = self.window
+        mean = self.sum / n
+        self.minimum = self.low.copy()
+        self.maximum = self.high.copy()
+        self.rms = np.sqrt(self.sum_squares / n)
+        self.clip_ratio = self.clipped / n
+
+        # -- Line power relative to the AC power (variance) of the window; one-sided DFT bin power is 2|X|^2/N^2
+        ac_power = np.maximum(self.sum_squares / n - mean ** 2, 1e-20)
+        line_power = 2 * (self.re ** 2 + self.im ** 2).sum(axis=0) / n ** 2
+        self.hum_ratio = np.minimum(line_power / ac_power, 1.0)
+
+        # -- Auto-scale limits: expand immediately to the window's range, otherwise relax 10% towards it
+        span = np.maximum(self.maximum - self.minimum, 1e-3)
+        target_low = self.minimum - 0.1 * span
+        target_high = self.maximum + 0.1 * span
+        if self.y_low is None:
+            self.y_low, self.y_high = target_low, target_high
+        else:
+            self.y_low = np.where(target_low < self.y_low, target_low, self.y_low + 0.1 * (target_low - self.y_low))
+            self.y_high = np.where(target_high > self.y_high, target_high, self.y_high + 0.1 * (target_high - self.y_high))
+
+        self.windows += 1
+
+        # -- Reset the accumulators
+        self.position = 0
+        self.sum[:] = 0
+        self.sum_squares[:] = 0
+        self.low[:] = np.inf
+        self.high[:] = -np.inf
+        self.clipped[:] = 0
+        self.re[:] = 0
+        self.im[:] = 0
+
+    # -- Seconds each channel has been flat
+    def flat_duration(self, ch):
+        return self.flat_count[ch] / self.rate
+
+    # -- 'OK', 'CLIPPING', 'FLAT', 'HUM' or 'WAITING' (before the first complete window)
+    def status(self, ch):
+
+        if self.flat_duration(ch) >= flat_seconds:
+            return 'FLAT'
+        if self.windows == 0:
+            return 'WAITING'
+        if self.clip_ratio[ch] >= clip_warning:
+            return 'CLIPPING'
+        if self.hum_ratio[ch] >= hum_warning:
+            return 'HUM'
+        return 'OK'
+
+    def statuses(self):
+        return [self.status(ch) for ch in range(self.num_channels)]
+
+    # -- One-line summary of a channel for plot labels and logs
+    def summary(self, ch):
+
+        return (self.names[ch] + ': ' + self.status(ch) + '  min ' + '{:.3f}'.format(self.minimum[ch]) + '  max ' + '{:.3f}'.format(self.maximum[ch])
+                + '  RMS ' + '{:.3f}'.format(self.rms[ch]) + '  clip ' + '{:.1%}'.format(self.clip_ratio[ch]) + '  hum ' + '{:.0%}'.format(self.hum_ratio[ch]))
+
+    # -- Auto-scaled (low, high) plot limits of a channel, None before the first complete window
+    def y_limits(self, ch):
+
+        if self.y_low is None:
+            return None
+        return (self.y_low[ch], self.y_high[ch])
+
+# -- Print channels whose status changed since the last call (for acquisition loops without a display)
+#    reported: list of the last printed status per channel, updated in place
+def report_changes(quality, reported):
+
+    for ch, status in enumerate(quality.statuses()):
+        if status != reported[ch] and status != 'WAITING':
+            if status == 'OK':
+                print('  ' + quality.names[ch] + ': signal OK\n')
+            else:
+                print('  WARNING: ' + quality.summary(ch) + '\n')
+            reported[ch] = status
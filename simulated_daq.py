@@ -0,0 +1,120 @@
+'''
+    Simulated DAQ board for the acquisition loop (live_scan.daq_read) without hardware
+    A channel map entry with 'simulated': true is recorded from a SimulatedDaq instead of the UL: it answers the same calls
+    (scaled_win_buf_alloc, a_in_scan, get_status, stop_background, win_buf_free) and stands in for the board's DaqDeviceInfo
+    A thread fills the scaled buffer at the scan rate with a slow sine per channel plus noise, a millisecond at a time
+    Unlike the UL driver, the filling thread shares the recording process's GIL, so loop timings are slightly pessimistic
+    The mcculw.enums members the loop uses are defined here too, so simulated boards run without the UL driver installed
+
+    Optional entry key:
+        stats        multiprocessing Queue receiving (source, scan start, scan rate, polls) when the board's buffer is freed, for benchmarks;
+                     polls are the (perf_counter time, whole scans reported) of every get_status call
+
+'''
+
+from ctypes import c_double, addressof
+from enum import IntEnum, IntFlag
+from threading import Thread
+import time
+import numpy as np
+
+try:
+    from ul_transfer import scan_view
+except ImportError:
+    from .ul_transfer import scan_view
+
+# -- Seconds between buffer updates of the filling thread
+fill_period = 0.001
+
+# -- Stand-ins for mcculw.enums (Status has the UL's values, so either compares equal; the others are only read by SimulatedDaq)
+class Status(IntEnum):
+    IDLE = 0
+    RUNNING = 1
+
+class FunctionType(IntEnum):
+    AIFUNCTION = 1
+
+class ScanOptions(IntFlag):
+    BACKGROUND = 1
+    CONTINUOUS = 2
+    SCALEDATA = 4
+
+class SimulatedDaq:
+    def __init__(self, board):
+
+        self.source = board['source']
+        self.stats = board.get('stats')
+
+        # -- DaqDeviceInfo / AiInfo stand-in
+        self.packet_size = 1
+        self.supported_ranges = [None]
+
+        self.buffer = None
+        self.thread = None
+        self.count = 0
+        self.num_chans = 1
+        self.rate = 0
+        self.start = None
+        self.running = False
+        self.polls = []
+
+    def get_ai_info(self):
+        return self
+
+    def scaled_win_buf_alloc(self, count):
+
+        self.buffer = (c_double * count)()
+        return addressof(self.buffer)
+
+    def a_in_scan(self, board_num, low_chan, high_chan, count, rate, ai_range, memhandle, options):
+
+        self.count = 0
+        self.num_chans = high_chan - low_chan + 1
+        self.rate = rate
+        self.start = time.perf_counter()
+        self.running = True
+        self.thread = Thread(target=self.fill, args=(self.num_chans, count, rate, memhandle), daemon=True)
+        self.thread.start()
+
+    def fill(self, num_chans, count, rate, memhandle):
+
+        view = scan_view(memhandle, count // num_chans, num_chans)
+        phase = np.arange(num_chans) * 0.7
+        start = self.start
+        scans = 0
+
+        while self.running:
+            due = int((time.perf_counter() - start) * rate)
+            if due > scans:
+                # -- Never more than one buffer per update (older scans would be overwritten anyway)
+                first = max(scans, due - len(view))
+                t = (first + np.arange(due - first)) / rate
+                values = np.sin(2 * np.pi * 1.2 * t[:, None] + phase) + 0.05 * np.random.randn(len(t), num_chans)
+
+                # -- Circular buffer: one slice, or two when the scans wrap around its end
+                index = first % len(view)
+                head = min(len(values), len(view) - index)
+                view[index:index + head] = values[:head]
+                view[:len(values) - head] = values[head:]
+
+                scans = due
+                self.count = scans * num_chans
+            time.sleep(fill_period)
+
+    def get_status(self, board_num, function_type):
+
+        count = self.count
+        self.polls.append((time.perf_counter(), count // self.num_chans))
+        return (Status.RUNNING if self.running else Status.IDLE), count, 0
+
+    def stop_background(self, board_num, function_type):
+
+        self.running = False
+        if self.thread != None:
+            self.thread.join()
+
+    def win_buf_free(self, memhandle):
+
+        self.buffer = None
+        if self.stats != None:
+            self.stats.put((self.source, self.start, self.rate, self.polls))
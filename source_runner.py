@@ -0,0 +1,92 @@
+'''
+    Where each acquisition source runs: its own process, a thread of the controlling process, or in-loop (the controlling thread)
+    Processes keep a source's polling loop clear of every other source (own interpreter and GIL) but cost a start-up of a second
+    or more; threads start at once and share queues without pickling; in-loop runs the source in the thread that waits for the
+    scan, for a single-board setup with nothing else to do meanwhile
+    At most one source of a scan runs in-loop (it occupies the controlling thread until the scan ends)
+    executor_benchmark.py measures start-up and copy latency of each choice on simulated boards, idle and with the controlling
+    process busy
+
+'''
+
+from multiprocessing import Process
+from threading import Thread
+import traceback
+
+run_modes = ('process', 'thread', 'inline')
+
+# -- Default for sources without a configured mode
+default_mode = 'process'
+
+# -- Runs target(*args, **kwargs) in the thread calling join()
+class InlineSource:
+    def __init__(self, target, args = (), kwargs = None):
+
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs if kwargs != None else {}
+
+    def start(self):
+        pass
+
+    def join(self, timeout = None):
+
+        # -- A failing source ends the scan as it would end its process or thread, not the controlling program
+        try:
+            self.target(*self.args, **self.kwargs)
+        except (Exception, SystemExit):
+            traceback.print_exc()
+
+# -- Process, Thread or InlineSource running target; .mode tells which
+def make_runner(mode, target, args = (), kwargs = None):
+
+    if mode == 'process':
+        runner = Process(target=target, args=args, kwargs=kwargs if kwargs != None else {})
+    elif mode == 'thread':
+        runner = Thread(target=target, args=args, kwargs=kwargs if kwargs != None else {}, daemon=True)
+    elif mode == 'inline':
+        runner = InlineSource(target, args, kwargs)
+    else:
+        raise ValueError('Unknown run mode: ' + str(mode) + ' (choose from ' + ', '.join(run_modes) + ').')
+
+    runner.mode = mode
+    return runner
+
+# -- {source: mode} for the sources of a scan: configured modes (e.g. a channel map's 'executor'), overridden by executors
+def source_modes(sources, configured = None, executors = None):
+
+    modes = {source: default_mode for source in sources}
+    for overrides in (configured, executors):
+        if overrides != None:
+            modes.update({source: mode for source, mode in overrides.items() if source in modes and mode != None})
+
+    unknown = [mode for mode in modes.values() if mode not in run_modes]
+    if unknown:
+        raise ValueError('Unknown run mode(s): ' + ', '.join(unknown) + ' (choose from ' + ', '.join(run_modes) + ').')
+    if list(modes.values()).count('inline') > 1:
+        raise ValueError('Only one source can run in-loop.')
+
+    return modes
+
+# -- Arm the start gate and wait for every started runner; returns the start instant (None if the start was aborted)
+#    An in-loop source records in this thread, so the gate is armed from a helper thread meanwhile
+def arm_and_join(gate, tag, runners):
+
+    inline = [runner for runner in runners if runner.mode == 'inline']
+
+    if not inline:
+        start_at = gate.arm(tag)
+    else:
+        armed = []
+        armer = Thread(target=lambda: armed.append(gate.arm(tag)), daemon=True)
+        armer.start()
+        for runner in inline:
+            runner.join()
+        armer.join()
+        start_at = armed[0]
+
+    for runner in runners:
+        if runner.mode != 'inline':
+            runner.join()
+
+    return start_at
@@ -0,0 +1,140 @@
+'''
+    Readiness handshake and common start instant for the recording processes
+    Each source reports ready once it can start at once (board configured and UL buffer allocated, or serial banner consumed)
+    When every source is ready the controlling process schedules a start instant a little in the future; each source sleeps
+    until just before it, spins on perf_counter for the last moment, starts, and reports the instant it actually started
+    The offsets from the scheduled instant (start skew between boards) are saved next to the recording
+    perf_counter is system-wide (QueryPerformanceCounter on Windows), so the instants compare across processes
+
+'''
+
+from multiprocessing import Queue
+import csv, queue, time
+
+lead_seconds = 0.1         # start instant scheduled this long after the last source is ready
+spin_seconds = 0.002       # final part of the wait spent polling perf_counter instead of sleeping
+ready_timeout = 30         # seconds to wait for every source to be ready before giving up
+
+class StartAborted(Exception):
+    pass
+
+# -- Sleep until just before t, then spin to it; returns the perf_counter reading at the start
+def wait_until(t):
+
+    remaining = t - time.perf_counter()
+    if remaining > spin_seconds:
+        time.sleep(remaining - spin_seconds)
+
+    now = time.perf_counter()
+    while now < t:
+        now = time.perf_counter()
+    return now
+
+# -- Shared by the controlling process and every recording process (pass it when the processes are created)
+#    Messages carry the scan's tag (its file name), so a gate can be reused by a session and stale messages are ignored
+class StartGate:
+    def __init__(self, sources):
+
+        self.sources = list(sources)
+        self.ready_queue = Queue()
+        self.start_queues = {source: Queue() for source in self.sources}
+        self.started_queue = Queue()
+
+    # -- Controlling process: wait for every source, then schedule the start; returns the start instant, or None if aborted
+    def arm(self, tag, timeout = ready_timeout):
+
+        pending = set(self.sources)
+        deadline = time.perf_counter() + timeout
+
+        while pending:
+            try:
+                item_tag, source, ok = self.ready_queue.get(timeout=max(deadline - time.perf_counter(), 0.01))
+            except queue.Empty:
+                print('  ERROR: ' + ', '.join(sorted(pending)) + ' NOT READY\n')
+                self.abort(tag)
+                return None
+
+            if item_tag != tag:
+                continue
+            if not ok:
+                self.abort(tag)
+                return None
+            pending.discard(source)
+
+        start_at = time.perf_counter() + lead_seconds
+        for source in self.sources:
+            self.start_queues[source].put((tag, start_at))
+        return start_at
+
+    # -- Release every waiting source without starting
+    def abort(self, tag):
+        for source in self.sources:
+            self.start_queues[source].put((tag, None))
+
+    # -- Controlling process, after the scan: {source: seconds the source started after the scheduled instant}
+    def offsets(self, tag, start_at, timeout = 5):
+
+        offsets = {}
+        deadline = time.perf_counter() + timeout
+
+        while len(offsets) < len(self.sources):
+            try:
+                item_tag, source, t = self.started_queue.get(timeout=max(deadline - time.perf_counter(), 0.01))
+            except queue.Empty:
+                break
+            if item_tag == tag:
+                offsets[source] = t - start_at
+
+        return offsets
+
+# -- Recording process side of a gate for one scan
+class ScanStart:
+    def __init__(self, gate, tag, source):
+
+        self.gate = gate
+        self.tag = tag
+        self.source = source
+
+    def ready(self):
+        self.gate.ready_queue.put((self.tag, self.source, True))
+
+    # -- The source cannot start (reported instead of ready, so the others are released at once)
+    def fail(self):
+        self.gate.ready_queue.put((self.tag, self.source, False))
+
+    # -- Block until the scheduled instant; raises StartAborted if the scan was called off
+    def wait(self):
+
+        while True:
+            tag, start_at = self.gate.start_queues[self.source].get()
+            if tag == self.tag:
+                break
+
+        if start_at == None:
+            raise StartAborted('start aborted')
+        return wait_until(start_at)
+
+    # -- perf_counter reading at which the source actually started acquiring
+    def started(self, t):
+        self.gate.started_queue.put((self.tag, self.source, t))
+
+# -- Start report file of a recording: '<name> -- Start .csv'
+def start_file_name(file_name):
+    return file_name + ' -- Start .csv'
+
+# -- Print and save the start offsets of a scan; returns the skew (latest minus earliest start, seconds)
+def save_start_report(file_name, offsets):
+
+    if not offsets:
+        return None
+
+    skew = max(offsets.values()) - min(offsets.values())
+    print('  Start skew between sources: ' + '{:.3f}'.format(skew * 1000) + ' ms\n')
+
+    with open(start_file_name(file_name), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Source', 'Start Offset (ms)'])
+        for source, offset in sorted(offsets.items()):
+            writer.writerow([source, '{:.3f}'.format(offset * 1000)])
+
+    return skew
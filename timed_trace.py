@@ -0,0 +1,64 @@
+'''
+    Fixed-capacity timestamped trace for plotting sources with different sample rates on one seconds axis
+    Samples are mirrored into a buffer twice the capacity long, so the latest window is always one contiguous view and needs no unrolling copy per frame
+    Times are stored in seconds from an origin shared by every trace of a plot, so a 1kHz ECG and a 100Hz flex sensor line up on the same axis
+
+'''
+
+import numpy as np
+
+class TimedTrace:
+    def __init__(self, capacity, origin):
+
+        self.capacity = capacity
+        self.origin = origin
+
+        # -- Preallocated (time, value) storage, written twice; NaN until filled so empty slots are not drawn
+        self.times = np.full(2 * capacity, np.nan)
+        self.values = np.full(2 * capacity, np.nan)
+
+        # -- Total samples ever added
+        self.count = 0
+
+    # -- Append samples with their perf_counter acquisition times (views are fine, nothing is kept)
+    def extend(self, times, values):
+
+        count = len(values)
+        if count == 0:
+            return
+        if count > self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+            self.count += count - self.capacity
+            count = self.capacity
+
+        # -- Up to the end of the ring, then the remainder from its start
+        start = self.count % self.capacity
+        first = min(count, self.capacity - start)
+        self.write(start, times[:first], values[:first])
+        if first < count:
+            self.write(0, times[first:], values[first:])
+
+        self.count += count
+
+    def write(self, index, times, values):
+
+        count = len(values)
+        for offset in (index, index + self.capacity):
+            np.subtract(times, self.origin, out=self.times[offset:offset + count])
+            self.values[offset:offset + count] = values
+
+    # -- (times, values) views of the last capacity samples, oldest first
+    def window(self):
+
+        start = self.count % self.capacity
+        return self.times[start:start + self.capacity], self.values[start:start + self.capacity]
+
+    # -- Time (s from origin) and value of the newest sample, NaN before the first one
+    @property
+    def latest_time(self):
+        return self.times[(self.count - 1) % self.capacity] if self.count else np.nan
+
+    @property
+    def latest_value(self):
+        return self.values[(self.count - 1) % self.capacity] if self.count else np.nan
@@ -0,0 +1,146 @@
+'''
+    Threshold- and event-triggered capture with a pre-trigger ring buffer
+    Each recording process keeps its most recent scans in a fixed ring instead of writing them to disk
+    When a trigger fires (a level crossing on the watched channel in any process, or fire() from code) every process commits
+    the scans from pre_seconds before to post_seconds after the trigger time to its own numbered event file
+    Trigger count and time live in shared memory, so a flex sensor trigger also captures the DAQ channels around the same instant
+
+'''
+
+from multiprocessing import Value
+import numpy as np
+
+# -- Shared trigger state for all recording processes: (number of triggers fired, time of the latest trigger in scan seconds)
+def trigger_state():
+    return (Value('i', 0), Value('d', 0.0))
+
+class TriggeredCapture:
+    def __init__(self, file_name, header, num_values, rate, pre_seconds, post_seconds, state = None,
+                 channel = None, level = 0.0, direction = 'rising', hysteresis = 0.0):
+
+        # -- Event files are named after the recording file: '<name> -- Event 001 .csv'
+        self.file_name = file_name
+        self.header = header
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+
+        # -- Pre-trigger ring, with half a second of extra room for the delay before other processes notice a trigger
+        self.capacity = int((pre_seconds + 0.5) * rate) + 1
+        self.ring_times = np.zeros(self.capacity)
+        self.ring_values = np.zeros((self.capacity, num_values))
+        self.count = 0
+
+        # -- Shared trigger state (count, time) and the count this capture has already handled
+        self.state = state if state != None else trigger_state()
+        self.seen = self.state[0].value
+
+        # -- Level trigger on one of this process's channels (None: follow triggers from other processes or fire() only)
+        self.channel = channel
+        self.level = level
+        self.direction = direction
+        self.hysteresis = hysteresis
+        self.armed = False
+
+        # -- Capture in progress
+        self.capture_file = None
+        self.capture_end = 0.0
+        self.events = 0
+
+    # -- Fire a trigger at scan time t (from this process, or from code holding the same state)
+    def fire(self, t):
+
+        count, trigger_time = self.state
+        with count.get_lock():
+            trigger_time.value = t
+            count.value += 1
+
+    # -- Level crossing on the watched channel, re-armed once the signal is back past the hysteresis band
+    def check_level(self, t, value):
+
+        if self.direction == 'rising':
+            crossed = value >= self.level
+            rearm = value < self.level - self.hysteresis
+        else:
+            crossed = value <= self.level
+            rearm = value > self.level + self.hysteresis
+
+        if self.armed and crossed:
+            self.armed = False
+            self.fire(t)
+        elif rearm:
+            self.armed = True
+
+    # -- Sink for the acquisition loop: chunk is (scan time, values) as written to the recording file
+    def put(self, chunk):
+
+        t, values = chunk
+
+        if self.channel != None and self.capture_file == None:
+            self.check_level(t, values[self.channel])
+
+        # -- A trigger fired since the last scan: open the event file with the pre-trigger scans
+        if self.capture_file == None and self.state[0].value != self.seen:
+            self.start_capture()
+
+        if self.capture_file != None:
+            self.write_row(t, values)
+            if t >= self.capture_end:
+                self.finish_capture()
+
+        # -- Every scan goes into the ring, during a capture too, so a trigger soon after an event still gets its pre-trigger scans
+        index = self.count % self.capacity
+        self.ring_times[index] = t
+        self.ring_values[index] = values
+        self.count += 1
+
+    def start_capture(self):
+
+        count, trigger_time = self.state
+        with count.get_lock():
+            self.seen = count.value
+            t = trigger_time.value
+
+        self.events += 1
+        self.capture_file = open(self.file_name.replace(' .csv', '') + ' -- Event ' + '{:03d}'.format(self.events) + ' .csv', 'w')
+        self.capture_file.write(self.header)
+        self.capture_end = t + self.post_seconds
+
+        # -- Ring contents from pre_seconds before the trigger, oldest first
+        stored = min(self.count, self.capacity)
+        for i in range(self.count - stored, self.count):
+            index = i % self.capacity
+            if self.ring_times[index] >= t - self.pre_seconds:
+                self.write_row(self.ring_times[index], self.ring_values[index])
+
+    def write_row(self, t, values):
+
+        self.capture_file.write(str(t) + ',')
+        for value in values:
+            self.capture_file.write(str(value) + ',')
+        self.capture_file.write(u'\n')
+
+    def finish_capture(self):
+
+        self.capture_file.close()
+        self.capture_file = None
+        print('  Triggered capture: event ' + str(self.events) + ' saved (' + self.file_name + ').\n')
+
+        # -- Triggers that fired during the capture are already covered by it
+        self.seen = self.state[0].value
+
+    # -- Close an event cut short by the end of the recording
+    def close(self):
+        if self.capture_file != None:
+            self.finish_capture()
+
+# -- TriggeredCapture for one recording process from a trigger description shared by all processes:
+#    {'source': 'six' | 'two' | 'flex', 'channel': index in that source's scan, 'level': value, 'direction': 'rising' | 'falling',
+#     'hysteresis': value, 'pre': seconds, 'post': seconds, 'state': trigger_state()}
+#    Only the source named in the description watches its channel; the others follow its triggers
+def from_trigger(trigger, source, file_name, header, num_values, rate):
+
+    if trigger['source'] == source:
+        return TriggeredCapture(file_name, header, num_values, rate, trigger['pre'], trigger['post'], trigger['state'],
+                                trigger['channel'], trigger['level'], trigger.get('direction', 'rising'), trigger.get('hysteresis', 0.0))
+
+    return TriggeredCapture(file_name, header, num_values, rate, trigger['pre'], trigger['post'], trigger['state'])
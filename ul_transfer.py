@@ -0,0 +1,40 @@
+'''
+    NumPy view of a scaled UL transfer buffer
+    The buffer allocated by ul.scaled_win_buf_alloc is viewed in place as a (scans, channels) array through np.ctypeslib,
+    without a ul.scaled_win_buf_to_array call or Python access per value
+    Each poll copies every whole scan acquired since the last one into a preallocated staging array: one slice, or two when
+    the scans wrap around the end of the UL buffer. Writers and consumers then work on the staged block as an array
+
+'''
+
+from ctypes import cast, POINTER, c_double
+import numpy as np
+
+# -- (scans, channels) array sharing memory with the UL buffer: no copy, valid until the buffer is freed
+def scan_view(memhandle, points_per_channel, num_chans):
+
+    values = np.ctypeslib.as_array(cast(memhandle, POINTER(c_double)), shape=(points_per_channel * num_chans,))
+    return values.reshape(points_per_channel, num_chans)
+
+class ScanTransfer:
+    def __init__(self, memhandle, points_per_channel, num_chans, max_scans):
+
+        self.buffer = scan_view(memhandle, points_per_channel, num_chans)
+        self.points_per_channel = points_per_channel
+
+        # -- Most scans copied by one read (the staging array is reused by every read)
+        self.max_scans = max(1, min(max_scans, points_per_channel))
+        self.staging = np.empty((self.max_scans, num_chans))
+
+    # -- Copy count scans, starting at scan number first_scan since the start of the scan, into the staging array
+    #    Returns a view of the staged scans; it is overwritten by the next read, so consumers copy what they keep
+    def read(self, first_scan, count):
+
+        index = first_scan % self.points_per_channel
+        head = min(count, self.points_per_channel - index)
+
+        self.staging[:head] = self.buffer[index:index + head]
+        # -- Wrapped around the end of the UL buffer
+        self.staging[head:count] = self.buffer[:count - head]
+
+        return self.staging[:count]